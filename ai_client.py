@@ -0,0 +1,178 @@
+import sys
+import time
+import random
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional, TypeVar
+
+import httpx
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger("magazin_sumok_bot")
+
+T = TypeVar("T")
+
+# -----------------------------
+# КЛИЕНТ С ЯВНЫМ ПУЛОМ СОЕДИНЕНИЙ
+# -----------------------------
+def make_openai_client(
+    api_key: str,
+    timeout: float,
+    connect_timeout: float = 5.0,
+    max_connections: int = 16,
+    max_keepalive: int = 8,
+) -> "AsyncOpenAI":
+    """
+    AsyncOpenAI поверх собственного httpx.AsyncClient: размер пула и таймауты
+    заданы явно, повторы SDK выключены — повторяем сами (call_with_retries).
+    SDK импортируется здесь, а не при import модуля: это ~0.3 с холодного старта.
+    """
+    from openai import AsyncOpenAI
+
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+        # pool — сколько ждать свободного соединения из пула
+        timeout=httpx.Timeout(timeout, connect=connect_timeout, pool=connect_timeout),
+    )
+    return AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+# -----------------------------
+# CIRCUIT BREAKER
+# -----------------------------
+class CircuitOpenError(Exception):
+    """Запрос не отправлен: провайдер недавно подряд отвечал ошибками."""
+
+class CircuitBreaker:
+    """
+    closed — запросы идут; failure_threshold ошибок подряд -> open.
+    open — запросы сразу отклоняются reset_timeout секунд, затем half-open:
+    пропускается один пробный запрос; успех закрывает, ошибка снова открывает.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        """Открыт и время пробного запроса ещё не пришло (не занимает пробу)."""
+        return self.opened_at is not None and time.monotonic() - self.opened_at < self.reset_timeout
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "open" if self.is_open else "half-open"
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self.is_open or self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("OpenAI снова отвечает — circuit breaker закрыт")
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def release(self) -> None:
+        """Пробный запрос отменён, не дойдя до ответа: следующий снова может быть пробным."""
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._trial_in_flight or (self.opened_at is None and self.failures >= self.failure_threshold):
+            logger.warning("OpenAI: %s ошибок подряд — circuit breaker открыт на %s с", self.failures, self.reset_timeout)
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+# -----------------------------
+# ПОВТОРЫ С BACKOFF И JITTER
+# -----------------------------
+def is_retryable(exc: BaseException) -> bool:
+    """429, 5xx, обрывы соединения и таймауты — временные; остальные 4xx — нет."""
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    # SDK ещё не импортирован — значит, и его исключений быть не может
+    openai = sys.modules.get("openai")
+    if openai is None:
+        return False
+    if isinstance(exc, openai.APIConnectionError):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return False
+
+def is_provider_error(exc: BaseException) -> bool:
+    """Ответ провайдера с кодом ошибки (APIStatusError) — значит, OpenAI жив."""
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(exc, openai.APIStatusError)
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+async def call_with_retries(
+    attempt: Callable[[], Awaitable[T]],
+    breaker: Optional[CircuitBreaker] = None,
+    retries: int = 2,
+    base_delay: float = 0.5,
+    max_delay: float = 8.0,
+    on_retry: Optional[Callable[[BaseException], None]] = None,
+) -> T:
+    """
+    Вызывает attempt() до 1 + retries раз. Пауза между попытками — full jitter:
+    random(0, min(max_delay, base_delay * 2**n)), но не меньше Retry-After от 429.
+    Ошибки, после которых повтор бессмыслен (400, 401…), пробрасываются сразу;
+    для breaker это ответ живого провайдера, а не сбой. Прочие исключения
+    (наш разбор ответа, TypeError…) о провайдере ничего не говорят: breaker
+    только освобождает пробу, не закрываясь.
+    """
+    for n in range(retries + 1):
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError("OpenAI временно недоступен")
+        try:
+            result = await attempt()
+        except asyncio.CancelledError:
+            if breaker is not None:
+                breaker.release()
+            raise
+        except Exception as e:
+            if not is_retryable(e):
+                if breaker is not None:
+                    if is_provider_error(e):
+                        # провайдер ответил — пробный запрос half-open засчитываем как живой
+                        breaker.record_success()
+                    else:
+                        breaker.release()
+                raise
+            if breaker is not None:
+                breaker.record_failure()
+            if n == retries:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** n))
+            hint = retry_after(e)
+            if hint is not None:
+                delay = max(delay, min(hint, max_delay))
+            if on_retry is not None:
+                on_retry(e)
+            logger.warning("OpenAI: %s, повтор через %.2f с (%s/%s)", type(e).__name__, delay, n + 1, retries)
+            await asyncio.sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
+    raise AssertionError("unreachable")
@@ -0,0 +1 @@
+"""Локальные бенчмарки и нагрузочные тесты бота (без живых Telegram/OpenAI)."""
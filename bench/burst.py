@@ -0,0 +1,112 @@
+"""
+Всплеск запросов к ИИ: каждый из --users пользователей быстро шлёт
+--messages вопросов консультанту подряд, а --forwards человек одновременно
+пересылают одно и то же фото. Сравнивает прогон без защиты (каждое
+сообщение — свой запрос, каждое фото — своё распознавание) и с лимитами,
+склейкой сообщений и общим распознаванием одинаковых фото.
+
+Запуск:
+    python -m bench.burst --users 50 --messages 5 --forwards 40
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Hashable
+
+from bench import fakes
+
+class NoFlight:
+    """Без SingleFlight: каждый вызов выполняется сам."""
+
+    def __contains__(self, key: Hashable) -> bool:
+        return False
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        return await factory()
+
+async def run_mode(mode: str, args) -> None:
+    import bot
+    import metrics
+    from ratelimit import RateLimiter, SingleFlight, Coalescer
+    from vision_cache import VisionCache
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder
+
+    protected = mode == "protected"
+    bot.AI_COALESCE = protected
+    bot.photo_flights = SingleFlight() if protected else NoFlight()
+    bot.consultant_coalescer = Coalescer()
+    bot.ai_limiter = (
+        RateLimiter(bot.AI_USER_RATE_PER_MIN / 60, bot.AI_USER_BURST, bot.AI_GLOBAL_RATE_PER_SEC, bot.AI_GLOBAL_BURST)
+        if protected
+        else RateLimiter(0, 1)
+    )
+    # свой пустой кэш распознаваний: иначе второй режим получил бы фото из кэша первого
+    bot.vision_cache = VisionCache(os.path.join(args.state_dir, f"vision_cache_{mode}.json"))
+
+    ids = [it["id"] for it in bot.load_catalog().items] or ["NONE"]
+
+    def answer(kwargs):
+        if kwargs.get("response_format"):
+            return '{"match_id": "%s", "confidence": 0.95, "reason": "bench"}' % ids[0]
+        return "Под синее платье подойдёт светлая сумка через плечо."
+
+    bot.client = fakes.FakeAsyncOpenAI(fakes.latency(args.ai_latency, seed=1), answer)
+    tg = fakes.FakeTelegramRequest(latency=fakes.constant(0.02))
+    app = bot.build_application(
+        ApplicationBuilder().token("123456:BENCH").request(tg).get_updates_request(fakes.FakeTelegramRequest())
+    )
+    limited0 = {k: metrics.AI_RATE_LIMITED.value(kind=k) for k in ("consultant", "vision")}
+    coalesced0 = {k: metrics.AI_COALESCED.value(kind=k) for k in ("consultant", "vision")}
+
+    update_id = 0
+    async with app:
+        await app.start()
+        t0 = time.perf_counter()
+        for m in range(args.messages):
+            for u in range(args.users):
+                update_id += 1
+                # без цены/доставки/заказа в тексте: иначе ответит локальный роутер, а не консультант
+                payload = fakes.text_update(update_id, 80_000 + u, f"вопрос {m + 1}: посоветуйте сумку под синее платье")
+                await app.update_queue.put(Update.de_json(payload, app.bot))
+            await asyncio.sleep(args.gap)
+        for u in range(args.forwards):
+            update_id += 1
+            payload = fakes.photo_update(update_id, 85_000 + u, f"fwd{u}", "same-photo")
+            await app.update_queue.put(Update.de_json(payload, app.bot))
+        while app.update_queue.qsize():
+            await asyncio.sleep(0.02)
+        # stop() дожидается и фоновых ответов консультанта
+        await app.stop()
+        elapsed = time.perf_counter() - t0
+
+    limited = {k: metrics.AI_RATE_LIMITED.value(kind=k) - v for k, v in limited0.items()}
+    coalesced = {k: metrics.AI_COALESCED.value(kind=k) - v for k, v in coalesced0.items()}
+    print(f"[{mode}] {update_id} updates in {elapsed:.2f}s, openai calls: {bot.client.chat.completions.calls}")
+    print(f"  rate limited: {limited}  coalesced/shared: {coalesced}")
+    print(f"  telegram: {dict(tg.calls)}")
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--users", type=int, default=50)
+    p.add_argument("--messages", type=int, default=5, help="сообщений подряд от каждого пользователя")
+    p.add_argument("--gap", type=float, default=0.3, help="пауза между волнами сообщений, сек")
+    p.add_argument("--forwards", type=int, default=40, help="сколько человек шлют одно и то же фото")
+    p.add_argument("--ai-latency", default="lognormal:0.8,0.3")
+    p.add_argument("--modes", default="unprotected,protected")
+    args = p.parse_args()
+
+    args.state_dir = tempfile.mkdtemp(prefix="bench_burst_")
+    fakes.isolate_state(args.state_dir)
+    os.environ.setdefault("BOT_CONCURRENT_UPDATES", "64")
+
+    async def run_all() -> None:
+        for mode in args.modes.split(","):
+            await run_mode(mode.strip(), args)
+
+    asyncio.run(run_all())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Карточки товаров с фото и каталог по страницам.
+
+1) Страница каталога: сборка заново на каждый показ против кэша на снимке.
+2) Карточка через настоящий хендлер кнопки каталога: текст, фото по
+   сохранённому file_id, альбом из нескольких file_id — и для сравнения
+   повторная загрузка того же фото байтами. Считает вызовы и байты,
+   которые бот отправляет в Telegram.
+
+Запуск:
+    python -m bench.cards --items 2000 --photo-side 1280
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from bench import fakes
+from bench.catalog_writes import make_catalog
+from bench.stats import format_us
+
+def add_photos(path: str) -> None:
+    # Item0 — без фото, Item1 — одно, Item2 — три (альбом)
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    data["items"][1]["photo_file_ids"] = ["AgACAgIAAxkBAAIBfile1"]
+    data["items"][2]["photo_file_ids"] = [f"AgACAgIAAxkBAAIBfile2_{n}" for n in range(3)]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+def bench_pages(bot, rounds: int) -> None:
+    cat = bot.load_catalog()
+    pages = (len(cat.items) + bot.CATALOG_PAGE_SIZE - 1) // bot.CATALOG_PAGE_SIZE
+    for label, render in (("render", bot.render_catalog_page), ("cached", bot.catalog_page)):
+        timings = []
+        for _ in range(rounds):
+            for page in range(min(pages, 50)):
+                t0 = time.perf_counter()
+                render(cat, page)
+                timings.append(time.perf_counter() - t0)
+        print(format_us(f"catalog page {label}", timings))
+
+async def bench_cards(bot, args) -> None:
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder
+
+    tg = fakes.FakeTelegramRequest(latency=fakes.constant(0.0))
+    app = bot.build_application(
+        ApplicationBuilder().token("123456:BENCH").request(tg).get_updates_request(fakes.FakeTelegramRequest())
+    )
+    photo = fakes.sample_jpeg((args.photo_side, args.photo_side * 3 // 4))
+    async with app:
+        await app.start()
+        update_id = 0
+        for label, item_id in (("text card", "Item0"), ("file_id photo", "Item1"), ("file_id album x3", "Item2")):
+            tg.calls.clear()
+            tg.sent_bytes.clear()
+            for _ in range(args.cards):
+                update_id += 1
+                payload = fakes.callback_update(update_id, 90_000, f"cat_item:{item_id}")
+                await app.update_queue.put(Update.de_json(payload, app.bot))
+            while app.update_queue.qsize():
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.1)
+            sends = {k: v for k, v in tg.calls.items() if k != "answerCallbackQuery"}
+            sent = sum(v for k, v in tg.sent_bytes.items() if k != "answerCallbackQuery")
+            print(f"{label:18} {sends}  {sent / args.cards:10.0f} bytes/card")
+
+        tg.calls.clear()
+        tg.sent_bytes.clear()
+        for _ in range(args.cards):
+            await app.bot.send_photo(90_000, photo, caption="re-upload")
+        print(f"{'re-upload photo':18} {dict(tg.calls)}  {sum(tg.sent_bytes.values()) / args.cards:10.0f} bytes/card")
+        await app.stop()
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--items", type=int, default=2000)
+    p.add_argument("--rounds", type=int, default=20)
+    p.add_argument("--cards", type=int, default=50)
+    p.add_argument("--photo-side", type=int, default=1280)
+    args = p.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench_cards_")
+    catalog = os.path.join(directory, "catalog.json")
+    make_catalog(catalog, args.items)
+    add_photos(catalog)
+    fakes.isolate_state(directory)
+    import bot
+
+    bench_pages(bot, args.rounds)
+    asyncio.run(bench_cards(bot, args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Загрузка сезонной коллекции админом: --items товаров командами /add по одной
+против одного /import с CSV, плюс zip с --photos фото (имя файла = id товара).
+Считает время, число правок каталога (каждая — запись файла или транзакция
+и новый снимок с индексами) и сверяет итоговый каталог.
+
+Запуск:
+    python -m bench.catalog_import --items 300 --photos 60
+    CATALOG_BACKEND=sqlite python -m bench.catalog_import --items 300
+"""
+import argparse
+import asyncio
+import csv
+import io
+import os
+import tempfile
+import time
+import zipfile
+
+from bench import fakes
+
+ADMIN_ID = 4242
+
+def make_csv(n: int) -> bytes:
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=";")
+    writer.writerow(["id", "name", "price_kzt", "colors", "keywords", "description"])
+    for i in range(n):
+        writer.writerow([f"Season{i}", f"Season {i}", 40000 + i, "чёрный,бежевый", f"season{i},сумка", "Новая коллекция"])
+    # пара заведомо плохих строк — должны попасть в отклонённые
+    writer.writerow(["Season0", "Дубль", 1, "", "", ""])
+    writer.writerow(["BadPrice", "Без цены", "дорого", "", "", ""])
+    return buf.getvalue().encode("cp1251")
+
+def make_zip(n: int) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as archive:
+        for i in range(n):
+            color = (40 + (i * 37) % 200, 60 + (i * 53) % 180, 80 + (i * 11) % 160)
+            archive.writestr(f"Season{i % max(1, n // 2)}_{i}.jpg", fakes.sample_jpeg((320, 240), color))
+        archive.writestr("readme.txt", "не фото")
+    return buf.getvalue()
+
+async def run_mode(mode: str, args) -> None:
+    import bot
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder
+
+    prefix = "Add" if mode == "add" else "Season"
+    files = {"csv": make_csv(args.items), "zip": make_zip(args.photos)}
+    tg = fakes.FakeTelegramRequest(latency=fakes.constant(args.tg_latency), files=files)
+    app = bot.build_application(
+        ApplicationBuilder().token("123456:BENCH").request(tg).get_updates_request(fakes.FakeTelegramRequest())
+    )
+    # каждая правка каталога — новый снимок (и индексы), а без склейки — полная запись файла / транзакция
+    counted = "_commit" if hasattr(bot.catalog_store, "_commit") else "update"
+    store_update = getattr(bot.catalog_store, counted)
+    updates_count = 0
+
+    def counting_update(mutate):
+        nonlocal updates_count
+        updates_count += 1
+        return store_update(mutate)
+
+    setattr(bot.catalog_store, counted, counting_update)
+    index_before = len(bot.photo_index)
+
+    updates = []
+    if mode == "add":
+        for i in range(args.items):
+            updates.append(fakes.text_update(
+                i + 1, ADMIN_ID, f"/add Add{i}|Add {i}|{40000 + i}|чёрный,бежевый|add{i},сумка|Новая коллекция"
+            ))
+    else:
+        updates.append(fakes.document_update(1, ADMIN_ID, "csv", "season.csv", len(files["csv"]), caption="/import"))
+        updates.append(fakes.document_update(2, ADMIN_ID, "zip", "photos.zip", len(files["zip"]), caption="/import"))
+
+    async with app:
+        await app.start()
+        t0 = time.perf_counter()
+        for payload in updates:
+            await app.update_queue.put(Update.de_json(payload, app.bot))
+        while app.update_queue.qsize():
+            await asyncio.sleep(0.01)
+        await app.stop()
+        await bot.json_writer.flush()
+        elapsed = time.perf_counter() - t0
+
+    delattr(bot.catalog_store, counted)
+    season = [it for it in bot.load_catalog().items if str(it.get("id", "")).startswith(prefix)]
+    photos = sum(len(it.get("photo_file_ids") or ()) for it in season)
+    print(f"[{mode}] {len(updates)} updates in {elapsed:.2f}s, items: {len(season)}, photos bound: {photos}")
+    print(f"  catalog updates: {updates_count}, photo index: +{len(bot.photo_index) - index_before}")
+    print(f"  telegram: {dict(tg.calls)}")
+    if mode == "import":
+        for text in tg.replies.get(ADMIN_ID, []):
+            if text == "sendMediaGroup":
+                continue
+            print("  > " + text.replace("\n", "\n    "))
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--items", type=int, default=300)
+    p.add_argument("--photos", type=int, default=60)
+    p.add_argument("--tg-latency", type=float, default=0.03, help="задержка ответа Telegram, сек")
+    p.add_argument("--modes", default="add,import")
+    args = p.parse_args()
+
+    fakes.isolate_state(tempfile.mkdtemp(prefix="bench_import_"))
+    os.environ["ADMIN_IDS"] = str(ADMIN_ID)
+    # сообщения одного чата обрабатываются по очереди: zip — после CSV
+    os.environ.setdefault("BOT_CONCURRENT_UPDATES", "8")
+
+    async def run_all() -> None:
+        for mode in args.modes.split(","):
+            await run_mode(mode.strip(), args)
+
+    asyncio.run(run_all())
+
+if __name__ == "__main__":
+    main()
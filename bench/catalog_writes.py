@@ -0,0 +1,103 @@
+"""
+Бенчмарк записи каталога: админ подряд привязывает много фото (/bind).
+Сравнивает атомарную запись JSON на каждую правку, отложенную склейку
+через JsonWriter и SQLite-каталог (пишутся только строки товара),
+плюс поиск: BM25 в памяти против FTS5.
+
+Запуск:
+    python -m bench.catalog_writes --items 2000 --binds 50
+    python -m bench.catalog_writes --items 20000 --binds 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from catalog_sqlite import SqliteCatalogStore
+from catalog_store import CatalogStore
+from storage import JsonWriter
+from bench.stats import format_us
+
+def make_catalog(path: str, n: int) -> None:
+    items = [
+        {
+            "id": f"Item{i}",
+            "name": f"Item {i}",
+            "price_kzt": 30000 + i,
+            "colors": ["чёрный", "бежевый"],
+            "description": "Сумка для бенчмарка.",
+            "keywords": [f"item{i}", "сумка"],
+            "photo_file_ids": [],
+        }
+        for i in range(n)
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"items": items}, f, ensure_ascii=False, indent=2)
+
+async def run(store, binds: int, pause: float) -> float:
+    t0 = time.perf_counter()
+    for i in range(binds):
+        store.update_item(f"Item{i}", lambda item, fid=f"file_{i}": item.setdefault("photo_file_ids", []).append(fid))
+        await asyncio.sleep(pause)
+    if store.writer is not None:
+        await store.writer.flush()
+    return time.perf_counter() - t0
+
+def check(path: str, binds: int) -> bool:
+    if path.endswith(".sqlite3"):
+        items = SqliteCatalogStore(path, check_interval=0).snapshot().items
+    else:
+        with open(path, encoding="utf-8") as f:
+            items = json.load(f)["items"]
+    return all(list(items[i]["photo_file_ids"]) == [f"file_{i}"] for i in range(binds))
+
+def search(store, queries, rounds: int = 20):
+    cat = store.snapshot()
+    timings = []
+    for _ in range(rounds):
+        for q in queries:
+            t0 = time.perf_counter()
+            if isinstance(store, SqliteCatalogStore):
+                store.search(q, 12)
+            else:
+                cat.index.bm25.search(q, 12)
+            timings.append(time.perf_counter() - t0)
+    return timings
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--items", type=int, default=2000)
+    p.add_argument("--binds", type=int, default=50)
+    p.add_argument("--pause", type=float, default=0.0, help="пауза между правками, сек")
+    p.add_argument("--delay", type=float, default=0.5, help="окно склейки JsonWriter, сек")
+    args = p.parse_args()
+
+    queries = ["хочу чёрную сумку", "item 1234", "сумка для бенчмарка бежевый", "что-то без совпадений"]
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "catalog.json")
+        make_catalog(source, args.items)
+        for label, writer in (("sync", None), ("coalesced", JsonWriter(delay=args.delay)), ("sqlite", None)):
+            if label == "sqlite":
+                path = os.path.join(tmp, "catalog.sqlite3")
+                store = SqliteCatalogStore(path, check_interval=0)
+                t0 = time.perf_counter()
+                store.import_json(source)
+                print(f"   import: {args.items} items in {time.perf_counter() - t0:.3f}s")
+            else:
+                path = os.path.join(tmp, f"catalog_{label}.json")
+                make_catalog(path, args.items)
+                store = CatalogStore(path, check_interval=0, writer=writer)
+            store.snapshot()
+            elapsed = asyncio.run(run(store, args.binds, args.pause))
+            writes = writer.writes if writer else args.binds
+            print(
+                f"{label:>9}: {args.binds} binds in {elapsed:.3f}s "
+                f"({args.binds / elapsed:.0f} binds/s), writes={writes}, ok={check(path, args.binds)}"
+            )
+            if label != "coalesced":
+                print("           " + format_us("search" if label == "sqlite" else "search (bm25)", search(store, queries)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Бенчмарк параллельной обработки: сотни чатов одновременно шлют фото,
+спрашивают цену и оформляют заказ. Настоящие хендлеры и ConversationHandler,
+фейковые Telegram и OpenAI. Сравнивает режимы:
+
+    sequential — BOT_CONCURRENT_UPDATES=1 (как раньше)
+    concurrent — параллельно без порядка внутри чата (BOT_PER_CHAT_ORDER=0)
+    ordered    — параллельно, апдейты одного чата строго по очереди
+
+Запуск:
+    python -m bench.chat_mix --chats 100 --workers 64
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from bench import fakes
+from bench.stats import format_ms
+
+SCRIPT = [
+    ("photo", None),
+    ("text", "цена"),
+    ("text", "Ariana Classic"),
+    ("text", "доставка в Алматы?"),
+    ("text", "/order"),
+    ("text", "Имя {chat}"),
+    ("text", "+7 777 {chat}"),
+    ("text", "Алматы"),
+    ("text", "Абая 1"),
+    ("text", "чёрная, {chat}"),
+]
+
+def timeline(chats: int, spread: float, gap: float, seed: int = 1) -> List[Tuple[float, Dict]]:
+    rnd = random.Random(seed)
+    events = []
+    update_id = 0
+    for c in range(chats):
+        chat_id = 50_000 + c
+        t = rnd.uniform(0, spread)
+        for kind, text in SCRIPT:
+            update_id += 1
+            if kind == "photo":
+                update = fakes.photo_update(update_id, chat_id, f"photo{rnd.randint(1, 20)}-{c}")
+            else:
+                update = fakes.text_update(update_id, chat_id, text.format(chat=chat_id))
+            events.append((t, update))
+            t += rnd.uniform(0, gap)
+    events.sort(key=lambda e: e[0])
+    return events
+
+async def run_mode(mode: str, args) -> None:
+    import bot
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder, TypeHandler
+
+    bot.BOT_CONCURRENT_UPDATES = 1 if mode == "sequential" else args.workers
+    bot.BOT_PER_CHAT_ORDER = mode == "ordered"
+    bot.vision_cache.clear()
+
+    rnd = random.Random(3)
+    items = bot.load_catalog().items
+    match_id = items[0]["id"] if items else "NONE"
+    bot.client = fakes.FakeAsyncOpenAI(
+        lambda: max(0.05, rnd.gauss(args.ai_latency, args.ai_latency / 3)),
+        lambda kwargs: json.dumps({"match_id": match_id, "confidence": 0.9, "reason": "bench"})
+        if kwargs.get("response_format") else "Доставка по Алматы 1–2 дня.",
+    )
+
+    tg = fakes.FakeTelegramRequest(latency=lambda: max(0.0, rnd.gauss(args.tg_latency, args.tg_latency / 3)))
+    app = bot.build_application(
+        ApplicationBuilder().token("123456:BENCH").request(tg).get_updates_request(fakes.FakeTelegramRequest())
+    )
+
+    queued_at: Dict[int, float] = {}
+    latencies: List[float] = []
+
+    async def done(update: Update, context) -> None:
+        latencies.append(time.perf_counter() - queued_at[update.update_id])
+
+    app.add_handler(TypeHandler(Update, done), group=1)
+
+    orders_before = len(bot.order_journal.read_all())
+    events = timeline(args.chats, args.spread, args.gap)
+    async with app:
+        await app.start()
+        t0 = time.perf_counter()
+        for at, payload in events:
+            delay = t0 + at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            update = Update.de_json(payload, app.bot)
+            queued_at[update.update_id] = time.perf_counter()
+            await app.update_queue.put(update)
+        while len(latencies) < len(events):
+            await asyncio.sleep(0.02)
+        elapsed = time.perf_counter() - t0
+        await app.stop()
+
+    bot.order_journal.sync()
+    orders = bot.order_journal.read_all()[orders_before:]
+    good_orders = sum(
+        1 for o in orders
+        if o.get("name") == f"Имя {o.get('user_id')}" and o.get("comment") == f"чёрная, {o.get('user_id')}"
+    )
+    priced = sum(1 for replies in tg.replies.values() if any(r.startswith("✅ Модель") for r in replies[1:]))
+
+    print(f"[{mode}] updates={len(events)} chats={args.chats} in {elapsed:.2f}s ({len(events) / elapsed:.0f} updates/s)")
+    print("  " + format_ms("update latency", latencies))
+    print(f"  correct checkouts: {good_orders}/{args.chats}, price cards: {priced}/{args.chats}")
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--chats", type=int, default=100)
+    p.add_argument("--workers", type=int, default=64, help="BOT_CONCURRENT_UPDATES для параллельных режимов")
+    p.add_argument("--spread", type=float, default=2.0, help="за сколько секунд стартуют все чаты")
+    p.add_argument("--gap", type=float, default=0.05, help="макс. пауза между сообщениями одного чата, сек")
+    p.add_argument("--ai-latency", type=float, default=0.8)
+    p.add_argument("--tg-latency", type=float, default=0.03)
+    p.add_argument("--modes", default="sequential,concurrent,ordered")
+    args = p.parse_args()
+
+    fakes.isolate_state(tempfile.mkdtemp(prefix="bench_chat_mix_"))
+
+    async def run_all() -> None:
+        # один event loop на все режимы: семафоры бота привязываются к циклу
+        for mode in args.modes.split(","):
+            await run_mode(mode.strip(), args)
+
+    asyncio.run(run_all())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Регрессионные проверки для мест, где уже были ошибки: маленькие чистые
+сценарии без Telegram и OpenAI, каждый — функция check_*, падающая на assert.
+
+Запуск:
+    python -m bench.checks            # все
+    python -m bench.checks persistence  # только с этим словом в имени
+"""
+import asyncio
+import sys
+import traceback
+
+def check_persistence_flush_during_write() -> None:
+    # flush() при остановке, пока отложенная запись уже в backend: пачка не теряется
+    from persistence import KVPersistence
+
+    class SlowBackend:
+        def __init__(self) -> None:
+            self.data = {}
+
+        async def write(self, batch) -> None:
+            await asyncio.sleep(0.1)
+            self.data.update(batch)
+
+        async def close(self) -> None:
+            pass
+
+    async def run() -> None:
+        backend = SlowBackend()
+        persistence = KVPersistence(backend, flush_delay=0.01)
+        await persistence.update_user_data(1, {"mode": "order"})
+        await asyncio.sleep(0.05)
+        await persistence.update_user_data(2, {"mode": "bind"})
+        await persistence.flush()
+        assert set(backend.data) == {("user_data", "1"), ("user_data", "2")}, backend.data
+
+    asyncio.run(run())
+
+def check_breaker_local_error_keeps_half_open() -> None:
+    # пробный запрос half-open упал на нашей стороне (ValueError) — breaker не закрывается
+    from ai_client import CircuitBreaker, call_with_retries
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.opened_at is not None
+
+    async def broken_parse() -> None:
+        raise ValueError("bad chunk")
+
+    try:
+        asyncio.run(call_with_retries(broken_parse, breaker, retries=0))
+    except ValueError:
+        pass
+    assert breaker.opened_at is not None, "локальная ошибка закрыла breaker"
+    assert breaker.allow(), "проба должна освободиться"
+
+def check_cluster_reuses_main_bot_module() -> None:
+    # «python bot.py»: бот — это __main__, cluster не должен загружать вторую копию через import bot
+    import types
+    import cluster
+
+    fake = types.ModuleType("__main__")
+    fake.build_application = lambda builder=None: None
+    saved = sys.modules["__main__"]
+    sys.modules["__main__"] = fake
+    try:
+        assert cluster._bot_module() is fake
+    finally:
+        sys.modules["__main__"] = saved
+
+def check_sqlite_insert_keeps_order() -> None:
+    # товар, вставленный в середину, остаётся на своём месте и после перечитывания базы
+    import os
+    import tempfile
+    from catalog_sqlite import SqliteCatalogStore
+
+    path = os.path.join(tempfile.mkdtemp(prefix="check_sqlite_"), "catalog.sqlite3")
+    store = SqliteCatalogStore(path, check_interval=0)
+    store.replace({"items": [{"id": i, "name": i, "variants": [{"color": "red"}]} for i in ("A", "B", "C")]})
+
+    def insert(raw) -> None:
+        raw["items"].insert(1, {"id": "X", "name": "X"})
+        # вложенные значения приходят изменяемыми, а не MappingProxyType/tuple
+        raw["items"][0]["variants"][0]["color"] = "black"
+        raw["items"][0]["variants"].append({"color": "white"})
+
+    store.update(insert)
+    store.add_item({"id": "D", "name": "D"})
+    in_memory = [it["id"] for it in store.snapshot().items]
+    store.close()
+    reopened = SqliteCatalogStore(path, check_interval=0)
+    items = reopened.snapshot().items
+    reopened.close()
+    assert in_memory == ["A", "X", "B", "C", "D"], in_memory
+    assert [it["id"] for it in items] == in_memory, [it["id"] for it in items]
+    assert [v["color"] for v in items[0]["variants"]] == ["black", "white"]
+
+def check_route_update() -> None:
+    # админ всегда на воркере 0, сообщения и кнопки одного чата — на одном воркере
+    from bench.fakes import callback_update, text_update
+    from cluster import route_update
+
+    admins = frozenset({42})
+    assert route_update(text_update(1, 42, "/import"), 4, admins) == 0
+    for chat_id in range(100, 140):
+        worker = route_update(text_update(1, chat_id, "привет"), 4, admins)
+        assert 0 <= worker < 4
+        assert route_update(callback_update(2, chat_id, "cat:1"), 4, admins) == worker, chat_id
+    assert len({route_update(text_update(1, c, "x"), 4) for c in range(100, 140)}) == 4
+
+def check_intent_classify() -> None:
+    # название модели — карточка, длинный вопрос с ним — к консультанту, заказ — по шаблону
+    from intent import IntentRouter
+
+    ariana = {"id": "ArianaClassic", "name": "Ariana"}
+    router = IntentRouter()
+    find = lambda text: ariana if "ariana" in text.lower() else None
+    assert router.classify("Ariana", find) == ("item", "catalog", ariana)
+    assert router.classify("сколько стоит Ariana?", find).name == "item"
+    assert router.classify("что надеть с Ariana на свадьбу летом в горах", find).name == ""
+    assert router.classify("хочу заказать Ariana", find) == ("order", "pattern", None)
+
+def check_intent_patterns() -> None:
+    # фразы бенчмарка намерений: промах шаблона уводит сообщение в LLM или в чужой сценарий
+    from bench.intents import EXPECTED_PATTERNS
+    from intent import IntentRouter
+
+    router = IntentRouter()
+    wrong = {t: (router.match_patterns(t), want) for t, want in EXPECTED_PATTERNS.items() if router.match_patterns(t) != want}
+    assert not wrong, wrong
+
+def check_plan_import() -> None:
+    # пустые ячейки не меняют товар, повтор id и новый товар без цены отклоняются
+    import io
+    from catalog_import import apply_plan, plan_import, read_rows
+    from catalog_store import freeze
+
+    existing = freeze([{"id": "A", "name": "Ariana", "price_kzt": 100, "colors": ["red"]}])
+    csv_data = "id,name,price_kzt,colors\nA,,,red\nB,Bella,200,\nB,Bella,300,\nC,Chloe,,\n"
+    plan = plan_import(existing, read_rows(io.BytesIO(csv_data.encode("cp1251")), "items.csv"))
+    assert (plan.added, plan.updated, plan.unchanged) == (["B"], [], 1), plan
+    assert [line for line, _ in plan.rejected] == [4, 5], plan.rejected
+    raw = {"items": [{"id": "A", "name": "Ariana", "price_kzt": 100}]}
+    apply_plan(raw, plan)
+    assert [(it["id"], it["price_kzt"]) for it in raw["items"]] == [("A", 100), ("B", 200)], raw
+
+def main() -> None:
+    pattern = sys.argv[1] if len(sys.argv) > 1 else ""
+    checks = [(name, fn) for name, fn in sorted(globals().items()) if name.startswith("check_") and pattern in name]
+    failed = 0
+    for name, fn in checks:
+        try:
+            fn()
+        except Exception:
+            failed += 1
+            print(f"FAIL {name}")
+            traceback.print_exc()
+        else:
+            print(f"ok   {name}")
+    print(f"{len(checks) - failed}/{len(checks)} ok")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
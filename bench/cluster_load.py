@@ -0,0 +1,118 @@
+"""
+Нагрузка на cluster.py: N процессов-воркеров за одним webhook-приёмником.
+Настоящий приёмник и хендлеры, в воркерах — фейковые Telegram и OpenAI.
+Меряет updates/sec до первого ответа в чат при разном числе воркеров;
+фото (признаки, dHash, даунскейл) нагружают CPU, его и делят процессы.
+
+Запуск:
+    python -m bench.cluster_load --workers 1,2,4 --updates 1000
+"""
+import os
+import glob
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from typing import Dict, List
+
+from bench import fakes
+from bench.stats import format_ms
+from bench.webhook_load import make_updates, post_all
+
+def fake_builder():
+    """Фабрика ApplicationBuilder для воркера (cluster.worker_main, builder_factory)."""
+    import bot
+    from telegram.ext import ApplicationBuilder
+
+    rnd = random.Random(os.getpid())
+    ai_latency = float(os.environ["BENCH_AI_LATENCY"])
+    bot.client = fakes.FakeAsyncOpenAI(
+        lambda: max(0.0, rnd.gauss(ai_latency, ai_latency / 4)),
+        lambda kwargs: json.dumps({"match_id": "NONE", "confidence": 0.1, "reason": "bench"})
+        if kwargs.get("response_format") else "Подскажу по каталогу: Ariana Classic — 45000 ₸.",
+    )
+    # первый ответ в каждый чат пишем в файл воркера: время меряет главный процесс
+    log = open(os.path.join(os.environ["BENCH_CLUSTER_DIR"], f"replies.{os.getpid()}.log"), "a", buffering=1)
+    seen = set()
+
+    def on_reply(chat_id: int, method: str) -> None:
+        if chat_id not in seen:
+            seen.add(chat_id)
+            log.write(f"{chat_id} {time.time()}\n")
+
+    tg_latency = fakes.constant(float(os.environ["BENCH_TG_LATENCY"]))
+    return (
+        ApplicationBuilder()
+        .token("123456:BENCH")
+        .request(fakes.FakeTelegramRequest(latency=tg_latency, on_reply=on_reply))
+        .get_updates_request(fakes.FakeTelegramRequest())
+    )
+
+def read_replies(directory: str) -> Dict[int, float]:
+    replies: Dict[int, float] = {}
+    for path in glob.glob(os.path.join(directory, "replies.*.log")):
+        with open(path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    replies[int(parts[0])] = float(parts[1])
+    return replies
+
+async def run_cluster(workers: int, args) -> None:
+    import cluster
+
+    directory = tempfile.mkdtemp(prefix=f"bench_cluster_{workers}_")
+    fakes.isolate_state(directory)
+    os.environ["BENCH_CLUSTER_DIR"] = directory
+
+    c = cluster.Cluster(workers, builder_factory="bench.cluster_load:fake_builder")
+    c.start()
+    server = c.make_app("telegram").listen(args.port, address="127.0.0.1")
+    try:
+        await asyncio.sleep(args.warmup)  # воркерам нужно время на spawn и import bot
+        updates = make_updates(args.updates)
+        sent_at: Dict[int, float] = {}
+        wall_t0 = time.time()
+        acks, errors, elapsed = await post_all(f"http://127.0.0.1:{args.port}/telegram", updates, args.concurrency, "", sent_at)
+        # sent_at в perf_counter, ответы воркеров — в time.time(): переводим
+        offset = wall_t0 - min(sent_at.values())
+        deadline = time.perf_counter() + args.drain
+        replies = read_replies(directory)
+        while len(replies) < len(updates) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+            replies = read_replies(directory)
+    finally:
+        server.stop()
+        await asyncio.to_thread(c.stop)
+
+    latencies: List[float] = [t - (sent_at[chat] + offset) for chat, t in replies.items() if chat in sent_at]
+    total = max(replies.values()) - wall_t0 if replies else 0.0
+    print(f"[workers={workers}] updates={len(updates)} errors={errors} routed={c.routed}")
+    print(f"  webhook ingest: {len(updates) / elapsed:.0f} updates/s")
+    if total > 0:
+        print(f"  handled: {len(replies)}/{len(updates)} in {total:.2f}s ({len(replies) / total:.0f} updates/s)")
+    print("  " + format_ms("update -> first reply", latencies))
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--workers", default="1,2,4", help="через запятую: прогон на каждое значение")
+    p.add_argument("--updates", type=int, default=1000)
+    p.add_argument("--concurrency", type=int, default=64)
+    p.add_argument("--port", type=int, default=18444)
+    p.add_argument("--concurrent-updates", type=int, default=32, help="BOT_CONCURRENT_UPDATES в каждом воркере")
+    p.add_argument("--ai-latency", type=float, default=0.2)
+    p.add_argument("--tg-latency", type=float, default=0.02)
+    p.add_argument("--warmup", type=float, default=3.0, help="пауза на запуск воркеров, сек")
+    p.add_argument("--drain", type=float, default=120.0)
+    args = p.parse_args()
+
+    os.environ["BOT_CONCURRENT_UPDATES"] = str(args.concurrent_updates)
+    os.environ["BENCH_AI_LATENCY"] = str(args.ai_latency)
+    os.environ["BENCH_TG_LATENCY"] = str(args.tg_latency)
+    for workers in args.workers.split(","):
+        asyncio.run(run_cluster(int(workers), args))
+
+if __name__ == "__main__":
+    main()
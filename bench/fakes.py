@@ -0,0 +1,321 @@
+"""
+Фейковые Telegram Bot API и OpenAI для локальных бенчмарков.
+Запросы бота идут через настоящий python-telegram-bot, но вместо сети
+отвечает FakeTelegramRequest; OpenAI заменяется FakeAsyncOpenAI.
+"""
+import io
+import json
+import math
+import time
+import random
+import asyncio
+import itertools
+from collections import Counter
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {"id": 1000, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+def sample_jpeg(size=(640, 480), color=(120, 80, 40)) -> bytes:
+    try:
+        from PIL import Image
+    except ImportError:
+        return b"\xff\xd8\xff\xd9"
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, "JPEG", quality=80)
+    return buf.getvalue()
+
+# -----------------------------
+# Telegram
+# -----------------------------
+class FakeTelegramRequest(BaseRequest):
+    """
+    Отвечает на методы Bot API так, как ответил бы Telegram (минимально).
+    on_reply(chat_id, method) вызывается на каждый исходящий ответ в чат.
+    """
+
+    def __init__(
+        self,
+        latency: Callable[[], float] = lambda: 0.0,
+        photo_bytes: Optional[bytes] = None,
+        on_reply: Optional[Callable[[int, str], None]] = None,
+        files: Optional[Dict[str, bytes]] = None,
+        updates: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        self.latency = latency
+        self.photo_bytes = photo_bytes if photo_bytes is not None else sample_jpeg()
+        # file_id -> содержимое присланных документов (getFile + скачивание)
+        self.files = files if files is not None else {}
+        # апдейты для polling: отдаются первым getUpdates, дальше — пустые ответы
+        self.updates = list(updates or [])
+        self.updates_delivered_at: Optional[float] = None
+        self.on_reply = on_reply
+        self.calls: Counter = Counter()
+        # сколько байт бот отправил в Telegram по каждому методу (JSON + загружаемые файлы)
+        self.sent_bytes: Counter = Counter()
+        self.replies: Dict[int, List[str]] = {}
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout: Any = None,
+        write_timeout: Any = None,
+        connect_timeout: Any = None,
+        pool_timeout: Any = None,
+    ):
+        delay = self.latency()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if "/file/bot" in url:
+            self.calls["download"] += 1
+            file_id = url.rsplit("/", 1)[-1]
+            return 200, self.files.get(file_id, self.photo_bytes)
+
+        api = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[api] += 1
+        if api == "getUpdates":
+            updates, self.updates = self.updates, []
+            if updates:
+                self.updates_delivered_at = time.perf_counter()
+            else:
+                await asyncio.sleep(0.05)
+            return 200, json.dumps({"ok": True, "result": updates}).encode("utf-8")
+        if request_data is not None:
+            self.sent_bytes[api] += len(request_data.json_payload)
+            if request_data.contains_files:
+                self.sent_bytes[api] += sum(len(part[1]) for part in request_data.multipart_data.values())
+        result = self._result(api, params)
+        if "chat_id" in params:
+            chat_id = int(params["chat_id"])
+            self.replies.setdefault(chat_id, []).append(str(params.get("text") or params.get("caption") or api))
+            if self.on_reply is not None:
+                self.on_reply(chat_id, api)
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+    def _result(self, api: str, params: Dict[str, Any]) -> Any:
+        if api == "getMe":
+            return BOT_USER
+        if api == "getFile":
+            file_id = str(params["file_id"])
+            if file_id in self.files:
+                return {
+                    "file_id": file_id,
+                    "file_unique_id": "u-" + file_id,
+                    "file_size": len(self.files[file_id]),
+                    "file_path": "documents/" + file_id,
+                }
+            return {
+                "file_id": file_id,
+                "file_unique_id": "u-" + file_id,
+                "file_size": len(self.photo_bytes),
+                "file_path": "photos/file.jpg",
+            }
+        if api in ("sendMessage", "editMessageText", "sendPhoto", "sendDocument"):
+            message = {
+                "message_id": int(params.get("message_id") or next(self._message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "from": BOT_USER,
+            }
+            if "text" in params:
+                message["text"] = params["text"]
+            if api == "sendPhoto":
+                n = message["message_id"]
+                message["photo"] = [{"file_id": f"sent{n}", "file_unique_id": f"u-sent{n}", "width": 1280, "height": 960}]
+            return message
+        if api == "sendMediaGroup":
+            media = params.get("media") or []
+            if isinstance(media, str):
+                media = json.loads(media)
+            return [self._result("sendPhoto", params) for _ in media or [None]]
+        return True
+
+# -----------------------------
+# Синтетические апдейты (JSON как от Telegram)
+# -----------------------------
+def _user(chat_id: int) -> Dict[str, Any]:
+    return {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}", "username": f"user{chat_id}"}
+
+def _message(message_id: int, chat_id: int) -> Dict[str, Any]:
+    return {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": _user(chat_id),
+    }
+
+def text_update(update_id: int, chat_id: int, text: str) -> Dict[str, Any]:
+    message = _message(update_id, chat_id)
+    message["text"] = text
+    if text.startswith("/"):
+        command = text.split()[0]
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return {"update_id": update_id, "message": message}
+
+def photo_update(update_id: int, chat_id: int, file_id: str, file_unique_id: Optional[str] = None) -> Dict[str, Any]:
+    unique = file_unique_id or f"u-{file_id}"
+    message = _message(update_id, chat_id)
+    message["photo"] = [
+        {"file_id": f"{file_id}-s", "file_unique_id": f"{unique}-s", "width": 320, "height": 240, "file_size": 9000},
+        {"file_id": file_id, "file_unique_id": unique, "width": 800, "height": 600, "file_size": 60000},
+        {"file_id": f"{file_id}-l", "file_unique_id": f"{unique}-l", "width": 1280, "height": 960, "file_size": 150000},
+    ]
+    return {"update_id": update_id, "message": message}
+
+def document_update(
+    update_id: int, chat_id: int, file_id: str, file_name: str, file_size: int, caption: str = ""
+) -> Dict[str, Any]:
+    message = _message(update_id, chat_id)
+    message["document"] = {"file_id": file_id, "file_unique_id": f"u-{file_id}", "file_name": file_name, "file_size": file_size}
+    if caption:
+        message["caption"] = caption
+    return {"update_id": update_id, "message": message}
+
+def callback_update(update_id: int, chat_id: int, data: str) -> Dict[str, Any]:
+    message = _message(update_id, chat_id)
+    message["from"] = BOT_USER
+    message["text"] = "Выберите действие:"
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(chat_id),
+            "chat_instance": str(chat_id),
+            "message": message,
+            "data": data,
+        },
+    }
+
+# -----------------------------
+# OpenAI
+# -----------------------------
+def api_error(status: int) -> Exception:
+    """Ошибка OpenAI SDK с данным HTTP-статусом (429, 503…)."""
+    import httpx
+    import openai
+
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status, request=request, json={"error": {"message": "bench"}})
+    return openai.APIStatusError(f"HTTP {status}", response=response, body=None)
+
+class FakeCompletions:
+    """failure() -> HTTP-статус, которым ответить на этот вызов, или None (успех)."""
+
+    def __init__(
+        self,
+        latency: Callable[[], float],
+        answer: Callable[[Dict[str, Any]], str],
+        failure: Optional[Callable[[], Optional[int]]] = None,
+    ) -> None:
+        self.latency = latency
+        self.answer = answer
+        self.failure = failure
+        self.calls = 0
+
+    async def create(self, **kwargs: Any) -> Any:
+        self.calls += 1
+        status = self.failure() if self.failure is not None else None
+        if status is not None:
+            await asyncio.sleep(self.latency())
+            raise api_error(status)
+        usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=50, prompt_tokens_details={"cached_tokens": 0})
+        if kwargs.get("stream"):
+            return FakeStream(self.latency(), self.answer(kwargs), usage)
+        await asyncio.sleep(self.latency())
+        message = SimpleNamespace(content=self.answer(kwargs))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+class FakeStream:
+    """Поток чанков: первый через first_token сек, остальные — каждые 20 мс."""
+
+    def __init__(self, first_token: float, text: str, usage: Any, step: float = 0.02) -> None:
+        self.first_token = first_token
+        self.parts = [text[i:i + 16] for i in range(0, len(text), 16)] or [""]
+        self.usage = usage
+        self.step = step
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        await asyncio.sleep(self.first_token)
+        for i, part in enumerate(self.parts):
+            if i:
+                await asyncio.sleep(self.step)
+            delta = SimpleNamespace(content=part)
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=delta)])
+        yield SimpleNamespace(usage=self.usage, choices=[])
+
+    async def close(self) -> None:
+        pass
+
+class FakeAsyncOpenAI:
+    def __init__(
+        self,
+        latency: Callable[[], float],
+        answer: Callable[[Dict[str, Any]], str],
+        failure: Optional[Callable[[], Optional[int]]] = None,
+    ) -> None:
+        self.chat = SimpleNamespace(completions=FakeCompletions(latency, answer, failure))
+
+def constant(value: float) -> Callable[[], float]:
+    return lambda: value
+
+def latency(spec: str, seed: int = 0) -> Callable[[], float]:
+    """
+    Распределение задержки из строки (сек):
+        0.5 | const:0.5 | normal:mean,sd | lognormal:median,sigma | uniform:lo,hi | exp:mean
+    """
+    rnd = random.Random(seed)
+    kind, _, params = spec.partition(":")
+    if not params:
+        return constant(float(kind))
+    args = [float(x) for x in params.split(",")]
+    if kind == "const":
+        return constant(args[0])
+    if kind == "normal":
+        return lambda: max(0.0, rnd.gauss(args[0], args[1]))
+    if kind == "lognormal":
+        return lambda: rnd.lognormvariate(math.log(args[0]), args[1])
+    if kind == "uniform":
+        return lambda: rnd.uniform(args[0], args[1])
+    if kind == "exp":
+        return lambda: rnd.expovariate(1.0 / args[0])
+    raise ValueError(f"неизвестное распределение задержки: {spec}")
+
+def isolate_state(directory: str) -> None:
+    """
+    Направляет все файлы состояния бота во временную папку.
+    Вызывать до import bot (настройки читаются при импорте).
+    """
+    import os
+    import shutil
+
+    catalog = os.path.join(directory, "catalog.json")
+    if not os.path.exists(catalog) and os.path.exists("catalog.json"):
+        shutil.copy("catalog.json", catalog)
+    os.environ["CATALOG_PATH"] = catalog
+    os.environ["CATALOG_SQLITE_PATH"] = os.path.join(directory, "catalog.sqlite3")
+    os.environ["ORDERS_PATH"] = os.path.join(directory, "orders.json")
+    os.environ["ORDERS_JOURNAL_PATH"] = os.path.join(directory, "orders.jsonl")
+    os.environ["VISION_CACHE_PATH"] = os.path.join(directory, "vision_cache.json")
+    os.environ["PHOTO_INDEX_PATH"] = os.path.join(directory, "photo_index.npz")
+    os.environ["PERSISTENCE_SQLITE_PATH"] = os.path.join(directory, "bot_state.sqlite3")
+    os.environ["INTERACTION_LOG_PATH"] = os.path.join(directory, "interactions.jsonl")
@@ -0,0 +1,103 @@
+"""
+Доля текстов, на которые роутер намерений отвечает без LLM, и время
+классификации. Тексты — из лога обращений бота (строки on_text)
+или встроенный набор типичных сообщений.
+
+Запуск:
+    python -m bench.intents
+    python -m bench.intents interactions.jsonl interactions.jsonl.1
+    python -m bench.intents interactions.jsonl --model intents_train.jsonl
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from typing import List
+
+from bench import fakes
+from bench.catalog_writes import make_catalog
+from bench.stats import format_us
+
+# Что должны ловить шаблоны (IntentRouter.match_patterns); проверяется в bench/checks.py
+EXPECTED_PATTERNS = {
+    "доставка в Алматы?": "delivery", "Доставляете в Караганду?": "delivery", "сколько идёт курьер": "delivery",
+    "Жеткізу бар ма?": "delivery", "сколько стоит доставка в Астану?": "delivery", "какая цена доставки?": "delivery",
+    "хочу заказать": "order", "хочу оформить заказ": "order", "тапсырыс беремін": "order", "куплю": "order",
+    "можно ли заказать чёрную?": "order", "тапсырыс бергім келеді": "order",
+    "я заказала вчера, где посылка?": "", "тапсырыс бердім": "",
+    "цена": "price", "сколько стоит?": "price", "бағасы қанша?": "price", "почём?": "price",
+    "меню": "menu", "каталог": "catalog", "что есть?": "catalog", "какие есть сумки": "catalog",
+    "покажите модели": "catalog", "здравствуйте": "greeting", "спасибо": "thanks",
+}
+
+SAMPLE = [
+    "доставка в Алматы?", "Доставляете в Караганду?", "сколько идёт курьер", "Жеткізу бар ма?",
+    "хочу заказать", "хочу оформить заказ", "тапсырыс беремін", "куплю",
+    "цена", "сколько стоит?", "бағасы қанша?", "почём?",
+    "меню", "каталог", "что есть?", "какие есть сумки", "покажите модели",
+    "Ariana Classic", "есть Bella Mini?", "сколько стоит Ariana Classic",
+    "хочу чёрную сумку на плечо", "какая сумка подойдёт на работу?", "есть рассрочка?",
+    "а натуральная кожа?", "здравствуйте", "спасибо",
+]
+
+def load_texts(paths: List[str]) -> List[str]:
+    texts = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("handler") == "on_text" and record.get("text"):
+                    texts.append(record["text"])
+    return texts
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("paths", nargs="*", help="лог обращений (INTERACTION_LOG_PATH)")
+    p.add_argument("--model", help="JSONL для классификатора (INTENT_MODEL_PATH)")
+    p.add_argument("--items", type=int, default=0, help="синтетический каталог на N товаров (0 — catalog.json)")
+    p.add_argument("--show", type=int, default=15, help="сколько непокрытых текстов показать")
+    args = p.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench_intents_")
+    if args.items:
+        make_catalog(os.path.join(directory, "catalog.json"), args.items)
+    fakes.isolate_state(directory)
+    from intent import IntentRouter, NaiveBayesIntents
+    import bot
+
+    texts = load_texts(args.paths) if args.paths else SAMPLE
+    if not texts:
+        print("нет текстов on_text в логе")
+        return
+    model = NaiveBayesIntents.from_jsonl(args.model) if args.model else None
+    router = IntentRouter(model=model)
+    cat = bot.load_catalog()
+
+    counts: Counter = Counter()
+    timings: List[float] = []
+    missed: Counter = Counter()
+    for text in texts:
+        t0 = time.perf_counter()
+        intent = router.classify(text, lambda q: bot.find_item_by_model_text(cat, q))
+        timings.append(time.perf_counter() - t0)
+        counts[(intent.name or "llm", intent.via)] += 1
+        if not intent.name:
+            missed[text] += 1
+
+    local = sum(n for (name, _), n in counts.items() if name != "llm")
+    print(f"текстов: {len(texts)}, без LLM: {local} ({local / len(texts):.0%})")
+    for (name, via), n in counts.most_common():
+        print(f"  {name:10} {via:8} {n:6d} {n / len(texts):6.0%}")
+    print(format_us("classify", timings))
+    if missed and args.show:
+        print("\nчаще всего уходят в LLM:")
+        for text, n in missed.most_common(args.show):
+            print(f"  {n:4d}  {text}")
+
+if __name__ == "__main__":
+    main()
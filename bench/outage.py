@@ -0,0 +1,102 @@
+"""
+Сбой провайдера: фейковый OpenAI отвечает 503 в окне [--down-from, --down-to]
+секунд, клиенты всё это время задают вопросы консультанту. Сравнивает
+задержку ответа в чат без circuit breaker (порог ошибок не достижим)
+и с ним; в открытом состоянии on_text отвечает локальным поиском.
+
+Запуск:
+    python -m bench.outage --chats 300 --duration 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from typing import Dict, List
+
+from bench import fakes
+from bench.stats import format_ms
+
+TEXTS = ["Ariana Classic", "доставка в Алматы?", "хочу чёрную сумку на плечо", "есть Bella Mini?"]
+
+async def run_mode(mode: str, args) -> None:
+    import bot
+    from ai_client import CircuitBreaker
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder, TypeHandler
+
+    # ответ консультанта — в самом хендлере, иначе done() видел бы только постановку в очередь
+    bot.AI_COALESCE = False
+    bot.openai_breaker = CircuitBreaker(
+        10 ** 9 if mode == "no-breaker" else bot.OPENAI_BREAKER_FAILURES,
+        args.breaker_reset,
+    )
+    started = time.perf_counter()
+
+    def failure():
+        elapsed = time.perf_counter() - started
+        return 503 if args.down_from <= elapsed < args.down_to else None
+
+    bot.client = fakes.FakeAsyncOpenAI(
+        fakes.latency(args.ai_latency, seed=1), lambda kwargs: "Доставка по Алматы 1–2 дня.", failure
+    )
+    tg = fakes.FakeTelegramRequest(latency=fakes.constant(0.02))
+    app = bot.build_application(
+        ApplicationBuilder().token("123456:BENCH").request(tg).get_updates_request(fakes.FakeTelegramRequest())
+    )
+
+    queued_at: Dict[int, float] = {}
+    during: List[float] = []
+    outside: List[float] = []
+
+    async def done(update: Update, context) -> None:
+        now = time.perf_counter()
+        t = queued_at[update.update_id]
+        (during if args.down_from <= t - started < args.down_to else outside).append(now - t)
+
+    app.add_handler(TypeHandler(Update, done), group=1)
+
+    rnd = random.Random(4)
+    n = args.chats
+    async with app:
+        await app.start()
+        started = time.perf_counter()
+        for i in range(n):
+            delay = started + i * args.duration / n - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            update = Update.de_json(fakes.text_update(i + 1, 90_000 + i, rnd.choice(TEXTS)), app.bot)
+            queued_at[update.update_id] = time.perf_counter()
+            await app.update_queue.put(update)
+        while len(during) + len(outside) < n:
+            await asyncio.sleep(0.05)
+        await app.stop()
+
+    print(f"[{mode}] openai calls: {bot.client.chat.completions.calls}")
+    print("  " + format_ms("during outage", during))
+    print("  " + format_ms("outside outage", outside))
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--chats", type=int, default=300)
+    p.add_argument("--duration", type=float, default=20.0, help="за сколько секунд приходят все вопросы")
+    p.add_argument("--down-from", type=float, default=5.0)
+    p.add_argument("--down-to", type=float, default=15.0)
+    p.add_argument("--ai-latency", default="lognormal:0.5,0.3")
+    p.add_argument("--breaker-reset", type=float, default=3.0)
+    p.add_argument("--modes", default="no-breaker,breaker")
+    args = p.parse_args()
+
+    fakes.isolate_state(tempfile.mkdtemp(prefix="bench_outage_"))
+    os.environ.setdefault("BOT_CONCURRENT_UPDATES", "64")
+    os.environ.setdefault("AI_GLOBAL_RATE_PER_SEC", "0")
+
+    async def run_all() -> None:
+        for mode in args.modes.split(","):
+            await run_mode(mode.strip(), args)
+
+    asyncio.run(run_all())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Нагрузочный тест распознавания фото: N параллельных вызовов match_bag_with_openai
+с фейковым OpenAI-клиентом, который отвечает с заданной задержкой.
+
+Запуск:
+    python -m bench.photo_load --requests 8 --latency 2.0
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import bot
+from bench.fakes import FakeAsyncOpenAI, constant
+
+async def run(n: int, latency: float) -> None:
+    cat = bot.load_catalog()
+    items = cat.items
+    match_id = items[0]["id"] if items else "NONE"
+    answer = json.dumps({"match_id": match_id, "confidence": 0.95, "reason": "bench"})
+    bot.client = FakeAsyncOpenAI(constant(latency), lambda kwargs: answer)
+
+    # Параллельно с «фото» проверяем, что event loop не блокируется
+    lags = []
+
+    async def probe() -> None:
+        while True:
+            t = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - t - 0.01)
+
+    probe_task = asyncio.create_task(probe())
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(bot.match_bag_with_openai(cat, b"\xff\xd8fake") for _ in range(n)))
+    elapsed = time.perf_counter() - t0
+    probe_task.cancel()
+
+    ok = sum(1 for r in results if r[0])
+    print(f"requests={n} model_latency={latency:.2f}s concurrency_limit={bot.OPENAI_MAX_CONCURRENCY}")
+    print(f"elapsed={elapsed:.2f}s ({elapsed / latency:.2f}x model latency), matched={ok}/{n}")
+    print(f"max event loop lag={max(lags or [0.0]) * 1000:.1f}ms")
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--requests", type=int, default=8)
+    p.add_argument("--latency", type=float, default=2.0)
+    args = p.parse_args()
+    asyncio.run(run(args.requests, args.latency))
+
+if __name__ == "__main__":
+    main()
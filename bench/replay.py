@@ -0,0 +1,265 @@
+"""
+Офлайн-прогон трафика через настоящие хендлеры: фейковые Telegram и OpenAI
+с настраиваемыми распределениями задержек, отчёт по каждому хендлеру,
+этапам on_photo и вызовам OpenAI (p50/p95/p99), плюс микробенчмарки
+load_catalog, find_item_by_model_text и роутера намерений на текущем каталоге.
+
+Трафик — сгенерированный (сценарии: цена по названию, вопрос консультанту,
+фото, кнопки меню, оформление заказа) или записанный: JSONL, строка —
+{"t": сек от начала, "update": {...}}, просто Update от Telegram
+или лог обращений самого бота (INTERACTION_LOG_PATH, по умолчанию interactions.jsonl).
+
+Запуск:
+    python -m bench.replay --chats 200 --items 2000
+    python -m bench.replay --save traffic.jsonl            # сохранить сгенерированный трафик
+    python -m bench.replay --from traffic.jsonl --speed 5  # проиграть в 5 раз быстрее
+    python -m bench.replay --from interactions.jsonl       # реальный трафик из лога обращений
+    python -m bench.replay --ai-latency lognormal:0.8,0.5 --tg-latency normal:0.03,0.01
+    python -m bench.replay --out base.json; ...; python -m bench.replay --baseline base.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+from bench import fakes
+from bench.catalog_writes import make_catalog
+from bench.stats import format_ms, format_us, summarize
+
+QUESTIONS = ["доставка в Алматы?", "есть рассрочка?", "хочу чёрную сумку на плечо", "какая сумка подойдёт на работу?"]
+MENU_BUTTONS = ["menu_catalog", "menu_delivery", "menu_price"]
+
+# -----------------------------
+# Трафик
+# -----------------------------
+def generate(names: List[str], chats: int, spread: float, gap: float, seed: int = 1) -> List[Tuple[float, Dict]]:
+    rnd = random.Random(seed)
+    events: List[Tuple[float, Dict]] = []
+    update_id = 0
+
+    def add(t: float, build, *args) -> float:
+        nonlocal update_id
+        update_id += 1
+        events.append((t, build(update_id, *args)))
+        return t + rnd.uniform(0, gap)
+
+    for c in range(chats):
+        chat_id = 70_000 + c
+        t = rnd.uniform(0, spread)
+        scenario = rnd.random()
+        if scenario < 0.3:  # цена по названию
+            t = add(t, fakes.text_update, chat_id, "цена")
+            t = add(t, fakes.text_update, chat_id, rnd.choice(names))
+        elif scenario < 0.55:  # вопрос консультанту
+            t = add(t, fakes.text_update, chat_id, rnd.choice(QUESTIONS))
+        elif scenario < 0.8:  # фото (часть — одни и те же картинки)
+            t = add(t, fakes.photo_update, chat_id, f"photo{rnd.randint(1, 30)}")
+        elif scenario < 0.9:  # меню
+            t = add(t, fakes.text_update, chat_id, "меню")
+            t = add(t, fakes.callback_update, chat_id, rnd.choice(MENU_BUTTONS))
+        else:  # оформление заказа
+            for text in ("/order", f"Имя {chat_id}", f"+7 700 {chat_id}", "Алматы", "Абая 1", "-"):
+                t = add(t, fakes.text_update, chat_id, text)
+    events.sort(key=lambda e: e[0])
+    return events
+
+def interaction_to_update(record: Dict[str, Any], update_id: int) -> Dict:
+    """Строка лога обращений бота (INTERACTION_LOG_PATH) -> синтетический Update."""
+    chat_id = int(record.get("chat_id") or record.get("user_id") or 0)
+    kind = record.get("kind")
+    if kind == "photo":
+        return fakes.photo_update(update_id, chat_id, record["file_id"], record.get("file_unique_id"))
+    if kind == "callback":
+        return fakes.callback_update(update_id, chat_id, record.get("data") or "")
+    # текст шагов заказа в лог не пишется — подставляем заглушку
+    return fakes.text_update(update_id, chat_id, record.get("text") or "-")
+
+def load_traffic(path: str) -> List[Tuple[float, Dict]]:
+    """
+    JSONL: {"t": ..., "update": {...}}, сырой Update от Telegram
+    или строки лога обращений бота (interactions.jsonl).
+    """
+    events: List[Tuple[float, Dict]] = []
+    logged: List[Dict[str, Any]] = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "update" in record:
+                events.append((float(record.get("t", 0.0)), record["update"]))
+            elif "update_id" in record:
+                events.append((0.0, record))
+            elif record.get("handler") == "consultant_reply":
+                continue  # фоновый ответ консультанта на уже записанные сообщения, не апдейт
+            elif "handler" in record and record.get("kind"):
+                logged.append(record)
+    if logged:
+        # строки лога пишутся по завершении обработки — порядок восстанавливаем по ts начала
+        logged.sort(key=lambda r: r["ts"])
+        first_ts = logged[0]["ts"]
+        for n, record in enumerate(logged, 1):
+            events.append((record["ts"] - first_ts, interaction_to_update(record, n)))
+    events.sort(key=lambda e: e[0])
+    return events
+
+def save_traffic(path: str, events: List[Tuple[float, Dict]]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for t, update in events:
+            f.write(json.dumps({"t": round(t, 4), "update": update}, ensure_ascii=False) + "\n")
+
+# -----------------------------
+# Прогон
+# -----------------------------
+def micro(bot, names: List[str], rounds: int) -> Dict[str, List[float]]:
+    """Время одного вызова горячих функций (без сети)."""
+    cat = bot.load_catalog()
+    queries = names[:50] + ["хочу ariana classic чёрную", "что-то непонятное без модели"] * 10
+    samples: Dict[str, List[float]] = {"load_catalog": [], "find_item_by_model_text": [], "intent_router.classify": []}
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        bot.load_catalog()
+        samples["load_catalog"].append(time.perf_counter() - t0)
+        for q in queries:
+            t0 = time.perf_counter()
+            bot.find_item_by_model_text(cat, q)
+            samples["find_item_by_model_text"].append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            bot.intent_router.classify(q, lambda text: bot.find_item_by_model_text(cat, text))
+            samples["intent_router.classify"].append(time.perf_counter() - t0)
+    return samples
+
+async def replay(args, events: List[Tuple[float, Dict]]) -> Dict[str, Dict[str, List[float]]]:
+    import bot
+    import metrics
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder, TypeHandler
+
+    samples: Dict[str, Dict[str, List[float]]] = {"handler": {}, "photo stage": {}, "openai": {}, "update": {"total": []}}
+
+    def collect(section: str, label: str):
+        return lambda value, labels: samples[section].setdefault(labels[label], []).append(value)
+
+    metrics.HANDLER_SECONDS.subscribe(collect("handler", "handler"))
+    metrics.PHOTO_STAGE_SECONDS.subscribe(collect("photo stage", "stage"))
+    metrics.OPENAI_SECONDS.subscribe(collect("openai", "kind"))
+
+    rnd = random.Random(5)
+    ids = [it["id"] for it in bot.load_catalog().items] or ["NONE"]
+
+    def answer(kwargs: Dict[str, Any]) -> str:
+        if kwargs.get("response_format"):
+            return json.dumps({"match_id": rnd.choice(ids), "confidence": round(rnd.uniform(0.5, 1.0), 2), "reason": "bench"})
+        return "Доставка по Алматы 1–2 дня, по Казахстану 3–5 дней."
+
+    bot.client = fakes.FakeAsyncOpenAI(fakes.latency(args.ai_latency, seed=2), answer)
+    tg = fakes.FakeTelegramRequest(latency=fakes.latency(args.tg_latency, seed=3))
+    app = bot.build_application(
+        ApplicationBuilder().token("123456:BENCH").request(tg).get_updates_request(fakes.FakeTelegramRequest())
+    )
+
+    queued_at: Dict[int, float] = {}
+
+    async def done(update: Update, context) -> None:
+        samples["update"]["total"].append(time.perf_counter() - queued_at[update.update_id])
+
+    app.add_handler(TypeHandler(Update, done), group=1)
+
+    async with app:
+        await app.start()
+        t0 = time.perf_counter()
+        for at, payload in events:
+            delay = t0 + at / args.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            update = Update.de_json(payload, app.bot)
+            queued_at[update.update_id] = time.perf_counter()
+            await app.update_queue.put(update)
+        deadline = time.perf_counter() + args.drain
+        while len(samples["update"]["total"]) < len(events) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.02)
+        elapsed = time.perf_counter() - t0
+        await app.stop()
+    if bot.interaction_log is not None:
+        bot.interaction_log.close()
+
+    handled = len(samples["update"]["total"])
+    print(f"updates={len(events)} handled={handled} in {elapsed:.2f}s ({handled / elapsed:.0f} updates/s)")
+    print(f"telegram calls: {dict(tg.calls)}  openai calls: {bot.client.chat.completions.calls}")
+    samples["micro"] = micro(bot, [it.get("name", "") for it in bot.load_catalog().items], args.micro_rounds)
+    return samples
+
+# -----------------------------
+# Отчёт и сравнение с прошлым прогоном
+# -----------------------------
+def report(samples: Dict[str, Dict[str, List[float]]], baseline: Dict[str, Dict[str, Dict[str, float]]]) -> None:
+    for section in ("update", "handler", "photo stage", "openai", "micro"):
+        rows = samples.get(section) or {}
+        if not rows:
+            continue
+        print(f"\n{section}:")
+        for name in sorted(rows):
+            fmt = format_us if section == "micro" else format_ms
+            line = "  " + fmt(name, rows[name])
+            old = baseline.get(section, {}).get(name)
+            if old and old.get("p95"):
+                delta = (summarize(rows[name])["p95"] / old["p95"] - 1) * 100
+                line += f"  p95 {delta:+.0f}% vs baseline"
+            print(line)
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--from", dest="source", help="JSONL с записанным трафиком; без него трафик генерируется")
+    p.add_argument("--save", help="сохранить сгенерированный трафик в JSONL и выйти")
+    p.add_argument("--chats", type=int, default=200)
+    p.add_argument("--spread", type=float, default=5.0, help="за сколько секунд стартуют все чаты")
+    p.add_argument("--gap", type=float, default=0.5, help="макс. пауза между сообщениями одного чата, сек")
+    p.add_argument("--speed", type=float, default=1.0, help="ускорение времени трафика")
+    p.add_argument("--items", type=int, default=0, help="синтетический каталог на N товаров (0 — catalog.json)")
+    p.add_argument("--ai-latency", default="lognormal:0.6,0.4", help="распределение задержки OpenAI")
+    p.add_argument("--tg-latency", default="normal:0.03,0.01", help="распределение задержки Bot API")
+    p.add_argument("--concurrent-updates", type=int, default=64, help="BOT_CONCURRENT_UPDATES")
+    p.add_argument("--micro-rounds", type=int, default=200)
+    p.add_argument("--drain", type=float, default=120.0)
+    p.add_argument("--out", help="сохранить сводку (p50/p95/p99) в JSON")
+    p.add_argument("--baseline", help="JSON из прошлого --out: показать изменение p95")
+    args = p.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench_replay_")
+    if args.items:
+        make_catalog(os.path.join(directory, "catalog.json"), args.items)
+    fakes.isolate_state(directory)
+    os.environ["BOT_CONCURRENT_UPDATES"] = str(args.concurrent_updates)
+    import bot
+
+    if args.source:
+        events = load_traffic(args.source)
+    else:
+        names = [it.get("name", "") for it in bot.load_catalog().items] or ["Ariana Classic"]
+        events = generate(names, args.chats, args.spread, args.gap)
+    if args.save:
+        save_traffic(args.save, events)
+        print(f"saved {len(events)} updates to {args.save}")
+        return
+
+    samples = asyncio.run(replay(args, events))
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    report(samples, baseline)
+    if args.out:
+        summary = {section: {name: summarize(v) for name, v in rows.items()} for section, rows in samples.items()}
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
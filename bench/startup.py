@@ -0,0 +1,128 @@
+"""
+Холодный старт: каждый прогон — новый процесс python, как после деплоя.
+Бот запускается через настоящий run_polling, первый getUpdates отдаёт
+--updates сообщений (цена модели, каталог, ...). Меряется время от запуска
+процесса до первого и последнего ответа (time-to-first-handled-update),
+задержка обработки первого апдейта и фазы старта из bot.startup_phases.
+
+Режимы:
+    eager     — как раньше: SDK OpenAI и клиент при импорте, без прогрева
+    noprewarm — SDK лениво, без прогрева (BOT_PREWARM=0)
+    lazy      — по умолчанию: SDK лениво (в фоне), прогрев в post_init
+
+Запуск:
+    python -m bench.startup --items 2000 --runs 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+TEXTS = ["сколько стоит Item 7", "каталог", "Item 1500", "доставка в Алматы?"]
+
+def child(mode: str, count: int) -> None:
+    spawned_at = float(os.environ["BENCH_SPAWNED_AT"])
+    started = time.time() - spawned_at  # запуск интерпретатора и site до первой строки
+    from bench import fakes  # после замера: fakes тянет telegram, это часть старта бота
+
+    if mode == "eager":
+        import openai  # noqa: F401 — так было: SDK при импорте бота
+    import bot
+    if mode == "eager":
+        bot.openai_client()
+    from telegram.ext import ApplicationBuilder
+
+    chat_id = 70_000
+    replies = []
+
+    def on_reply(chat: int, api: str) -> None:
+        if chat != chat_id:
+            return
+        replies.append((time.time(), time.perf_counter()))
+        if len(replies) == count:
+            asyncio.get_running_loop().create_task(stop())
+
+    async def stop() -> None:
+        # апдейты могут обработаться ещё до конца запуска polling — stop_running тогда не сработает
+        while not (app.updater.running and app.running):
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        app.stop_running()
+
+    tg = fakes.FakeTelegramRequest(
+        updates=[fakes.text_update(n + 1, chat_id, TEXTS[n % len(TEXTS)]) for n in range(count)],
+        on_reply=on_reply,
+    )
+    app = bot.build_application(ApplicationBuilder().token("123456:BENCH").request(tg).get_updates_request(tg))
+    app.run_polling(close_loop=False)
+
+    first_wall, first_perf = replies[0]
+    print(json.dumps({
+        "interpreter": started,
+        "ttfu": first_wall - spawned_at,
+        "ttlu": replies[-1][0] - spawned_at,
+        "first_latency": first_perf - tg.updates_delivered_at,
+        "phases": bot.startup_phases,
+    }))
+
+def run(mode: str, args) -> dict:
+    env = dict(os.environ)
+    env["BENCH_SPAWNED_AT"] = repr(time.time())
+    env["BOT_PREWARM"] = "1" if mode == "lazy" else "0"
+    proc = subprocess.run(
+        [sys.executable, "-m", "bench.startup", "--child", mode, "--updates", str(args.updates)],
+        env=env, capture_output=True, text=True, timeout=120,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--items", type=int, default=2000)
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--updates", type=int, default=4)
+    p.add_argument("--modes", default="eager,noprewarm,lazy")
+    p.add_argument("--child", help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.child:
+        child(args.child, args.updates)
+        return
+
+    from bench import fakes
+
+    directory = tempfile.mkdtemp(prefix="bench_startup_")
+    if args.items:
+        from bench.catalog_writes import make_catalog
+        make_catalog(os.path.join(directory, "catalog.json"), args.items)
+    fakes.isolate_state(directory)
+    # ключ есть, но OpenAI недоступен: прогрев соединения честно упрётся в закрытый порт, а не в сеть
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    os.environ.setdefault("OPENAI_BASE_URL", "http://127.0.0.1:9/v1")
+
+    for mode in args.modes.split(","):
+        mode = mode.strip()
+        results = [run(mode, args) for _ in range(args.runs)]
+
+        def med(key: str) -> float:
+            return statistics.median(r[key] for r in results)
+
+        phases = {
+            name: statistics.median(r["phases"].get(name, 0.0) for r in results)
+            for name in results[0]["phases"]
+        }
+        print(
+            f"[{mode:9}] first reply {med('ttfu') * 1000:6.0f}ms after spawn, all {args.updates} "
+            f"{med('ttlu') * 1000:6.0f}ms, first update handled in {med('first_latency') * 1000:5.1f}ms "
+            f"(interpreter {med('interpreter') * 1000:.0f}ms)"
+        )
+        print("            phases, ms: " + ", ".join(f"{k}={v * 1000:.1f}" for k, v in phases.items()))
+
+if __name__ == "__main__":
+    main()
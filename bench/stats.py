@@ -0,0 +1,33 @@
+"""Перцентили и форматирование результатов бенчмарков."""
+import math
+from typing import Dict, Sequence
+
+def percentile(values: Sequence[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(p / 100.0 * len(ordered)) - 1))
+    return ordered[k]
+
+def summarize(values: Sequence[float]) -> Dict[str, float]:
+    return {
+        "n": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+def format_ms(label: str, values: Sequence[float]) -> str:
+    s = summarize(values)
+    return (
+        f"{label:<24} n={s['n']:<6} p50={s['p50'] * 1000:8.1f}ms p95={s['p95'] * 1000:8.1f}ms "
+        f"p99={s['p99'] * 1000:8.1f}ms max={s['max'] * 1000:8.1f}ms"
+    )
+
+def format_us(label: str, values: Sequence[float]) -> str:
+    s = summarize(values)
+    return (
+        f"{label:<24} n={s['n']:<6} p50={s['p50'] * 1e6:8.1f}µs p95={s['p95'] * 1e6:8.1f}µs "
+        f"p99={s['p99'] * 1e6:8.1f}µs max={s['max'] * 1e6:8.1f}µs"
+    )
@@ -0,0 +1,82 @@
+"""
+Офлайн-подбор порога уверенности распознавания фото (сейчас 0.80)
+по логу обращений бота: сколько фото получили бы ответ при каждом пороге.
+
+Берутся только вызовы модели (source=model, есть model_confidence).
+Если в строки вручную добавить "correct": true/false (верно ли модель
+назвала товар), считается и точность среди ответов.
+
+--index — пороги локального индекса фото (PHOTO_INDEX_THRESHOLD/CONFIRM):
+по вызовам модели, где записан лучший score индекса, — сколько фото индекс
+ответил бы сам и как часто его товар совпал с ответом модели. Если модели
+давали кандидата (score >= PHOTO_INDEX_CONFIRM), совпадение завышено;
+точность — по строкам с вручную добавленным "correct_id" (верный товар).
+
+Запуск:
+    python -m bench.threshold interactions.jsonl
+    python -m bench.threshold interactions.jsonl interactions.jsonl.1 --thresholds 0.6,0.7,0.8,0.9
+    python -m bench.threshold interactions.jsonl --index
+"""
+import argparse
+import json
+from typing import Dict, List
+
+def load(paths: List[str]) -> List[Dict]:
+    rows = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("source") == "model" and record.get("model_confidence") is not None:
+                    rows.append(record)
+    return rows
+
+def index_table(rows: List[Dict], thresholds: List[float]) -> None:
+    rows = [r for r in rows if r.get("index_score") is not None]
+    if not rows:
+        print("нет вызовов модели с index_score")
+        return
+    print(f"вызовов модели со score индекса: {len(rows)}")
+    print(f"{'порог':>6} {'ответ':>7} {'доля':>6} {'согласие':>9} {'точность':>9}")
+    for threshold in thresholds:
+        answered = [r for r in rows if r["index_score"] >= threshold]
+        agree = sum(1 for r in answered if str(r.get("model_match_id")) == str(r.get("index_item_id")))
+        labeled = [r for r in answered if "correct_id" in r]
+        precision = (
+            f"{sum(1 for r in labeled if r['correct_id'] == r['index_item_id']) / len(labeled):9.0%}"
+            if labeled else f"{'—':>9}"
+        )
+        share = f"{agree / len(answered):9.0%}" if answered else f"{'—':>9}"
+        print(f"{threshold:6.3f} {len(answered):7d} {len(answered) / len(rows):6.0%} {share} {precision}")
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--thresholds", default=None)
+    p.add_argument("--index", action="store_true", help="пороги локального индекса фото")
+    args = p.parse_args()
+
+    rows = load(args.paths)
+    if args.index:
+        index_table(rows, [float(x) for x in (args.thresholds or "0.9,0.93,0.95,0.97,0.98,0.985,0.99").split(",")])
+        return
+    args.thresholds = args.thresholds or "0.5,0.6,0.7,0.75,0.8,0.85,0.9,0.95"
+    if not rows:
+        print("нет вызовов модели с model_confidence")
+        return
+    print(f"вызовов модели: {len(rows)}")
+    print(f"{'порог':>6} {'ответ':>7} {'доля':>6} {'точность':>9}")
+    for threshold in (float(x) for x in args.thresholds.split(",")):
+        answered = [
+            r for r in rows
+            if r["model_confidence"] >= threshold and str(r.get("model_match_id") or "NONE").upper() != "NONE"
+        ]
+        labeled = [r for r in answered if "correct" in r]
+        precision = f"{sum(1 for r in labeled if r['correct']) / len(labeled):9.0%}" if labeled else f"{'—':>9}"
+        print(f"{threshold:6.2f} {len(answered):7d} {len(answered) / len(rows):6.0%} {precision}")
+
+if __name__ == "__main__":
+    main()
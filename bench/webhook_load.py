@@ -0,0 +1,145 @@
+"""
+Генератор нагрузки для webhook-режима: шлёт синтетические Update (JSON как от
+Telegram) POST-запросами на webhook и меряет updates/sec и задержки.
+
+С --url бьёт по уже запущенному боту (BOT_MODE=webhook); меряется только
+время ответа webhook (бот подтверждает апдейт до обработки).
+Без --url поднимает бота локально: настоящие хендлеры, webhook-сервер PTB,
+фейковые Telegram и OpenAI. Тогда меряется и полное время до ответа в чат.
+
+Запуск:
+    python -m bench.webhook_load --updates 2000 --concurrency 64
+    python -m bench.webhook_load --url http://127.0.0.1:8443/telegram --secret S
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from bench import fakes
+from bench.stats import format_ms
+
+TEXTS = ["меню", "цена", "Ariana Classic", "доставка в Алматы?", "хочу чёрную сумку на плечо", "/start"]
+
+def make_updates(n: int, first_chat: int = 10_000) -> List[Dict]:
+    rnd = random.Random(42)
+    updates = []
+    for i in range(n):
+        update_id = i + 1
+        chat_id = first_chat + i  # по чату на апдейт: ответ однозначно сопоставляется с запросом
+        kind = rnd.random()
+        if kind < 0.6:
+            updates.append(fakes.text_update(update_id, chat_id, rnd.choice(TEXTS)))
+        elif kind < 0.8:
+            updates.append(fakes.photo_update(update_id, chat_id, f"photo{rnd.randint(1, 50)}"))
+        else:
+            updates.append(fakes.callback_update(update_id, chat_id, rnd.choice(["menu_catalog", "menu_delivery", "menu_price"])))
+    return updates
+
+async def post_all(url: str, updates: List[Dict], concurrency: int, secret: str, sent_at: Dict[int, float]):
+    sem = asyncio.Semaphore(concurrency)
+    acks: List[float] = []
+    errors = 0
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as http:
+
+        async def post(update: Dict) -> None:
+            nonlocal errors
+            chat_id = (update.get("message") or update.get("callback_query", {}).get("message"))["chat"]["id"]
+            async with sem:
+                t0 = time.perf_counter()
+                sent_at[chat_id] = t0
+                try:
+                    r = await http.post(url, content=json.dumps(update), headers={**headers, "Content-Type": "application/json"})
+                    if r.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                acks.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(post(u) for u in updates))
+        elapsed = time.perf_counter() - t0
+    return acks, errors, elapsed
+
+async def serve_and_load(args) -> None:
+    fakes.isolate_state(tempfile.mkdtemp(prefix="bench_webhook_"))
+    import bot
+    from telegram.ext import ApplicationBuilder
+
+    rnd = random.Random(7)
+    bot.client = fakes.FakeAsyncOpenAI(
+        lambda: max(0.0, rnd.gauss(args.ai_latency, args.ai_latency / 4)),
+        lambda kwargs: json.dumps({"match_id": "NONE", "confidence": 0.1, "reason": "bench"})
+        if kwargs.get("response_format") else "Подскажу по каталогу: Ariana Classic — 45000 ₸.",
+    )
+
+    sent_at: Dict[int, float] = {}
+    handled: Dict[int, float] = {}
+
+    def on_reply(chat_id: int, method: str) -> None:
+        if chat_id in sent_at and chat_id not in handled:
+            handled[chat_id] = time.perf_counter() - sent_at[chat_id]
+
+    tg_latency = fakes.constant(args.tg_latency)
+    builder = (
+        ApplicationBuilder()
+        .token("123456:BENCH")
+        .request(fakes.FakeTelegramRequest(latency=tg_latency, on_reply=on_reply))
+        .get_updates_request(fakes.FakeTelegramRequest())
+    )
+    app = bot.build_application(builder)
+    url = f"http://127.0.0.1:{args.port}/telegram"
+    async with app:
+        await app.updater.start_webhook(
+            listen="127.0.0.1", port=args.port, url_path="telegram", webhook_url=url, secret_token=args.secret or None
+        )
+        await app.start()
+        updates = make_updates(args.updates)
+        acks, errors, elapsed = await post_all(url, updates, args.concurrency, args.secret, sent_at)
+        # ждём, пока хендлеры ответят на всё отправленное
+        deadline = time.perf_counter() + args.drain
+        while len(handled) < len(updates) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        total = time.perf_counter() - min(sent_at.values())
+        await app.updater.stop()
+        await app.stop()
+
+    report(args, acks, errors, elapsed, list(handled.values()), total, len(updates))
+
+def report(args, acks, errors, elapsed, handled: Optional[List[float]], total: float, n: int) -> None:
+    print(f"updates={n} concurrency={args.concurrency} errors={errors}")
+    print(f"webhook ingest: {n / elapsed:.0f} updates/s")
+    print(format_ms("webhook ack", acks))
+    if handled is not None:
+        print(f"handled: {len(handled)}/{n} in {total:.2f}s ({len(handled) / total:.0f} updates/s)")
+        print(format_ms("update -> first reply", handled))
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--url", help="webhook уже запущенного бота; без него бот поднимается локально")
+    p.add_argument("--secret", default="", help="WEBHOOK_SECRET_TOKEN")
+    p.add_argument("--updates", type=int, default=1000)
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--port", type=int, default=18443)
+    p.add_argument("--ai-latency", type=float, default=0.5, help="средняя задержка фейкового OpenAI, сек")
+    p.add_argument("--tg-latency", type=float, default=0.02, help="задержка фейкового Bot API, сек")
+    p.add_argument("--drain", type=float, default=120.0, help="сколько ждать обработки после отправки, сек")
+    args = p.parse_args()
+
+    if args.url:
+        updates = make_updates(args.updates)
+        acks, errors, elapsed = asyncio.run(post_all(args.url, updates, args.concurrency, args.secret, {}))
+        report(args, acks, errors, elapsed, None, 0.0, len(updates))
+    else:
+        asyncio.run(serve_and_load(args))
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,62 @@
+import io
 import os
+import re
+import sys
 import json
-import base64
+import time
+import functools
+import importlib
+import contextlib
+from contextvars import ContextVar
+import asyncio
 import logging
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Optional, List, Set, Tuple, AsyncIterator, Awaitable, Callable
+
+# Начало импорта модуля: от него считаются фазы старта (см. startup_phase)
+STARTED_AT = time.perf_counter()
 
 from telegram import (
     Update,
+    Message,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    InputMediaPhoto,
 )
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
     ContextTypes,
     ConversationHandler,
+    TypeHandler,
     filters,
 )
 
-from openai import OpenAI
+from ai_client import make_openai_client, CircuitBreaker, CircuitOpenError, call_with_retries
+from ratelimit import RateLimiter, RateLimitedError, SingleFlight, Coalescer
+
+from storage import OrderJournal, JsonWriter, InteractionLog
+from catalog_store import CatalogStore, CatalogSnapshot
+from catalog_sqlite import open_catalog
+from catalog_import import (
+    CatalogImportError, ImportPlan, read_rows, plan_import, apply_plan, format_plan,
+    open_zip, zip_table, iter_zip_photos,
+)
+from vision_cache import VisionCache, dhash
+from photo_index import PhotoIndex, image_features
+from image_utils import pick_photo_size, downscale_jpeg, jpeg_data_url
+from streaming import StreamingReply
+from intent import IntentRouter, NaiveBayesIntents
+from concurrency import ChatOrderedUpdateProcessor
+from persistence import KVPersistence, SqliteBackend, RedisBackend
+from metrics import (
+    timed_handler, stage, cache_result, start_metrics_server,
+    OPENAI_SECONDS, OPENAI_FIRST_CHUNK_SECONDS, OPENAI_ERRORS, OPENAI_TOKENS, ERRORS,
+    AI_RATE_LIMITED, AI_COALESCED, INTENTS, STARTUP_SECONDS,
+)
 
 # -----------------------------
 # НАСТРОЙКИ / ENV
@@ -37,12 +74,161 @@ if ADMIN_IDS_RAW:
         ADMIN_IDS = set()
 
 CATALOG_PATH = os.getenv("CATALOG_PATH", "catalog.json")
+# json — весь каталог в CATALOG_PATH; sqlite — таблицы + FTS5 в CATALOG_SQLITE_PATH
+# (при первом запуске переносится из CATALOG_PATH; обратно: python catalog_sqlite.py export ...)
+CATALOG_BACKEND = os.getenv("CATALOG_BACKEND", "json").strip().lower()
+CATALOG_SQLITE_PATH = os.getenv("CATALOG_SQLITE_PATH", "catalog.sqlite3")
 ORDERS_PATH = os.getenv("ORDERS_PATH", "orders.json")
+# Журнал заказов (JSONL, только дозапись); orders.json — экспорт через /orders_export
+ORDERS_JOURNAL_PATH = os.getenv("ORDERS_JOURNAL_PATH", "orders.jsonl")
+ORDERS_FSYNC_EVERY = int(os.getenv("ORDERS_FSYNC_EVERY", "16"))
+ORDERS_FSYNC_INTERVAL_SEC = float(os.getenv("ORDERS_FSYNC_INTERVAL_SEC", "1.0"))
+
+# Лог обращений клиентов (JSONL, строка на запрос): для bench/replay.py и подбора порога
+# уверенности. Пишется в фоне пачками, ротируется по размеру. Пустой путь — выключено
+INTERACTION_LOG_PATH = os.getenv("INTERACTION_LOG_PATH", "interactions.jsonl").strip()
+INTERACTION_LOG_MAX_BYTES = int(os.getenv("INTERACTION_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+INTERACTION_LOG_BACKUPS = int(os.getenv("INTERACTION_LOG_BACKUPS", "5"))
+INTERACTION_LOG_FLUSH_SEC = float(os.getenv("INTERACTION_LOG_FLUSH_SEC", "1.0"))
+
+# Как часто (сек) проверять mtime/размер catalog.json для hot reload
+CATALOG_RELOAD_CHECK_SEC = float(os.getenv("CATALOG_RELOAD_CHECK_SEC", "1.0"))
+# Каталог в промпте консультанта: целиком, если товаров не больше CATALOG_BRIEF_FULL_MAX,
+# иначе — сводка по каталогу + топ-k товаров, найденных по сообщению клиента (BM25)
+CATALOG_BRIEF_FULL_MAX = int(os.getenv("CATALOG_BRIEF_FULL_MAX", "80"))
+CATALOG_RETRIEVAL_TOP_K = int(os.getenv("CATALOG_RETRIEVAL_TOP_K", "12"))
+
+# Локальный роутер намерений перед консультантом. INTENT_MODEL_PATH — JSONL
+# {"text": ..., "intent": price|delivery|catalog} для крошечного классификатора
+# (необязателен: без файла работают только шаблоны и поиск по каталогу)
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", "").strip()
+INTENT_MODEL_MIN_PROB = float(os.getenv("INTENT_MODEL_MIN_PROB", "0.9"))
+
+# Потоковые ответы консультанта: сообщение дописывается правками не чаще раза в N сек
+OPENAI_STREAM = os.getenv("OPENAI_STREAM", "1").strip() not in ("0", "false", "no", "")
+STREAM_EDIT_INTERVAL_SEC = float(os.getenv("STREAM_EDIT_INTERVAL_SEC", "1.0"))
+
+# Кэш распознавания фото (file_unique_id / dHash -> результат vision)
+VISION_CACHE_PATH = os.getenv("VISION_CACHE_PATH", "vision_cache.json")
+VISION_CACHE_MAX = int(os.getenv("VISION_CACHE_MAX", "5000"))
+VISION_CACHE_TTL_SEC = float(os.getenv("VISION_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+VISION_HASH_MAX_DISTANCE = int(os.getenv("VISION_HASH_MAX_DISTANCE", "4"))
+
+# Локальный индекс привязанных фото. Признаки (цвет + градиенты) не отличают похожие
+# модели, поэтому без модели отвечаем только на почти то же фото (пережатое, обрезанное);
+# от PHOTO_INDEX_CONFIRM до порога — кандидат, которого модель должна подтвердить.
+# Подбор порогов по логу обращений (INTERACTION_LOG_PATH): python -m bench.threshold --index
+PHOTO_INDEX_PATH = os.getenv("PHOTO_INDEX_PATH", "photo_index.npz")
+PHOTO_INDEX_THRESHOLD = float(os.getenv("PHOTO_INDEX_THRESHOLD", "0.985"))
+PHOTO_INDEX_CONFIRM = float(os.getenv("PHOTO_INDEX_CONFIRM", "0.93"))
+PHOTO_INDEX_MARGIN = float(os.getenv("PHOTO_INDEX_MARGIN", "0.03"))
+
+# Фото для распознавания: минимальная сторона при выборе размера,
+# максимальная сторона и качество JPEG после уменьшения, лимит размера файла
+PHOTO_MIN_SIDE = int(os.getenv("PHOTO_MIN_SIDE", "512"))
+PHOTO_MAX_SIDE = int(os.getenv("PHOTO_MAX_SIDE", "1024"))
+PHOTO_JPEG_QUALITY = int(os.getenv("PHOTO_JPEG_QUALITY", "85"))
+PHOTO_MAX_BYTES = int(os.getenv("PHOTO_MAX_BYTES", str(10 * 1024 * 1024)))
+# detail для image_url: low/high/auto (low — фиксированная дешёвая цена по токенам)
+OPENAI_VISION_DETAIL = os.getenv("OPENAI_VISION_DETAIL", "auto")
+
+# Задержка (сек), за которую серия админ-правок склеивается в одну запись catalog.json
+CATALOG_WRITE_DELAY_SEC = float(os.getenv("CATALOG_WRITE_DELAY_SEC", "0.5"))
+
+# Карточка товара: сколько привязанных фото прикладывать (0 — только текст).
+# Фото уходят по сохранённым file_id — Telegram ничего не загружает заново
+ITEM_CARD_PHOTOS = int(os.getenv("ITEM_CARD_PHOTOS", "3"))
+# Товаров на одной странице каталога (/menu -> Каталог)
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "8"))
+
+# Массовый импорт (/import): лимит Bot API на скачивание файла — 20 МБ;
+# фото из zip загружаются в Telegram альбомами (до 10 в одном), чтобы получить file_id
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(20 * 1024 * 1024)))
+IMPORT_ALBUM_SIZE = 10
+IMPORT_UPLOAD_ATTEMPTS = 3
 
 # Модель для чата и для vision
 OPENAI_MODEL_TEXT = os.getenv("OPENAI_MODEL_TEXT", "gpt-4o-mini")
 OPENAI_MODEL_VISION = os.getenv("OPENAI_MODEL_VISION", "gpt-4o-mini")
 
+# Режим получения апдейтов: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").strip()  # публичный https://host, без пути
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", "8443")))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram").strip("/")
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN", "").strip()
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Сколько апдейтов обрабатывать одновременно (1 = последовательно, как раньше).
+# При >1 апдейты одного чата всё равно идут по очереди (BOT_PER_CHAT_ORDER=0 — отключить)
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "1"))
+BOT_PER_CHAT_ORDER = os.getenv("BOT_PER_CHAT_ORDER", "1").strip() not in ("0", "false", "no", "")
+# Сколько процессов-воркеров запускать за одним webhook (cluster.py; только BOT_MODE=webhook).
+# BOT_WORKER_ID выставляет сам cluster.py: воркер 0 — единственный, кто пишет каталог и индекс фото
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+BOT_WORKER_ID = int(os.getenv("BOT_WORKER_ID", "0"))
+if BOT_WORKER_ID:
+    # у каждого воркера свой файл кэша фото, иначе они перезаписывают записи друг друга
+    _base, _ext = os.path.splitext(VISION_CACHE_PATH)
+    VISION_CACHE_PATH = f"{_base}.w{BOT_WORKER_ID}{_ext}"
+    if INTERACTION_LOG_PATH:
+        _base, _ext = os.path.splitext(INTERACTION_LOG_PATH)
+        INTERACTION_LOG_PATH = f"{_base}.w{BOT_WORKER_ID}{_ext}"
+# Выбрасывать ли апдейты, пришедшие пока бот был выключен
+DROP_PENDING_UPDATES = os.getenv(
+    "DROP_PENDING_UPDATES", "1" if BOT_MODE == "polling" else "0"
+).strip() not in ("0", "false", "no", "")
+
+# Где хранить user_data и состояние оформления заказа: "" (только память), sqlite или redis.
+# Нужно, чтобы пережить рестарт и запускать несколько воркеров
+PERSISTENCE_BACKEND = os.getenv("PERSISTENCE_BACKEND", "").strip().lower()
+PERSISTENCE_SQLITE_PATH = os.getenv("PERSISTENCE_SQLITE_PATH", "bot_state.sqlite3")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Как часто PTB сбрасывает изменения в persistence и сколько ждать, собирая их в одну пачку
+PERSISTENCE_UPDATE_INTERVAL_SEC = float(os.getenv("PERSISTENCE_UPDATE_INTERVAL_SEC", "1"))
+PERSISTENCE_FLUSH_DELAY_SEC = float(os.getenv("PERSISTENCE_FLUSH_DELAY_SEC", "0.5"))
+# Перечитывать user_data перед каждым апдейтом (если чат могут обслуживать разные воркеры)
+PERSISTENCE_REFRESH = os.getenv("PERSISTENCE_REFRESH", "0").strip() not in ("0", "false", "no", "")
+
+# Таймаут одного запроса к OpenAI (сек) и максимум одновременных запросов
+OPENAI_TIMEOUT_SEC = float(os.getenv("OPENAI_TIMEOUT_SEC", "30"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+
+# Пул соединений к OpenAI, таймаут на установку соединения / ожидание свободного из пула
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", str(OPENAI_MAX_CONCURRENCY * 2)))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", str(OPENAI_MAX_CONCURRENCY)))
+OPENAI_CONNECT_TIMEOUT_SEC = float(os.getenv("OPENAI_CONNECT_TIMEOUT_SEC", "5"))
+# Повторы на 429/5xx/обрыв: пауза случайная в [0, min(MAX, BASE * 2^n)]
+OPENAI_RETRIES = int(os.getenv("OPENAI_RETRIES", "2"))
+OPENAI_RETRY_BASE_SEC = float(os.getenv("OPENAI_RETRY_BASE_SEC", "0.5"))
+OPENAI_RETRY_MAX_SEC = float(os.getenv("OPENAI_RETRY_MAX_SEC", "8"))
+# После N ошибок подряд запросы к OpenAI не отправляются RESET секунд (on_text — локальный поиск)
+OPENAI_BREAKER_FAILURES = int(os.getenv("OPENAI_BREAKER_FAILURES", "5"))
+OPENAI_BREAKER_RESET_SEC = float(os.getenv("OPENAI_BREAKER_RESET_SEC", "30"))
+# Прогрев при старте (post_init, до приёма апдейтов): снимок каталога, индексы,
+# сводки для промпта, первая страница каталога. SDK OpenAI импортируется и
+# соединение с API открывается уже в фоне (OPENAI_PREWARM=0 — только при первом запросе)
+BOT_PREWARM = os.getenv("BOT_PREWARM", "1").strip() not in ("0", "false", "no", "")
+OPENAI_PREWARM = os.getenv("OPENAI_PREWARM", "1").strip() not in ("0", "false", "no", "")
+# Фоновый прогрев (BM25, SDK OpenAI) стартует с задержкой: сначала — накопившиеся за рестарт
+# апдейты, иначе фоновый импорт делит с ними GIL и первые ответы медленнее
+BOT_PREWARM_BACKGROUND_DELAY_SEC = float(os.getenv("BOT_PREWARM_BACKGROUND_DELAY_SEC", "2"))
+
+# Лимиты запросов к ИИ (token bucket). Пользователь: AI_USER_BURST запросов подряд,
+# дальше AI_USER_RATE_PER_MIN в минуту; процесс (каждый воркер cluster.py отдельно):
+# AI_GLOBAL_RATE_PER_SEC с запасом AI_GLOBAL_BURST. 0 — лимит выключен
+AI_USER_RATE_PER_MIN = float(os.getenv("AI_USER_RATE_PER_MIN", "10"))
+AI_USER_BURST = float(os.getenv("AI_USER_BURST", "5"))
+AI_GLOBAL_RATE_PER_SEC = float(os.getenv("AI_GLOBAL_RATE_PER_SEC", "8"))
+AI_GLOBAL_BURST = float(os.getenv("AI_GLOBAL_BURST", "40"))
+# Сообщения, пришедшие, пока консультант отвечает, уходят в модель одним следующим запросом
+AI_COALESCE = os.getenv("AI_COALESCE", "1").strip() not in ("0", "false", "no", "")
+
+# Метрики Prometheus на http://METRICS_LISTEN:METRICS_PORT/metrics (0 — выключено).
+# В cluster.py у воркера N порт METRICS_PORT + N
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+
 # -----------------------------
 # ЛОГИ
 # -----------------------------
@@ -55,94 +241,261 @@ logger = logging.getLogger("magazin_sumok_bot")
 # -----------------------------
 # ИНИЦИАЛИЗАЦИЯ OpenAI
 # -----------------------------
+# Клиент (и импорт SDK, ~0.3 с) — при первом обращении или фоновым прогревом после старта
 client = None
-if OPENAI_API_KEY:
-    client = OpenAI(api_key=OPENAI_API_KEY)
+
+def openai_client() -> Any:
+    global client
+    if client is None and OPENAI_API_KEY:
+        client = make_openai_client(
+            OPENAI_API_KEY,
+            timeout=OPENAI_TIMEOUT_SEC,
+            connect_timeout=OPENAI_CONNECT_TIMEOUT_SEC,
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive=OPENAI_MAX_KEEPALIVE,
+        )
+    return client
+
+def openai_configured() -> bool:
+    # без создания клиента: ключ есть (или клиент подставлен, как в бенчмарках)
+    return client is not None or bool(OPENAI_API_KEY)
+
+# Ограничение параллельных запросов к OpenAI (общий лимит на процесс)
+openai_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+openai_breaker = CircuitBreaker(OPENAI_BREAKER_FAILURES, OPENAI_BREAKER_RESET_SEC)
+
+def openai_available() -> bool:
+    # есть ключ и провайдер не в «аварии» (breaker не открыт)
+    return openai_configured() and not openai_breaker.is_open
+
+ai_limiter = RateLimiter(AI_USER_RATE_PER_MIN / 60, AI_USER_BURST, AI_GLOBAL_RATE_PER_SEC, AI_GLOBAL_BURST)
+# одинаковое фото (file_unique_id), которое уже распознаётся, ждёт тот же результат
+photo_flights = SingleFlight()
+consultant_coalescer = Coalescer()
 
 # -----------------------------
-# СОСТОЯНИЯ ДЛЯ ОФОРМЛЕНИЯ ЗАКАЗА
+# КАТАЛОГ (общий на процесс, hot reload по mtime / версии в базе)
 # -----------------------------
-ORDER_NAME, ORDER_PHONE, ORDER_CITY, ORDER_ADDRESS, ORDER_COMMENT = range(5)
+json_writer = JsonWriter(delay=CATALOG_WRITE_DELAY_SEC)
+if CATALOG_BACKEND == "sqlite":
+    catalog_store = open_catalog(CATALOG_PATH, CATALOG_SQLITE_PATH, check_interval=CATALOG_RELOAD_CHECK_SEC)
+else:
+    catalog_store = CatalogStore(CATALOG_PATH, check_interval=CATALOG_RELOAD_CHECK_SEC, writer=json_writer)
+vision_cache = VisionCache(
+    VISION_CACHE_PATH,
+    max_entries=VISION_CACHE_MAX,
+    ttl=VISION_CACHE_TTL_SEC,
+    max_distance=VISION_HASH_MAX_DISTANCE,
+    writer=json_writer,
+)
+photo_index = PhotoIndex(PHOTO_INDEX_PATH, check_interval=CATALOG_RELOAD_CHECK_SEC)
 
 # -----------------------------
-# УТИЛИТЫ: JSON (каталог/заказы)
+# РОУТЕР НАМЕРЕНИЙ
 # -----------------------------
-def load_json(path: str, default: Any) -> Any:
+def load_intent_model() -> Optional[NaiveBayesIntents]:
+    if not INTENT_MODEL_PATH:
+        return None
     try:
-        if not os.path.exists(path):
-            return default
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        logger.exception("Ошибка чтения JSON %s: %s", path, e)
-        return default
+        model = NaiveBayesIntents.from_jsonl(INTENT_MODEL_PATH, min_prob=INTENT_MODEL_MIN_PROB)
+    except OSError as e:
+        logger.warning("Классификатор намерений не загружен (%s): %s", INTENT_MODEL_PATH, e)
+        return None
+    logger.info("Классификатор намерений: %s примеров из %s", len(model), INTENT_MODEL_PATH)
+    return model
+
+intent_router = IntentRouter(model=load_intent_model())
+
+class IntentFilter(filters.MessageFilter):
+    """Текст с намерением intent (только шаблоны) — например, вход в оформление заказа."""
+
+    def __init__(self, intent: str) -> None:
+        super().__init__(name=f"IntentFilter({intent})")
+        self.intent = intent
+
+    def filter(self, message: Message) -> bool:
+        return bool(message.text) and intent_router.match_patterns(message.text) == self.intent
+
+# -----------------------------
+# ЗАКАЗЫ (append-only журнал)
+# -----------------------------
+order_journal = OrderJournal(
+    ORDERS_JOURNAL_PATH,
+    fsync_every=ORDERS_FSYNC_EVERY,
+    fsync_interval=ORDERS_FSYNC_INTERVAL_SEC,
+)
 
-def save_json(path: str, data: Any) -> None:
+# -----------------------------
+# ЛОГ ОБРАЩЕНИЙ
+# -----------------------------
+interaction_log: Optional[InteractionLog] = None
+if INTERACTION_LOG_PATH:
+    interaction_log = InteractionLog(
+        INTERACTION_LOG_PATH,
+        max_bytes=INTERACTION_LOG_MAX_BYTES,
+        backups=INTERACTION_LOG_BACKUPS,
+        flush_interval=INTERACTION_LOG_FLUSH_SEC,
+    )
+
+# Запись о текущем обращении: хендлер и вложенные вызовы (OpenAI, поиск) дописывают в неё поля
+current_interaction: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_interaction", default=None)
+
+def note_interaction(**fields: Any) -> None:
+    record = current_interaction.get()
+    if record is not None:
+        record.update(fields)
+
+def interaction_record(update: Update, handler: str, redact_text: bool) -> Dict[str, Any]:
+    record: Dict[str, Any] = {
+        "ts": round(time.time(), 3),
+        "user_id": update.effective_user.id if update.effective_user else None,
+        "chat_id": update.effective_chat.id if update.effective_chat else None,
+        "handler": handler,
+    }
+    if update.callback_query is not None:
+        record["kind"] = "callback"
+        record["data"] = update.callback_query.data
+    elif update.message is not None and update.message.photo:
+        photo = update.message.photo[-1]
+        record["kind"] = "photo"
+        record["file_id"] = photo.file_id
+        record["file_unique_id"] = photo.file_unique_id
+    elif update.message is not None:
+        record["kind"] = "text"
+        # шаги оформления заказа — персональные данные, текст не пишем
+        record["text"] = None if redact_text else update.message.text
+    return record
+
+@contextlib.contextmanager
+def track_interaction(update: Update, handler: str, redact_text: bool = False):
+    """Запись в логе обращений на время блока: задержка, ошибка и всё, что добавит note_interaction."""
+    if interaction_log is None or current_interaction.get() is not None:
+        # вложенный вызов (on_text -> on_menu_word) пишется в запись внешнего хендлера
+        yield current_interaction.get()
+        return
+    record = interaction_record(update, handler, redact_text)
+    token = current_interaction.set(record)
+    t0 = time.perf_counter()
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        yield record
     except Exception as e:
-        logger.exception("Ошибка записи JSON %s: %s", path, e)
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["latency_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        current_interaction.reset(token)
+        interaction_log.write(record)
+
+def logged_interaction(func=None, *, redact_text: bool = False):
+    """
+    Хендлер клиента: метрики (timed_handler) + строка в логе обращений
+    с задержкой, найденным товаром, уверенностью и токенами.
+    """
+    if func is None:
+        return functools.partial(logged_interaction, redact_text=redact_text)
+    timed = timed_handler(func)
+
+    @functools.wraps(func)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Any:
+        with track_interaction(update, func.__name__, redact_text):
+            return await timed(update, context)
 
-def load_catalog() -> Dict[str, Any]:
-    return load_json(CATALOG_PATH, {"items": []})
+    return wrapper
+
+def ai_rate_limit(update: Update, kind: str) -> None:
+    """Бросает RateLimitedError, если у пользователя (или у всего бота) кончились запросы к ИИ."""
+    wait = ai_limiter.acquire(update.effective_user.id if update.effective_user else None)
+    if wait:
+        AI_RATE_LIMITED.inc(kind=kind)
+        note_interaction(rate_limited=True)
+        raise RateLimitedError(wait)
+
+# -----------------------------
+# СОСТОЯНИЯ ДЛЯ ОФОРМЛЕНИЯ ЗАКАЗА
+# -----------------------------
+ORDER_NAME, ORDER_PHONE, ORDER_CITY, ORDER_ADDRESS, ORDER_COMMENT = range(5)
+
+# -----------------------------
+# УТИЛИТЫ: JSON (каталог/заказы)
+# -----------------------------
+def load_catalog() -> CatalogSnapshot:
+    # Без чтения диска: снимок из памяти, перечитывается только при изменении файла
+    return catalog_store.snapshot()
 
 def save_catalog(cat: Dict[str, Any]) -> None:
-    save_json(CATALOG_PATH, cat)
+    catalog_store.replace(cat)
 
 def load_orders() -> Dict[str, Any]:
-    return load_json(ORDERS_PATH, {"orders": []})
+    return {"orders": order_journal.read_all()}
+
+def append_order(order: Dict[str, Any]) -> None:
+    order_journal.append(order)
 
-def save_orders(data: Dict[str, Any]) -> None:
-    save_json(ORDERS_PATH, data)
+def export_orders() -> int:
+    return order_journal.export(ORDERS_PATH)
 
 def is_admin(user_id: int) -> bool:
     # Если ADMIN_IDS не задан — админом считаем НИКОГО (безопасно).
     return user_id in ADMIN_IDS
 
-def normalize_text(s: str) -> str:
-    return (s or "").strip().lower()
-
 def catalog_brief(items: List[Dict[str, Any]]) -> str:
-    # Короткое описание каталога для промпта
+    # Короткое описание каталога для промпта; тот же предел, что и у «полного каталога»
+    # консультанта — иначе ему обещан весь каталог, а видна только часть
     lines = []
-    for it in items[:80]:
+    for it in items[:CATALOG_BRIEF_FULL_MAX]:
         lines.append(
             f"- id: {it.get('id')} | name: {it.get('name')} | price_kzt: {it.get('price_kzt')} | "
             f"colors: {', '.join(it.get('colors', [])[:8])} | keywords: {', '.join(it.get('keywords', [])[:10])}"
         )
     return "\n".join(lines)
 
-def find_item_by_id(items: List[Dict[str, Any]], item_id: str) -> Optional[Dict[str, Any]]:
-    for it in items:
-        if str(it.get("id", "")).strip() == str(item_id).strip():
-            return it
-    return None
+_brief_cache: Dict[str, str] = {}
+
+def cached_catalog_brief(cat: CatalogSnapshot) -> str:
+    # Рендерим один раз на версию каталога: одинаковый текст = одинаковый префикс промпта
+    brief = _brief_cache.get(cat.version)
+    if brief is None:
+        _brief_cache.clear()
+        brief = _brief_cache[cat.version] = catalog_brief(cat.items)
+    return brief
+
+_stats_cache: Dict[str, str] = {}
+
+def cached_catalog_stats(cat: CatalogSnapshot) -> str:
+    # Сводка для большого каталога: размер и диапазон цен (стабильна в пределах версии)
+    stats = _stats_cache.get(cat.version)
+    if stats is None:
+        prices = sorted(p for p in (it.get("price_kzt") for it in cat.items) if isinstance(p, (int, float)))
+        lines = [f"Всего моделей: {len(cat.items)}"]
+        if prices:
+            lines.append(
+                f"Цены, ₸: от {prices[0]} до {prices[-1]}, медиана {prices[len(prices) // 2]}, "
+                f"четверти {prices[len(prices) // 4]} / {prices[(3 * len(prices)) // 4]}"
+            )
+        lines.append("Подходящие под запрос модели перечислены в сообщении клиента.")
+        _stats_cache.clear()
+        stats = _stats_cache[cat.version] = "\n".join(lines)
+    return stats
+
+def relevant_items(cat: CatalogSnapshot, text: str, k: int) -> List[Dict[str, Any]]:
+    search = getattr(catalog_store, "search", None)
+    if search is not None:
+        # SQLite: FTS5 в базе вместо BM25-индекса в памяти
+        found = [it for it in (cat.index.by_id.get(i) for i in search(text, k)) if it is not None]
+    else:
+        found = cat.index.bm25.search(text, k)
+    if not found:
+        # ничего не нашлось по словам — берём начало каталога
+        found = list(cat.items[:k])
+    return found
 
-def find_item_by_model_text(items: List[Dict[str, Any]], text: str) -> Optional[Dict[str, Any]]:
-    t = normalize_text(text)
-    if not t:
-        return None
-    # Сначала точные совпадения по имени/id
-    for it in items:
-        if normalize_text(it.get("id", "")) == t:
-            return it
-        if normalize_text(it.get("name", "")) == t:
-            return it
-
-    # Затем по ключевым словам
-    for it in items:
-        kws = [normalize_text(x) for x in it.get("keywords", [])]
-        if any(k and k in t for k in kws):
-            return it
-
-    # Частичное совпадение имени
-    for it in items:
-        name = normalize_text(it.get("name", ""))
-        if name and name in t:
-            return it
-
-    return None
+def find_item_by_id(cat: CatalogSnapshot, item_id: str) -> Optional[Dict[str, Any]]:
+    return cat.index.by_id.get(str(item_id).strip())
+
+def find_item_by_model_text(cat: CatalogSnapshot, text: str) -> Optional[Dict[str, Any]]:
+    # Приоритет: точное имя/id -> ключевые слова -> частичное совпадение имени.
+    # Все подстроки ищутся за один проход (Aho–Corasick по индексу снимка).
+    return cat.index.find_by_text(text)
 
 def format_item_card(item: Dict[str, Any]) -> str:
     name = item.get("name", "—")
@@ -158,6 +511,112 @@ def format_item_card(item: Dict[str, Any]) -> str:
 
     return f"✅ Модель: {name}\n💰 Цена: {price} ₸{colors_line}{desc_line}"
 
+DELIVERY_TEXT = (
+    "🚚 Доставка:\n"
+    "• По городу: 1–2 дня\n"
+    "• По Казахстану: 2–5 дней\n\n"
+    "Напишите ваш город — подскажу точнее."
+)
+
+# -----------------------------
+# КАРТОЧКА ТОВАРА С ФОТО
+# -----------------------------
+CAPTION_LIMIT = 1024
+
+# file_id, которые Telegram не принял (фото удалено, id от другого бота) — больше не пробуем
+dead_file_ids: Set[str] = set()
+# остальные фото альбома, который не прошёл, когда первое фото отдельно прошло:
+# какое из них битое, неизвестно — в карточках их тоже не шлём, чтобы не платить
+# за каждый показ отказом альбома и повторной отправкой
+suspect_file_ids: Set[str] = set()
+# sendMediaGroup: «failed to send message #2 with the error message …» — номер фото с 1
+MEDIA_GROUP_ERROR_RE = re.compile(r"message #(\d+)")
+
+def card_photos(item: Dict[str, Any]) -> List[str]:
+    if ITEM_CARD_PHOTOS <= 0:
+        return []
+    fids = [
+        f for f in item.get("photo_file_ids", ()) or () if f not in dead_file_ids and f not in suspect_file_ids
+    ]
+    return fids[:ITEM_CARD_PHOTOS]
+
+async def send_item_card(update: Update, item: Dict[str, Any], placeholder: Optional[Message] = None) -> None:
+    """
+    Карточка с привязанными фото: одно фото — с подписью, несколько — одним альбомом.
+    Без фото (или если Telegram их не принял) — текстом, как раньше.
+    """
+    text = format_item_card(item)
+    photos = card_photos(item) if len(text) <= CAPTION_LIMIT else []
+    message = update.effective_message
+    suspects: List[str] = []
+    while photos:
+        try:
+            if len(photos) == 1:
+                await message.reply_photo(photos[0], caption=text)
+            else:
+                await message.reply_media_group(
+                    [InputMediaPhoto(fid, caption=text if n == 0 else None) for n, fid in enumerate(photos)]
+                )
+        except BadRequest as e:
+            logger.warning("Фото товара %s не отправлены: %s", item.get("id"), e)
+            if len(photos) == 1:
+                dead_file_ids.add(photos[0])
+                photos = []
+                continue
+            failed = MEDIA_GROUP_ERROR_RE.search(str(e))
+            if failed and 1 <= int(failed.group(1)) <= len(photos):
+                # Telegram назвал битое фото — альбом без него
+                dead_file_ids.add(photos.pop(int(failed.group(1)) - 1))
+            else:
+                # неизвестно, какое — пробуем одно первое фото, затем текст
+                suspects, photos = photos[1:], photos[:1]
+            continue
+        if suspects:
+            suspect_file_ids.update(suspects)
+        note_interaction(card_photos=len(photos))
+        if placeholder is not None:
+            with contextlib.suppress(BadRequest):
+                await placeholder.delete()
+        return
+    await reply_or_edit(update, text, placeholder)
+
+# -----------------------------
+# КАТАЛОГ ПО СТРАНИЦАМ
+# -----------------------------
+def render_catalog_page(cat: CatalogSnapshot, page: int) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    items = cat.items
+    if not items:
+        return "Каталог пока пуст.", None
+    pages = (len(items) + CATALOG_PAGE_SIZE - 1) // CATALOG_PAGE_SIZE
+    page = min(max(page, 0), pages - 1)
+    chunk = items[page * CATALOG_PAGE_SIZE:(page + 1) * CATALOG_PAGE_SIZE]
+    title = "📦 Каталог:" if pages == 1 else f"📦 Каталог (стр. {page + 1}/{pages}):"
+    lines = [title]
+    kb = []
+    for it in chunk:
+        mark = " 📷" if it.get("photo_file_ids") else ""
+        lines.append(f"• {it.get('name')} — {it.get('price_kzt')} ₸{mark}")
+        data = f"cat_item:{str(it.get('id', '')).strip()}"
+        # callback_data — не длиннее 64 байт; товар с длинным id остаётся в списке без кнопки
+        if len(data.encode("utf-8")) <= 64:
+            kb.append([InlineKeyboardButton(f"{it.get('name')} — {it.get('price_kzt')} ₸", callback_data=data)])
+    if pages > 1:
+        kb.append([
+            InlineKeyboardButton("◀️", callback_data=f"cat_page:{(page - 1) % pages}"),
+            InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="cat_noop"),
+            InlineKeyboardButton("▶️", callback_data=f"cat_page:{(page + 1) % pages}"),
+        ])
+    lines.append("\nНажмите на модель — покажу фото и цену.")
+    return "\n".join(lines), InlineKeyboardMarkup(kb)
+
+def catalog_page(cat: CatalogSnapshot, page: int) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    # страница собирается один раз на версию каталога, дальше — из кэша снимка
+    return cat.rendered(("catalog_page", CATALOG_PAGE_SIZE, page), lambda: render_catalog_page(cat, page))
+
+async def send_catalog(message: Message, cat: CatalogSnapshot) -> None:
+    text, markup = catalog_page(cat, 0)
+    await message.reply_text(text, reply_markup=markup)
+
 # -----------------------------
 # КНОПКИ / МЕНЮ
 # -----------------------------
@@ -175,40 +634,183 @@ def menu_keyboard() -> InlineKeyboardMarkup:
 # OpenAI: VISION MATCH
 # -----------------------------
 async def download_photo_bytes(update: Update) -> Optional[bytes]:
+    """
+    Берёт самый маленький размер фото, которого хватает для распознавания,
+    качает его в память и возвращает уменьшенный JPEG (см. download_file_jpeg).
+    """
     if not update.message or not update.message.photo:
         return None
-    photo = update.message.photo[-1]
+    photo = pick_photo_size(update.message.photo, PHOTO_MIN_SIDE, PHOTO_MAX_BYTES)
     file = await photo.get_file()
-    b = await file.download_as_bytearray()
-    return bytes(b)
+    return await download_file_jpeg(file)
 
-def b64_image(image_bytes: bytes) -> str:
-    return base64.b64encode(image_bytes).decode("utf-8")
+async def download_file_jpeg(file) -> Optional[bytes]:
+    buf = io.BytesIO()
+    await file.download_to_memory(out=buf)
+    return await asyncio.to_thread(downscale_jpeg, buf, PHOTO_MAX_SIDE, PHOTO_JPEG_QUALITY)
 
-def exact_match_by_file_id(items: List[Dict[str, Any]], telegram_file_id: str) -> Optional[Dict[str, Any]]:
-    for it in items:
-        fids = it.get("photo_file_ids", []) or []
-        if telegram_file_id in fids:
-            return it
-    return None
+def exact_match_by_file_id(cat: CatalogSnapshot, telegram_file_id: str) -> Optional[Dict[str, Any]]:
+    return cat.index.by_file_id.get(telegram_file_id)
+
+# -----------------------------
+# ЛОКАЛЬНЫЙ ИНДЕКС ФОТО (без модели)
+# -----------------------------
+async def index_photo(item_id: str, file_id: str, image_bytes: Optional[bytes]) -> bool:
+    if not photo_index.enabled or not image_bytes or photo_index.has_file(file_id):
+        return False
+    vec = await asyncio.to_thread(image_features, image_bytes)
+    if vec is None:
+        return False
+    await asyncio.to_thread(photo_index.add, item_id, file_id, vec)
+    return True
+
+async def local_photo_match(
+    cat: CatalogSnapshot, image_bytes: bytes
+) -> Tuple[Optional[Tuple[Optional[str], float, str]], Optional[str]]:
+    """
+    (результат, кандидат): результат — только почти то же фото (score >= PHOTO_INDEX_THRESHOLD);
+    кандидат — похожее фото, которое должна подтвердить модель.
+    """
+    photo_index.refresh()
+    if not photo_index.enabled or not len(photo_index):
+        return None, None
+    vec = await asyncio.to_thread(image_features, image_bytes)
+    if vec is None:
+        return None, None
+    item_id, score, second = photo_index.search(vec, allowed_ids=set(cat.index.by_id))
+    if not item_id:
+        return None, None
+    # для офлайн-подбора порогов: сравнить с ответом модели (bench/threshold.py --index)
+    note_interaction(index_item_id=item_id, index_score=round(score, 4))
+    if score - second < PHOTO_INDEX_MARGIN:
+        return None, None
+    if score >= PHOTO_INDEX_THRESHOLD:
+        return (item_id, score, "совпадение с привязанным фото"), item_id
+    if score >= PHOTO_INDEX_CONFIRM:
+        return None, item_id
+    return None, None
+
+async def backfill_photo_index(app) -> None:
+    # фото, привязанные раньше (или до появления индекса), докачиваем и индексируем
+    if not photo_index.enabled:
+        return
+    added = 0
+    for it in load_catalog().items:
+        item_id = str(it.get("id", "")).strip()
+        for file_id in it.get("photo_file_ids", []) or []:
+            if photo_index.has_file(file_id):
+                continue
+            try:
+                file = await app.bot.get_file(file_id)
+                image_bytes = await download_file_jpeg(file)
+                added += await index_photo(item_id, file_id, image_bytes)
+            except Exception as e:
+                logger.warning("Не удалось проиндексировать фото %s (%s): %s", file_id, item_id, e)
+    if added:
+        logger.info("Индекс фото: добавлено %s, всего %s", added, len(photo_index))
 
 def ensure_openai() -> None:
-    if client is None:
+    if openai_client() is None:
         raise RuntimeError("OPENAI_API_KEY не задан. Добавь переменную OPENAI_API_KEY в Railway.")
 
-async def match_bag_with_openai(items: List[Dict[str, Any]], image_bytes: bytes) -> Tuple[Optional[str], float, str]:
+async def openai_chat_completion(kind: str = "other", **kwargs: Any) -> Any:
+    """
+    Асинхронный вызов chat.completions с лимитом параллельности и таймаутом.
+    Не блокирует event loop; при отмене хендлера запрос тоже отменяется.
+    kind — метка для метрик (vision / consultant).
+    Повторы на 429/5xx с jitter; при открытом breaker — сразу CircuitOpenError.
+    """
+    async def attempt() -> Any:
+        # слот семафора держим только на время самой попытки, не на паузу между ними
+        async with openai_semaphore:
+            with OPENAI_SECONDS.time(kind=kind):
+                return await asyncio.wait_for(
+                    openai_client().chat.completions.create(**kwargs),
+                    timeout=OPENAI_TIMEOUT_SEC,
+                )
+
+    return await retrying(attempt, kind)
+
+async def retrying(attempt: Callable[[], Awaitable[Any]], kind: str) -> Any:
+    try:
+        return await call_with_retries(
+            attempt,
+            breaker=openai_breaker,
+            retries=OPENAI_RETRIES,
+            base_delay=OPENAI_RETRY_BASE_SEC,
+            max_delay=OPENAI_RETRY_MAX_SEC,
+            on_retry=lambda e: OPENAI_ERRORS.inc(kind=kind, error=type(e).__name__),
+        )
+    except Exception as e:
+        OPENAI_ERRORS.inc(kind=kind, error=type(e).__name__)
+        raise
+
+# -----------------------------
+# OpenAI: ОБЩИЙ ПРЕФИКС ПРОМПТА И УЧЁТ ТОКЕНОВ
+# -----------------------------
+# Большая стабильная часть (правила + каталог) идёт первым system-сообщением,
+# одинаковым для фото и для консультанта: провайдер кэширует такой префикс.
+SHOP_SYSTEM_PROMPT = (
+    "Ты — виртуальный менеджер магазина сумок.\n"
+    "Общие правила:\n"
+    "- Не придумывай цены, модели и наличие. Используй только каталог ниже.\n"
+    "- Нельзя выбирать модель случайно.\n"
+)
+
+def prefix_messages(cat: CatalogSnapshot, full_catalog: bool = True) -> List[Dict[str, Any]]:
+    if full_catalog:
+        catalog = "\nКаталог (кратко):\n" + cached_catalog_brief(cat)
+    else:
+        catalog = "\nКаталог (сводка):\n" + cached_catalog_stats(cat)
+    return [{"role": "system", "content": SHOP_SYSTEM_PROMPT + catalog}]
+
+# Накопленное потребление токенов по типу запроса (vision / consultant)
+ai_usage: Dict[str, Dict[str, int]] = {}
+
+def record_usage(kind: str, usage: Any) -> None:
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None) or {}
+    if isinstance(details, dict):
+        cached = details.get("cached_tokens") or 0
+    else:
+        cached = getattr(details, "cached_tokens", 0) or 0
+    stats = ai_usage.setdefault(kind, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0})
+    stats["calls"] += 1
+    stats["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+    stats["cached_tokens"] += cached
+    stats["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+    OPENAI_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, kind=kind, type="prompt")
+    OPENAI_TOKENS.inc(cached, kind=kind, type="cached")
+    OPENAI_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, kind=kind, type="completion")
+    record = current_interaction.get()
+    if record is not None:
+        tokens = record.setdefault("tokens", {"prompt": 0, "cached": 0, "completion": 0})
+        tokens["prompt"] += getattr(usage, "prompt_tokens", 0) or 0
+        tokens["cached"] += cached
+        tokens["completion"] += getattr(usage, "completion_tokens", 0) or 0
+    logger.info(
+        "OpenAI %s: prompt=%s (cached=%s) completion=%s",
+        kind, getattr(usage, "prompt_tokens", 0), cached, getattr(usage, "completion_tokens", 0),
+    )
+
+VISION_PARSE_ERROR = "Не удалось распарсить ответ модели"
+
+async def match_bag_with_openai(
+    cat: CatalogSnapshot, image_bytes: bytes, candidate: Optional[str] = None
+) -> Tuple[Optional[str], float, str]:
     """
     Возвращает: (item_id или None, confidence 0..1, короткое объяснение)
+    candidate — товар, на который похоже фото по локальному индексу; модель его проверяет.
     """
     ensure_openai()
 
-    brief = catalog_brief(items)
-    img_b64 = b64_image(image_bytes)
+    with stage("base64"):
+        image_url = jpeg_data_url(image_bytes)
 
     sys = (
-        "Ты ассистент магазина сумок. Твоя задача — сопоставить фото сумки с одним товаром из каталога.\n"
+        "Задача: сопоставить фото сумки с одним товаром из каталога.\n"
         "ВАЖНО: если не уверен, верни NONE.\n"
-        "Нельзя придумывать модель. Нельзя выбирать случайно.\n"
         "Верни строго JSON по схеме:\n"
         "{"
         '  "match_id": "ID_ИЛИ_NONE",'
@@ -219,50 +821,56 @@ async def match_bag_with_openai(items: List[Dict[str, Any]], image_bytes: bytes)
     )
 
     user_text = (
-        "Каталог (кратко):\n"
-        f"{brief}\n\n"
-        "Сопоставь сумку на фото с одним из товаров. Если точного совпадения нет — match_id = NONE.\n"
+        "Сопоставь сумку на фото с одним из товаров каталога. Если точного совпадения нет — match_id = NONE.\n"
         "Верни JSON."
     )
+    if candidate:
+        # подсказка — после общего префикса: кэш промпта не ломается
+        user_text += (
+            f"\nПо привязанным фото похоже на {candidate}. Выбери его, только если на фото "
+            "точно та же модель; иначе — другой ID или NONE."
+        )
 
-    resp = client.chat.completions.create(
-        model=OPENAI_MODEL_VISION,
-        messages=[
-            {"role": "system", "content": sys},
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": user_text},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_b64}"}},
-                ],
-            },
-        ],
-        response_format={"type": "json_object"},
-        temperature=0.2,
-    )
+    with stage("model"):
+        resp = await openai_chat_completion(
+            kind="vision",
+            model=OPENAI_MODEL_VISION,
+            messages=prefix_messages(cat) + [
+                {"role": "system", "content": sys},
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": user_text},
+                        {"type": "image_url", "image_url": {"url": image_url, "detail": OPENAI_VISION_DETAIL}},
+                    ],
+                },
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.2,
+        )
+    record_usage("vision", getattr(resp, "usage", None))
 
     raw = resp.choices[0].message.content or "{}"
-    try:
-        data = json.loads(raw)
-        match_id = data.get("match_id")
-        conf = float(data.get("confidence", 0.0))
-        reason = str(data.get("reason", "")).strip()
-        if not match_id or str(match_id).upper() == "NONE" or conf < 0.80:
-            return None, conf, reason
-        return str(match_id), conf, reason
-    except Exception:
-        return None, 0.0, "Не удалось распарсить ответ модели"
+    with stage("parse"):
+        try:
+            data = json.loads(raw)
+            match_id = data.get("match_id")
+            conf = float(data.get("confidence", 0.0))
+            reason = str(data.get("reason", "")).strip()
+            # сырой ответ модели (и ниже порога) — для офлайн-подбора порога 0.80
+            note_interaction(model_match_id=match_id, model_confidence=conf)
+            if not match_id or str(match_id).upper() == "NONE" or conf < 0.80:
+                return None, conf, reason
+            return str(match_id), conf, reason
+        except Exception:
+            return None, 0.0, VISION_PARSE_ERROR
 
 # -----------------------------
 # OpenAI: ИИ-КОНСУЛЬТАНТ
 # -----------------------------
-async def ai_consultant_answer(items: List[Dict[str, Any]], user_text: str) -> str:
-    ensure_openai()
-
-    brief = catalog_brief(items)
-
+def consultant_messages(cat: CatalogSnapshot, user_text: str) -> List[Dict[str, Any]]:
     sys = (
-        "Ты — вежливый виртуальный менеджер магазина сумок.\n"
+        "Задача: ответить клиенту как вежливый менеджер.\n"
         "Правила:\n"
         "1) Отвечай ТОЛЬКО по-русски.\n"
         "2) Не придумывай цены, модели и наличие. Используй только каталог.\n"
@@ -272,36 +880,108 @@ async def ai_consultant_answer(items: List[Dict[str, Any]], user_text: str) -> s
     )
 
     user = (
-        "Каталог (кратко):\n"
-        f"{brief}\n\n"
         f"Сообщение клиента:\n{user_text}\n\n"
         "Ответь как менеджер. Если нужна модель/фото — попроси."
     )
 
-    resp = client.chat.completions.create(
+    # Большой каталог целиком не влезает: только релевантные товары, размер промпта постоянный
+    full_catalog = len(cat.items) <= CATALOG_BRIEF_FULL_MAX
+    if not full_catalog:
+        found = relevant_items(cat, user_text, CATALOG_RETRIEVAL_TOP_K)
+        user = f"Подходящие модели из каталога:\n{catalog_brief(found)}\n\n" + user
+
+    return prefix_messages(cat, full_catalog=full_catalog) + [
+        {"role": "system", "content": sys},
+        {"role": "user", "content": user},
+    ]
+
+async def ai_consultant_answer(cat: CatalogSnapshot, user_text: str) -> str:
+    ensure_openai()
+
+    resp = await openai_chat_completion(
+        kind="consultant",
         model=OPENAI_MODEL_TEXT,
-        messages=[
-            {"role": "system", "content": sys},
-            {"role": "user", "content": user},
-        ],
+        messages=consultant_messages(cat, user_text),
         temperature=0.4,
     )
+    record_usage("consultant", getattr(resp, "usage", None))
     return (resp.choices[0].message.content or "").strip()
 
+async def ai_consultant_stream(cat: CatalogSnapshot, user_text: str) -> AsyncIterator[str]:
+    """
+    То же, что ai_consultant_answer, но отдаёт текст кусками по мере генерации.
+    Таймаут OPENAI_TIMEOUT_SEC действует на ожидание каждого следующего куска.
+    """
+    ensure_openai()
+
+    messages = consultant_messages(cat, user_text)
+
+    async def attempt() -> Any:
+        # слот семафора берётся на попытку и при успехе остаётся за потоком до его конца
+        await openai_semaphore.acquire()
+        try:
+            return await asyncio.wait_for(
+                openai_client().chat.completions.create(
+                    model=OPENAI_MODEL_TEXT,
+                    messages=messages,
+                    temperature=0.4,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                ),
+                timeout=OPENAI_TIMEOUT_SEC,
+            )
+        except BaseException:
+            openai_semaphore.release()
+            raise
+
+    t0 = time.perf_counter()
+    first = True
+    # повторяем только открытие потока: после первого куска повтор задублировал бы текст
+    stream = await retrying(attempt, "consultant")
+    try:
+        chunks = stream.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=OPENAI_TIMEOUT_SEC)
+                except StopAsyncIteration:
+                    break
+                if getattr(chunk, "usage", None):
+                    record_usage("consultant", chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first:
+                        OPENAI_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - t0, kind="consultant")
+                        first = False
+                    yield chunk.choices[0].delta.content
+            OPENAI_SECONDS.observe(time.perf_counter() - t0, kind="consultant")
+        except Exception as e:
+            OPENAI_ERRORS.inc(kind="consultant", error=type(e).__name__)
+            openai_breaker.record_failure()
+            raise
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                await close()
+    finally:
+        openai_semaphore.release()
+
 # -----------------------------
 # ХЕНДЛЕРЫ
 # -----------------------------
+START_TEXT = (
+    "Здравствуйте! Я виртуальный менеджер магазина сумок 👜\n\n"
+    "Напишите, что вам нужно:\n"
+    "• «цена» / «сколько стоит?»\n"
+    "• пришлите фото сумки — скажу модель и цену\n"
+    "• или напишите название модели\n\n"
+    "Если нужно меню — напишите «меню» или команду /menu."
+)
+
+@logged_interaction
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    text = (
-        "Здравствуйте! Я виртуальный менеджер магазина сумок 👜\n\n"
-        "Напишите, что вам нужно:\n"
-        "• «цена» / «сколько стоит?»\n"
-        "• пришлите фото сумки — скажу модель и цену\n"
-        "• или напишите название модели\n\n"
-        "Если нужно меню — напишите «меню» или команду /menu."
-    )
-    await update.message.reply_text(text)
+    await update.message.reply_text(START_TEXT)
 
+@logged_interaction
 async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     text = (
         "Команды:\n"
@@ -312,23 +992,26 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "/add — добавить товар\n"
         "/bind — привязать фото к товару\n"
         "/list — список товаров\n"
+        "/import — загрузить товары из CSV/JSON и фото из zip\n"
+        "/orders_export — выгрузить заказы в orders.json\n"
     )
     await update.message.reply_text(text)
 
+@logged_interaction
 async def cmd_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text("Выберите действие:", reply_markup=menu_keyboard())
 
+@logged_interaction
 async def on_menu_word(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # если пользователь написал "меню"
     await update.message.reply_text("Выберите действие:", reply_markup=menu_keyboard())
 
+@logged_interaction
 async def on_menu_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     q = update.callback_query
     await q.answer()
 
     data = q.data
-    cat = load_catalog()
-    items = cat.get("items", [])
 
     if data == "menu_price":
         context.user_data["mode"] = "price"
@@ -338,22 +1021,11 @@ async def on_menu_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         return
 
     if data == "menu_catalog":
-        if not items:
-            await q.message.reply_text("Каталог пока пуст.")
-            return
-        lines = ["📦 Каталог:"]
-        for it in items[:30]:
-            lines.append(f"• {it.get('name')} — {it.get('price_kzt')} ₸")
-        await q.message.reply_text("\n".join(lines))
+        await send_catalog(q.message, load_catalog())
         return
 
     if data == "menu_delivery":
-        await q.message.reply_text(
-            "🚚 Доставка:\n"
-            "• По городу: 1–2 дня\n"
-            "• По Казахстану: 2–5 дней\n\n"
-            "Напишите ваш город — подскажу точнее."
-        )
+        await q.message.reply_text(DELIVERY_TEXT)
         return
 
     if data == "menu_order":
@@ -367,9 +1039,35 @@ async def on_menu_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         )
         return
 
+@logged_interaction
+async def on_catalog_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # cat_page:N — листаем (правим то же сообщение), cat_item:ID — карточка с фото
+    q = update.callback_query
+    await q.answer()
+    cat = load_catalog()
+    action, _, arg = q.data.partition(":")
+
+    if action == "cat_page":
+        text, markup = catalog_page(cat, int(arg) if arg.isdigit() else 0)
+        try:
+            await q.message.edit_text(text, reply_markup=markup)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+        return
+
+    if action == "cat_item":
+        item = find_item_by_id(cat, arg)
+        note_interaction(item_id=arg, source="catalog")
+        if item is None:
+            await q.message.reply_text("Эта модель уже не в каталоге. Откройте каталог заново: «меню» → Каталог.")
+            return
+        await send_item_card(update, item)
+
 # -----------------------------
 # ОФОРМЛЕНИЕ ЗАКАЗА (Conversation)
 # -----------------------------
+@logged_interaction
 async def start_order(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     # может прийти как callback_query, так и message
     if update.callback_query:
@@ -378,42 +1076,53 @@ async def start_order(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         msg = update.message
 
     context.user_data["order"] = {}
+    if update.message is not None and update.message.text and not update.message.text.startswith("/"):
+        # вход по тексту (IntentFilter("order")): «хочу заказать Ariana Classic» — модель сразу в заявку
+        INTENTS.inc(intent="order", via="pattern")
+        note_interaction(intent="order")
+        item = find_item_by_model_text(load_catalog(), update.message.text)
+        if item:
+            context.user_data["order"]["item_id"] = item.get("id")
+            note_interaction(item_id=item.get("id"))
     await msg.reply_text("Как вас зовут?")
     return ORDER_NAME
 
+@logged_interaction(redact_text=True)
 async def order_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data["order"]["name"] = update.message.text.strip()
     await update.message.reply_text("Ваш номер телефона? (пример: +7 777 123 45 67)")
     return ORDER_PHONE
 
+@logged_interaction(redact_text=True)
 async def order_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data["order"]["phone"] = update.message.text.strip()
     await update.message.reply_text("Ваш город?")
     return ORDER_CITY
 
+@logged_interaction(redact_text=True)
 async def order_city(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data["order"]["city"] = update.message.text.strip()
     await update.message.reply_text("Адрес доставки или удобный ориентир?")
     return ORDER_ADDRESS
 
+@logged_interaction(redact_text=True)
 async def order_address(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data["order"]["address"] = update.message.text.strip()
     await update.message.reply_text("Комментарий к заказу (какая модель/цвет/пожелания)?")
     return ORDER_COMMENT
 
+@logged_interaction(redact_text=True)
 async def order_comment(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data["order"]["comment"] = update.message.text.strip()
 
-    # сохраним заказ
-    orders = load_orders()
-    orders["orders"].append(
+    # сохраним заказ (дозапись одной строки в журнал)
+    append_order(
         {
             "user_id": update.effective_user.id,
             "username": update.effective_user.username,
             **context.user_data["order"],
         }
     )
-    save_orders(orders)
 
     await update.message.reply_text(
         "✅ Заявка принята!\n"
@@ -423,6 +1132,7 @@ async def order_comment(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     context.user_data["mode"] = None
     return ConversationHandler.END
 
+@logged_interaction
 async def order_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data["order"] = {}
     await update.message.reply_text("Оформление заказа отменено. Напишите «меню», если нужно.")
@@ -431,12 +1141,12 @@ async def order_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 # -----------------------------
 # АДМИН: добавление товара и привязка фото
 # -----------------------------
+@timed_handler
 async def cmd_list(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not is_admin(update.effective_user.id):
         await update.message.reply_text("Команда доступна только администратору.")
         return
-    cat = load_catalog()
-    items = cat.get("items", [])
+    items = load_catalog().items
     if not items:
         await update.message.reply_text("Каталог пуст.")
         return
@@ -445,6 +1155,21 @@ async def cmd_list(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         lines.append(f"- id: {it.get('id')} | {it.get('name')} | {it.get('price_kzt')} ₸")
     await update.message.reply_text("\n".join(lines))
 
+@timed_handler
+async def cmd_orders_export(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /orders_export -> собирает журнал заказов в orders.json ({"orders": [...]}) и присылает файл
+    """
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("Команда доступна только администратору.")
+        return
+
+    count = await asyncio.to_thread(export_orders)
+    with open(ORDERS_PATH, "rb") as f:
+        await update.message.reply_document(f, filename=os.path.basename(ORDERS_PATH))
+    await update.message.reply_text(f"✅ Выгружено заказов: {count}")
+
+@timed_handler
 async def cmd_add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     /add id|Название|цена|цвет1,цвет2|ключ1,ключ2|описание
@@ -487,14 +1212,11 @@ async def cmd_add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if len(parts) >= 6:
         desc = parts[5].strip()
 
-    cat = load_catalog()
-    items = cat.get("items", [])
-
-    if find_item_by_id(items, item_id):
+    if find_item_by_id(load_catalog(), item_id):
         await update.message.reply_text("❌ Такой id уже существует. Возьми другой id.")
         return
 
-    items.append(
+    added = catalog_store.add_item(
         {
             "id": item_id,
             "name": name,
@@ -505,8 +1227,9 @@ async def cmd_add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             "photo_file_ids": [],
         }
     )
-    cat["items"] = items
-    save_catalog(cat)
+    if not added:
+        await update.message.reply_text("❌ Такой id уже существует. Возьми другой id.")
+        return
 
     await update.message.reply_text(
         "✅ Товар добавлен.\n"
@@ -516,6 +1239,7 @@ async def cmd_add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "и затем отправить фото."
     )
 
+@timed_handler
 async def cmd_bind(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     /bind ITEM_ID -> следующий присланный фото привяжется к товару
@@ -529,9 +1253,7 @@ async def cmd_bind(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("Формат: /bind ITEM_ID\nПример: /bind ArianaClassic")
         return
 
-    cat = load_catalog()
-    items = cat.get("items", [])
-    item = find_item_by_id(items, arg)
+    item = find_item_by_id(load_catalog(), arg)
     if not item:
         await update.message.reply_text("❌ Не нашёл товар с таким id. Посмотри /list")
         return
@@ -542,12 +1264,180 @@ async def cmd_bind(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "После привязки клиент с таким же фото будет получать точную модель и цену."
     )
 
+# -----------------------------
+# АДМИН: массовый импорт (CSV/JSON и фото в zip)
+# -----------------------------
+IMPORT_HELP = (
+    "Пришлите файл каталога следующим сообщением (или подпишите файл /import):\n"
+    "• CSV (UTF-8 или Excel cp1251; разделитель , ; или табуляция) с заголовком:\n"
+    "  id,name,price_kzt,colors,keywords,description\n"
+    "• JSON: {\"items\": [...]} или список, JSON Lines — по товару на строку\n"
+    "• zip с фото: ArianaClassic.jpg, ArianaClassic_2.jpg или папка ArianaClassic/ —\n"
+    "  фото привяжутся к товару с этим id; в архив можно положить и сам CSV/JSON\n\n"
+    "Товары с существующим id обновляются (пустые ячейки не трогают поле), новые добавляются.\n"
+    "/import dry — только проверить файл, ничего не меняя."
+)
+
+def import_mode(arg: str) -> str:
+    return "dry" if arg.strip().lower() in ("dry", "проверка", "test") else "apply"
+
+def import_catalog_rows(rows: List[Tuple[int, Dict[str, Any]]], dry_run: bool) -> ImportPlan:
+    """Все строки — одной правкой каталога: одна запись catalog.json / одна транзакция SQLite, один снимок."""
+    if dry_run:
+        return plan_import(load_catalog().items, rows)
+
+    def _import(raw: Dict[str, Any]) -> ImportPlan:
+        plan = plan_import(raw.get("items", []), rows)
+        apply_plan(raw, plan)
+        return plan
+
+    return catalog_store.update(_import)
+
+async def send_album(message: Message, chunk: List[Tuple[str, str, bytes]]) -> List[Message]:
+    if len(chunk) == 1:
+        _, item_id, data = chunk[0]
+        return [await message.reply_photo(data, caption=item_id)]
+    return list(await message.reply_media_group([InputMediaPhoto(data, caption=item_id) for _, item_id, data in chunk]))
+
+async def upload_photos(message: Message, photos: List[Tuple[str, str, bytes]]) -> List[Tuple[str, str, bytes]]:
+    """
+    Загружает фото в чат админа альбомами и возвращает (item_id, file_id, байты).
+    Альбом, который Telegram не принял целиком, досылается по одному фото.
+    """
+    uploaded = []
+    for start in range(0, len(photos), IMPORT_ALBUM_SIZE):
+        chunk = photos[start:start + IMPORT_ALBUM_SIZE]
+        for _ in range(IMPORT_UPLOAD_ATTEMPTS):
+            try:
+                sent = await send_album(message, chunk)
+            except RetryAfter as e:
+                logger.warning("Telegram просит подождать %s с при загрузке фото", e.retry_after)
+                await asyncio.sleep(float(e.retry_after))
+                continue
+            except BadRequest as e:
+                if len(chunk) == 1:
+                    logger.warning("Фото %s не принято Telegram: %s", chunk[0][0], e)
+                else:
+                    # битый файл в альбоме — досылаем по одному и теряем только его
+                    for photo in chunk:
+                        uploaded.extend(await upload_photos(message, [photo]))
+                break
+            uploaded.extend((item_id, msg.photo[-1].file_id, data) for (_, item_id, data), msg in zip(chunk, sent))
+            break
+    return uploaded
+
+def bind_photos(uploaded: List[Tuple[str, str, bytes]]) -> None:
+    # все file_id — одной правкой каталога
+    def _bind(raw: Dict[str, Any]) -> None:
+        by_id = {str(it.get("id", "")).strip(): it for it in raw.get("items", [])}
+        for item_id, file_id, _ in uploaded:
+            item = by_id.get(item_id)
+            if item is None:
+                continue
+            fids = item.get("photo_file_ids", []) or []
+            if file_id not in fids:
+                fids.append(file_id)
+            item["photo_file_ids"] = fids
+
+    catalog_store.update(_bind)
+
+def index_photos(uploaded: List[Tuple[str, str, bytes]]) -> int:
+    if not photo_index.enabled:
+        return 0
+    entries = []
+    for item_id, file_id, data in uploaded:
+        vec = image_features(data)
+        if vec is not None:
+            entries.append((item_id, file_id, vec))
+    return photo_index.add_many(entries)
+
+async def import_zip(message: Message, buf: io.BytesIO, dry_run: bool) -> None:
+    archive = await asyncio.to_thread(open_zip, buf)
+    with archive:
+        extra_ids: List[str] = []
+        table = zip_table(archive)
+        if table is not None:
+            if table.file_size > IMPORT_MAX_BYTES:
+                raise CatalogImportError(f"{table.filename} больше {IMPORT_MAX_BYTES // (1024 * 1024)} МБ — разбейте его на части")
+            rows = await asyncio.to_thread(lambda: read_rows(archive.open(table), table.filename))
+            plan = import_catalog_rows(rows, dry_run)
+            extra_ids = plan.added if dry_run else []
+            await message.reply_text(format_plan(plan, dry_run))
+
+        ids = [str(it.get("id", "")).strip() for it in load_catalog().items] + extra_ids
+        entries = await asyncio.to_thread(lambda: list(iter_zip_photos(archive, ids, PHOTO_MAX_BYTES)))
+
+    photos = [(name, item_id, data) for name, item_id, data, reason in entries if not reason]
+    skipped = [(name, reason) for name, _, _, reason in entries if reason]
+    lines = []
+    if dry_run:
+        lines.append(f"🔎 Фото в архиве: к товарам подходят {len(photos)}, пропущено {len(skipped)}")
+    else:
+        uploaded = await upload_photos(message, photos)
+        if uploaded:
+            bind_photos(uploaded)
+        indexed = await asyncio.to_thread(index_photos, uploaded)
+        lines.append(
+            f"✅ Фото привязано: {len(uploaded)} (к {len({u[0] for u in uploaded})} товарам), "
+            f"в индексе: +{indexed}, пропущено: {len(skipped) + len(photos) - len(uploaded)}"
+        )
+    for name, reason in skipped[:20]:
+        lines.append(f"  {name}: {reason}")
+    if len(skipped) > 20:
+        lines.append(f"  … и ещё {len(skipped) - 20}")
+    await message.reply_text("\n".join(lines))
+
+@timed_handler
+async def cmd_import(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /import [dry] -> следующий присланный файл (CSV/JSON/zip) загрузится в каталог
+    """
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("Команда доступна только администратору.")
+        return
+    context.user_data["import_mode"] = import_mode(update.message.text.replace("/import", "", 1))
+    await update.message.reply_text(IMPORT_HELP)
+
+@timed_handler
+async def on_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    message = update.message
+    if not message or not message.document or not is_admin(update.effective_user.id):
+        return
+    caption = (message.caption or "").strip()
+    mode = context.user_data.pop("import_mode", None)
+    if caption.startswith("/import"):
+        mode = import_mode(caption.replace("/import", "", 1))
+    if not mode:
+        await message.reply_text("Чтобы загрузить товары из файла, отправьте /import, а затем файл.")
+        return
+
+    doc = message.document
+    if doc.file_size and doc.file_size > IMPORT_MAX_BYTES:
+        await message.reply_text(f"❌ Файл больше {IMPORT_MAX_BYTES // (1024 * 1024)} МБ — разбейте его на части.")
+        return
+    name = doc.file_name or ""
+    buf = io.BytesIO()
+    file = await doc.get_file()
+    await file.download_to_memory(out=buf)
+    buf.seek(0)
+
+    dry_run = mode == "dry"
+    try:
+        if name.lower().endswith(".zip"):
+            await import_zip(message, buf, dry_run)
+        else:
+            rows = await asyncio.to_thread(read_rows, buf, name)
+            await message.reply_text(format_plan(import_catalog_rows(rows, dry_run), dry_run))
+    except CatalogImportError as e:
+        await message.reply_text(f"❌ Файл не принят: {e}")
+
 # -----------------------------
 # ОБРАБОТКА ФОТО
 # -----------------------------
+@logged_interaction
 async def on_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     cat = load_catalog()
-    items = cat.get("items", [])
+    items = cat.items
 
     # 1) Если админ в режиме привязки
     bind_item_id = context.user_data.get("bind_item_id")
@@ -555,28 +1445,41 @@ async def on_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         if not update.message.photo:
             return
         file_id = update.message.photo[-1].file_id
-        item = find_item_by_id(items, bind_item_id)
+
+        def bind_photo(item: Dict[str, Any]) -> None:
+            fids = item.get("photo_file_ids", []) or []
+            if file_id not in fids:
+                fids.append(file_id)
+            item["photo_file_ids"] = fids
+
+        item = None
+        if find_item_by_id(cat, bind_item_id):
+            item = catalog_store.update_item(bind_item_id, bind_photo)
         if not item:
             context.user_data["bind_item_id"] = None
             await update.message.reply_text("❌ Ошибка: товар не найден. Отмени /bind и попробуй снова.")
             return
 
-        fids = item.get("photo_file_ids", []) or []
-        if file_id not in fids:
-            fids.append(file_id)
-        item["photo_file_ids"] = fids
-        save_catalog(cat)
-
         context.user_data["bind_item_id"] = None
         await update.message.reply_text(f"✅ Фото привязано к модели {item.get('name')} ({bind_item_id}).")
+
+        # добавим фото в локальный индекс (ошибка тут не мешает привязке)
+        try:
+            image_bytes = await download_photo_bytes(update)
+            await index_photo(str(item.get("id", "")).strip(), file_id, image_bytes)
+        except Exception as e:
+            logger.exception("Ошибка индексации фото %s: %s", file_id, e)
         return
 
     # 2) Обычный пользователь: узнать модель/цену
     # Сначала пробуем точное совпадение по file_id
     telegram_file_id = update.message.photo[-1].file_id
-    exact = exact_match_by_file_id(items, telegram_file_id)
+    with stage("exact_match"):
+        exact = exact_match_by_file_id(cat, telegram_file_id)
+    cache_result("exact_file_id", exact is not None)
     if exact:
-        await update.message.reply_text(format_item_card(exact))
+        note_interaction(item_id=exact.get("id"), confidence=1.0, source="file_id")
+        await send_item_card(update, exact)
         return
 
     # Если каталог пуст
@@ -584,74 +1487,218 @@ async def on_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text("Каталог пока пуст. Напишите менеджеру.")
         return
 
-    # 3) Если OpenAI не подключён — честно скажем
-    if client is None:
-        await update.message.reply_text(
-            "Я получил фото ✅\n"
-            "Но ИИ-распознавание сейчас не настроено (нет ключа OPENAI_API_KEY).\n"
-            "Напишите название модели, и я подскажу цену."
-        )
+    # 3) Кэш: это же фото (file_unique_id) уже распознавали
+    file_unique_id = update.message.photo[-1].file_unique_id
+    # промах здесь не считаем: дальше то же фото проверят по dHash
+    cached = vision_cache.get(cat.version, file_unique_id=file_unique_id, count_miss=False)
+    cache_result("vision_file_unique_id", cached is not None)
+    if cached is not None:
+        note_interaction(source="vision_cache")
+        await reply_match_result(update, cat, cached)
         return
 
-    await update.message.reply_text("Секунду… распознаю модель по фото 🔎")
+    # 4) Нет ни OpenAI, ни локального индекса — честно скажем
+    if not openai_configured() and not len(photo_index):
+        await reply_ai_not_configured(update)
+        return
+
+    # Этот же placeholder потом редактируется в ответ — без второго сообщения
+    placeholder = await update.message.reply_text("Секунду… распознаю модель по фото 🔎")
 
     try:
-        image_bytes = await download_photo_bytes(update)
-        if not image_bytes:
-            await update.message.reply_text("Не удалось скачать фото. Попробуйте ещё раз.")
+        # то же фото прислали ещё раз (или переслали другие), пока первое распознаётся, —
+        # ждём тот же результат, а не скачиваем и не спрашиваем модель повторно
+        result, source, shared = await recognize_photo_shared(update, cat, file_unique_id)
+        if shared:
+            AI_COALESCED.inc(kind="vision")
+            note_interaction(shared=True)
+        note_interaction(source=source)
+        if result is None:
+            if source == "no_ai":
+                await reply_ai_not_configured(update, placeholder)
+            else:
+                await reply_or_edit(update, "Не удалось скачать фото. Попробуйте ещё раз.", placeholder)
             return
 
-        match_id, conf, reason = await match_bag_with_openai(items, image_bytes)
-        if not match_id:
-            await update.message.reply_text(
-                "Я не могу уверенно определить модель по этому фото.\n"
-                "Пожалуйста, отправьте фото ближе (логотип/фурнитура) или напишите название модели."
-            )
-            return
+        await reply_match_result(update, cat, result, placeholder)
 
-        item = find_item_by_id(items, match_id)
-        if not item:
-            await update.message.reply_text(
-                "Я нашёл похожую модель, но в каталоге её нет.\n"
-                "Пожалуйста, уточните модель или напишите менеджеру."
-            )
+    except RateLimitedError as e:
+        await reply_or_edit(
+            update,
+            f"Слишком много фото подряд 🙏 Подождите ~{max(1, round(e.retry_after))} сек "
+            "или напишите название модели текстом.",
+            placeholder,
+        )
+    except Exception as e:
+        logger.exception("Ошибка распознавания: %s", e)
+        await reply_or_edit(
+            update,
+            "Произошла ошибка при распознавании фото. Попробуйте ещё раз или напишите модель текстом.",
+            placeholder,
+        )
+
+async def recognize_photo_shared(
+    update: Update, cat: CatalogSnapshot, file_unique_id: str, attempts: int = 3
+) -> Tuple[Optional[Tuple[Optional[str], float, str]], str, bool]:
+    """
+    recognize_photo через photo_flights: (результат, источник, присоединились ли к чужому запросу).
+    Лимит ИИ в общем запросе списывается с того, кто его начал; его RateLimitedError
+    получают все ждущие — они повторяют сами, со своим лимитом.
+    """
+    key = (cat.version, file_unique_id)
+    attempt = 1
+    while True:
+        shared = key in photo_flights
+        try:
+            result, source = await photo_flights.do(key, lambda: recognize_photo(update, cat))
+            return result, source, shared
+        except RateLimitedError:
+            if not shared or attempt >= attempts:
+                raise
+        attempt += 1
+
+async def recognize_photo(
+    update: Update, cat: CatalogSnapshot
+) -> Tuple[Optional[Tuple[Optional[str], float, str]], str]:
+    """
+    Скачать фото -> кэш по dHash -> локальный индекс -> модель.
+    Возвращает (результат, источник); (None, "download_failed" | "no_ai") — ответить нечем.
+    """
+    with stage("download"):
+        image_bytes = await download_photo_bytes(update)
+    if not image_bytes:
+        return None, "download_failed"
+
+    # Похожая картинка (пересланный скриншот и т.п.) — по перцептивному хэшу
+    with stage("dhash"):
+        image_hash = await asyncio.to_thread(dhash, image_bytes)
+    result = vision_cache.get(cat.version, image_hash=image_hash)
+    cache_result("vision_dhash", result is not None)
+    source = "dhash_cache"
+    candidate = None
+    if result is None:
+        # Ближайшее привязанное фото; модель — только если сходство ниже порога
+        with stage("local_index"):
+            result, candidate = await local_photo_match(cat, image_bytes)
+        cache_result("photo_index", result is not None)
+        source = "photo_index"
+    if result is None:
+        if not openai_configured():
+            return None, "no_ai"
+        ai_rate_limit(update, "vision")
+        result = await match_bag_with_openai(cat, image_bytes, candidate=candidate)
+        source = "model"
+    if result[2] != VISION_PARSE_ERROR:
+        file_unique_id = update.message.photo[-1].file_unique_id
+        vision_cache.put(cat.version, result, file_unique_id=file_unique_id, image_hash=image_hash)
+    return result, source
+
+async def reply_or_edit(update: Update, text: str, placeholder: Optional[Message] = None) -> None:
+    # Если уже есть наше сообщение-заглушка — правим его, иначе отвечаем новым
+    if placeholder is not None:
+        try:
+            await placeholder.edit_text(text)
             return
+        except BadRequest as e:
+            logger.warning("Не удалось отредактировать сообщение: %s", e)
+    await update.effective_message.reply_text(text)
+
+async def reply_ai_not_configured(update: Update, placeholder: Optional[Message] = None) -> None:
+    await reply_or_edit(
+        update,
+        "Я получил фото ✅\n"
+        "Но ИИ-распознавание сейчас не настроено (нет ключа OPENAI_API_KEY).\n"
+        "Напишите название модели, и я подскажу цену.",
+        placeholder,
+    )
 
-        # Важно: говорим уверенно, только если conf>=0.80 (мы это уже проверили)
-        await update.message.reply_text(format_item_card(item))
+async def reply_match_result(
+    update: Update,
+    cat: CatalogSnapshot,
+    result: Tuple[Optional[str], float, str],
+    placeholder: Optional[Message] = None,
+) -> None:
+    match_id, conf, reason = result
+    note_interaction(item_id=match_id, confidence=conf)
+    if not match_id:
+        await reply_or_edit(
+            update,
+            "Я не могу уверенно определить модель по этому фото.\n"
+            "Пожалуйста, отправьте фото ближе (логотип/фурнитура) или напишите название модели.",
+            placeholder,
+        )
+        return
 
-    except Exception as e:
-        logger.exception("Ошибка распознавания: %s", e)
-        await update.message.reply_text(
-            "Произошла ошибка при распознавании фото. Попробуйте ещё раз или напишите модель текстом."
+    item = find_item_by_id(cat, match_id)
+    if not item:
+        await reply_or_edit(
+            update,
+            "Я нашёл похожую модель, но в каталоге её нет.\n"
+            "Пожалуйста, уточните модель или напишите менеджеру.",
+            placeholder,
         )
+        return
+
+    # Важно: говорим уверенно, только если conf>=0.80 (мы это уже проверили)
+    await send_item_card(update, item, placeholder)
 
 # -----------------------------
 # ОБРАБОТКА ТЕКСТА (ИИ-консультант + поиск по модели)
 # -----------------------------
+@logged_interaction
 async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     text = (update.message.text or "").strip()
-    t = normalize_text(text)
+    cat = load_catalog()
+    items = cat.items
 
-    # слово "меню"
-    if t == "меню":
+    # Локальный роутер: шаблоны ru/kz и названия моделей — ответ без вызова LLM
+    intent = intent_router.classify(text, lambda q: find_item_by_model_text(cat, q))
+    INTENTS.inc(intent=intent.name or "llm", via=intent.via)
+    note_interaction(intent=intent.name or "llm")
+
+    if intent.name == "menu":
         await on_menu_word(update, context)
         return
 
-    # короткие триггеры "цена/сколько стоит"
-    if any(x in t for x in ["цена", "сколько стоит", "сколько стоит?", "бағасы", "скока стоит"]):
+    if intent.name == "greeting":
+        await update.message.reply_text(START_TEXT)
+        return
+
+    if intent.name == "thanks":
+        await update.message.reply_text("Пожалуйста 😊 Если будут вопросы — пишите!")
+        return
+
+    if intent.name == "item":
+        note_interaction(item_id=intent.item.get("id"), source="text")
+        await send_item_card(update, intent.item)
+        context.user_data["mode"] = None
+        return
+
+    # "цена/сколько стоит" без названия модели
+    if intent.name == "price":
         context.user_data["mode"] = "price"
         await update.message.reply_text("Ок 👍 Пришлите фото сумки или напишите название модели — я назову цену.")
         return
 
-    cat = load_catalog()
-    items = cat.get("items", [])
+    if intent.name == "delivery":
+        await update.message.reply_text(DELIVERY_TEXT)
+        return
+
+    if intent.name == "catalog":
+        await send_catalog(update.message, cat)
+        return
+
+    if intent.name == "order":
+        # сюда доходит только если вход в оформление не сработал (например, чат без user)
+        await update.message.reply_text("Чтобы оформить заказ, нажмите /order ✅")
+        return
 
     # Если пользователь в режиме "price" — попробуем найти по тексту модель
     if context.user_data.get("mode") == "price":
-        item = find_item_by_model_text(items, text)
+        item = find_item_by_model_text(cat, text)
+        note_interaction(item_id=item.get("id") if item else None, source="text")
         if item:
-            await update.message.reply_text(format_item_card(item))
+            await send_item_card(update, item)
             context.user_data["mode"] = None
             return
         # Если не нашли — попросим фото/модель точнее
@@ -669,51 +1716,245 @@ async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
         return
 
-    if client is None:
-        # Без OpenAI — простой режим
-        item = find_item_by_model_text(items, text)
-        if item:
-            await update.message.reply_text(format_item_card(item))
-            return
-        await update.message.reply_text(
-            "Понял 👍\n"
-            "Напишите название модели или пришлите фото сумки — я подскажу цену и наличие цветов.\n"
-            "Если хотите меню — напишите «меню»."
-        )
+    if not openai_available():
+        # Без OpenAI (нет ключа или провайдер сейчас падает) — простой режим без ожидания модели
+        await reply_local_answer(update, cat, text)
+        return
+
+    note_interaction(source="consultant")
+    if not AI_COALESCE:
+        await answer_consultant(update, cat, text)
+        return
+
+    user_id = update.effective_user.id
+    if not consultant_coalescer.submit(user_id, (update, text)):
+        # ответ на прошлое сообщение ещё пишется — этот текст уйдёт в модель следующим запросом
+        AI_COALESCED.inc(kind="consultant")
+        note_interaction(coalesced=True)
+        return
+    # Отвечаем в фоне, чтобы следующие сообщения пользователя (даже при порядке по чату)
+    # успели дойти до хендлера и накопиться в consultant_coalescer
+    context.application.create_task(consultant_coalescer.drain(user_id, consultant_reply), update=update)
+
+@timed_handler
+async def consultant_reply(batch: List[Tuple[Update, str]]) -> None:
+    """Один запрос к консультанту на все накопленные сообщения; ответ — на последнее."""
+    update = batch[-1][0]
+    text = "\n".join(t for _, t in batch)
+    # фоновая задача унаследовала запись хендлера, который её запустил, — у пачки своя
+    current_interaction.set(None)
+    with track_interaction(update, "consultant_reply") as record:
+        if record is not None:
+            record.update(text=text, merged=len(batch))
+        note_interaction(source="consultant")
+        await answer_consultant(update, load_catalog(), text)
+
+async def answer_consultant(update: Update, cat: CatalogSnapshot, text: str) -> None:
+    empty_answer = "Понял 👍 Уточните, пожалуйста, модель или пришлите фото сумки."
+    error_answer = (
+        "Я понял ваш запрос, но сейчас не могу ответить автоматически.\n"
+        "Пришлите фото сумки или напишите модель — я уточню цену."
+    )
+
+    try:
+        ai_rate_limit(update, "consultant")
+    except RateLimitedError:
+        # лимит исчерпан — отвечаем локальным поиском, без модели
+        await reply_local_answer(update, cat, text)
+        return
+
+    if OPENAI_STREAM:
+        # Ответ появляется по мере генерации: одно сообщение, дописываемое правками
+        reply = StreamingReply(update.message, min_interval=STREAM_EDIT_INTERVAL_SEC)
+        try:
+            async for chunk in ai_consultant_stream(cat, text):
+                await reply.append(chunk)
+            await reply.finish(fallback=empty_answer)
+        except CircuitOpenError:
+            # breaker открылся, пока запрос ждал очереди
+            await reply_local_answer(update, cat, text, reply.message)
+        except Exception as e:
+            logger.exception("Ошибка AI-консультанта: %s", e)
+            # недописанный ответ заменяем сообщением об ошибке
+            await reply_or_edit(update, error_answer, reply.message)
         return
 
     try:
-        answer = await ai_consultant_answer(items, text)
+        answer = await ai_consultant_answer(cat, text)
         if not answer:
-            answer = "Понял 👍 Уточните, пожалуйста, модель или пришлите фото сумки."
+            answer = empty_answer
         await update.message.reply_text(answer)
+    except CircuitOpenError:
+        await reply_local_answer(update, cat, text)
     except Exception as e:
         logger.exception("Ошибка AI-консультанта: %s", e)
-        await update.message.reply_text(
-            "Я понял ваш запрос, но сейчас не могу ответить автоматически.\n"
-            "Пришлите фото сумки или напишите модель — я уточню цену."
-        )
+        await update.message.reply_text(error_answer)
+
+async def reply_local_answer(
+    update: Update, cat: CatalogSnapshot, text: str, placeholder: Optional[Message] = None
+) -> None:
+    # ответ без модели: только поиск модели по тексту в каталоге
+    item = find_item_by_model_text(cat, text)
+    note_interaction(item_id=item.get("id") if item else None, source="text")
+    if item:
+        await send_item_card(update, item, placeholder)
+        return
+    await reply_or_edit(
+        update,
+        "Понял 👍\n"
+        "Напишите название модели или пришлите фото сумки — я подскажу цену и наличие цветов.\n"
+        "Если хотите меню — напишите «меню».",
+        placeholder,
+    )
 
 # -----------------------------
 # ERROR HANDLER
 # -----------------------------
 async def on_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    ERRORS.inc(error=type(context.error).__name__)
     logger.exception("Ошибка в обработчике: %s", context.error)
 
+# -----------------------------
+# СТАРТ: фазы и прогрев
+# -----------------------------
+# фаза -> секунды; «ready» и «first_update» — от начала импорта bot.py
+startup_phases: Dict[str, float] = {}
+
+def record_startup_phase(name: str, seconds: float) -> None:
+    startup_phases[name] = seconds
+    STARTUP_SECONDS.set(seconds, phase=name)
+    logger.info("Старт: %s — %.3f с", name, seconds)
+
+@contextlib.contextmanager
+def startup_phase(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_startup_phase(name, time.perf_counter() - t0)
+
+def prewarm_catalog() -> None:
+    """Всё, что иначе собрал бы первый клиент после деплоя: снимок, индексы, сводки, страница каталога."""
+    with startup_phase("catalog"):
+        cat = load_catalog()
+    with startup_phase("indexes"):
+        # by_id, file_id, Aho–Corasick по названиям — нужны уже первому сообщению
+        cat.index
+    with startup_phase("briefs"):
+        if len(cat.items) <= CATALOG_BRIEF_FULL_MAX:
+            cached_catalog_brief(cat)
+        else:
+            cached_catalog_stats(cat)
+        catalog_page(cat, 0)
+
+async def prewarm_background() -> None:
+    await asyncio.sleep(BOT_PREWARM_BACKGROUND_DELAY_SEC)
+    await prewarm_bm25()
+    if OPENAI_PREWARM and OPENAI_API_KEY and client is None:
+        await prewarm_openai()
+
+async def prewarm_bm25() -> None:
+    # BM25 нужен только консультанту на большом каталоге, а тот всё равно ждёт модель секунды
+    cat = load_catalog()
+    if getattr(catalog_store, "search", None) is None and len(cat.items) > CATALOG_BRIEF_FULL_MAX:
+        with startup_phase("bm25"):
+            await asyncio.to_thread(lambda: cat.index.bm25)
+
+async def prewarm_openai() -> None:
+    # импорт SDK в потоке, затем TLS-соединение в пул: первый вопрос консультанту его не ждёт
+    with startup_phase("openai_import"):
+        await asyncio.to_thread(importlib.import_module, "openai")
+    ai = openai_client()
+    if ai is None:
+        return
+    with startup_phase("openai_connect"):
+        try:
+            await asyncio.wait_for(ai.models.list(), timeout=OPENAI_CONNECT_TIMEOUT_SEC)
+        except Exception as e:
+            logger.info("Прогрев соединения с OpenAI не удался (первый запрос откроет своё): %s", e)
+
+async def mark_first_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # группа 99: вызывается после основного хендлера, т.е. апдейт уже обработан
+    if "first_update" not in startup_phases:
+        record_startup_phase("first_update", time.perf_counter() - STARTED_AT)
+
 # -----------------------------
 # MAIN
 # -----------------------------
-def main() -> None:
-    if not BOT_TOKEN:
-        raise RuntimeError("BOT_TOKEN is empty. Set environment variable BOT_TOKEN.")
+async def on_startup(app) -> None:
+    record_startup_phase("initialize", time.perf_counter() - app.bot_data.pop("built_at", time.perf_counter()))
+    if BOT_PREWARM:
+        prewarm_catalog()
+        app.bot_data["prewarm_task"] = asyncio.create_task(prewarm_background())
+    # индексация старых привязок — в фоне, чтобы не задерживать старт
+    # (в cluster.py — только воркер 0, остальные подхватят готовый файл индекса)
+    if BOT_WORKER_ID == 0:
+        app.create_task(backfill_photo_index(app))
+    if METRICS_PORT:
+        app.bot_data["metrics_server"] = await start_metrics_server(METRICS_LISTEN, METRICS_PORT + BOT_WORKER_ID)
+    record_startup_phase("ready", time.perf_counter() - STARTED_AT)
+
+async def on_shutdown(app) -> None:
+    prewarm_task = app.bot_data.pop("prewarm_task", None)
+    if prewarm_task is not None:
+        prewarm_task.cancel()
+    server = app.bot_data.pop("metrics_server", None)
+    if server is not None:
+        server.close()
+    if interaction_log is not None:
+        await asyncio.to_thread(interaction_log.close)
+    # дописать отложенные правки каталога и досинхронизировать журнал заказов
+    await json_writer.flush()
+    await asyncio.to_thread(photo_index.flush)
+    order_journal.close()
+
+def make_persistence() -> Optional[KVPersistence]:
+    if not PERSISTENCE_BACKEND:
+        return None
+    if PERSISTENCE_BACKEND == "sqlite":
+        backend: Any = SqliteBackend(PERSISTENCE_SQLITE_PATH)
+    elif PERSISTENCE_BACKEND == "redis":
+        backend = RedisBackend(REDIS_URL)
+    else:
+        raise RuntimeError(f"Неизвестный PERSISTENCE_BACKEND: {PERSISTENCE_BACKEND} (sqlite или redis)")
+    return KVPersistence(
+        backend,
+        update_interval=PERSISTENCE_UPDATE_INTERVAL_SEC,
+        flush_delay=PERSISTENCE_FLUSH_DELAY_SEC,
+        refresh=PERSISTENCE_REFRESH,
+    )
 
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+def build_application(builder: Optional[ApplicationBuilder] = None) -> Application:
+    """
+    Собирает Application со всеми хендлерами.
+    builder можно передать свой (другой request, токен и т.п.) — так делают бенчмарки.
+    """
+    if builder is None:
+        builder = ApplicationBuilder().token(BOT_TOKEN)
+
+    concurrent_updates: Any = BOT_CONCURRENT_UPDATES
+    if BOT_CONCURRENT_UPDATES > 1 and BOT_PER_CHAT_ORDER:
+        concurrent_updates = ChatOrderedUpdateProcessor(BOT_CONCURRENT_UPDATES)
+
+    builder = (
+        builder
+        .concurrent_updates(concurrent_updates)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    persistence = make_persistence()
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    app = builder.build()
+    app.bot_data["built_at"] = time.perf_counter()
 
     # Conversation: оформление заказа
     order_conv = ConversationHandler(
         entry_points=[
             CommandHandler("order", start_order),
             CallbackQueryHandler(on_menu_click, pattern="^menu_order$"),
+            # «хочу заказать», «оформить заказ», «тапсырыс беремін» — без LLM сразу в оформление
+            MessageHandler(filters.TEXT & ~filters.COMMAND & IntentFilter("order"), start_order),
         ],
         states={
             ORDER_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, order_name)],
@@ -724,7 +1965,12 @@ def main() -> None:
         },
         fallbacks=[CommandHandler("cancel", order_cancel)],
         allow_reentry=True,
-        per_message=True,
+        # ключ разговора — чат + пользователь: с per_message=True текстовые шаги
+        # вообще не попадали в разговор (ключ строится только по callback_query)
+        per_message=False,
+        # с persistence незаконченное оформление переживает рестарт бота
+        name="order",
+        persistent=persistence is not None,
     )
 
     # Команды
@@ -736,24 +1982,71 @@ def main() -> None:
     app.add_handler(CommandHandler("add", cmd_add))
     app.add_handler(CommandHandler("bind", cmd_bind))
     app.add_handler(CommandHandler("list", cmd_list))
+    app.add_handler(CommandHandler("orders_export", cmd_orders_export))
+    app.add_handler(CommandHandler("import", cmd_import))
 
     # Заказы
     app.add_handler(order_conv)
 
     # Меню-кнопки
     app.add_handler(CallbackQueryHandler(on_menu_click, pattern="^menu_"))
+    app.add_handler(CallbackQueryHandler(on_catalog_click, pattern="^cat_"))
 
     # Фото
     app.add_handler(MessageHandler(filters.PHOTO, on_photo))
 
+    # Файлы (админ: импорт каталога)
+    app.add_handler(MessageHandler(filters.Document.ALL, on_document))
+
     # Текст (в конце)
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_text))
 
+    # Время до первого обработанного апдейта: своя последняя группа — после основных хендлеров
+    # и не мешает чужим TypeHandler в группе 1 (бенчмарки)
+    app.add_handler(TypeHandler(Update, mark_first_update), group=99)
+
     # Ошибки
     app.add_error_handler(on_error)
 
+    return app
+
+record_startup_phase("import", time.perf_counter() - STARTED_AT)
+
+def main() -> None:
+    if not BOT_TOKEN:
+        raise RuntimeError("BOT_TOKEN is empty. Set environment variable BOT_TOKEN.")
+
+    # старый orders.json переносим в журнал один раз
+    order_journal.import_legacy(ORDERS_PATH)
+
+    if BOT_MODE == "webhook" and BOT_WORKERS > 1:
+        # несколько процессов за одним приёмником webhook, апдейты делятся по chat_id
+        import cluster
+        # этот же модуль: при «python bot.py» он __main__, а import bot загрузил бы вторую копию
+        cluster.run(BOT_WORKERS, sys.modules[__name__])
+        return
+
+    with startup_phase("build"):
+        app = build_application()
+
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL:
+            raise RuntimeError("WEBHOOK_URL is empty. Set WEBHOOK_URL or use BOT_MODE=polling.")
+        logger.info("Bot started (webhook %s, port %s).", WEBHOOK_URL, WEBHOOK_PORT)
+        # В режиме webhook накопившиеся за время простоя апдейты не выбрасываем
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL.rstrip("/") + "/" + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET_TOKEN or None,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            drop_pending_updates=DROP_PENDING_UPDATES,
+        )
+        return
+
     logger.info("Bot started.")
-    app.run_polling(drop_pending_updates=True)
+    app.run_polling(drop_pending_updates=DROP_PENDING_UPDATES)
 
 if __name__ == "__main__":
     main()
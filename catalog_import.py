@@ -0,0 +1,281 @@
+import io
+import codecs
+import os
+import csv
+import json
+import zipfile
+from typing import Any, Dict, IO, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+# Поля строки импорта; остальные колонки сохраняются в товаре как есть
+LIST_FIELDS = ("colors", "keywords", "photo_file_ids")
+TEXT_FIELDS = ("name", "description")
+MAX_ERRORS_SHOWN = 20
+ENCODING_SAMPLE_BYTES = 64 * 1024
+
+TABLE_EXTENSIONS = (".csv", ".tsv", ".json", ".jsonl", ".ndjson")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+ZIP_MAX_FILES = 500
+ZIP_MAX_TOTAL_BYTES = 200 * 1024 * 1024
+
+class CatalogImportError(Exception):
+    """Файл целиком не читается (формат, кодировка, архив)."""
+
+# -----------------------------
+# РАЗБОР ФАЙЛА
+# -----------------------------
+def iter_rows(data: IO[bytes], filename: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    (номер строки, словарь) из CSV, JSON Lines или JSON ({"items": [...]} или [...]).
+    Экономии памяти это не даёт: файл уже скачан целиком, а read_rows и план
+    держат все строки. От больших файлов защищает только лимит размера
+    (IMPORT_MAX_BYTES в bot.py), он проверяется до скачивания и распаковки.
+    """
+    ext = os.path.splitext(filename.lower())[1]
+    if ext in (".csv", ".tsv"):
+        text = io.TextIOWrapper(data, encoding=detect_encoding(data), newline="")
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(text, dialect=dialect)
+        if not reader.fieldnames or "id" not in [f.strip() for f in reader.fieldnames]:
+            raise CatalogImportError("в CSV нет колонки id (первая строка — заголовки)")
+        for row in reader:
+            # строка 1 — заголовок
+            yield reader.line_num, {(k or "").strip(): v for k, v in row.items() if k}
+        return
+    if ext in (".jsonl", ".ndjson"):
+        for n, line in enumerate(io.TextIOWrapper(data, encoding="utf-8-sig"), 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield n, {"__error__": f"не JSON: {e}"}
+                continue
+            yield n, row if isinstance(row, dict) else {"__error__": "ожидается объект"}
+        return
+    if ext == ".json":
+        try:
+            parsed = json.load(io.TextIOWrapper(data, encoding="utf-8-sig"))
+        except ValueError as e:
+            raise CatalogImportError(f"не JSON: {e}")
+        rows = parsed.get("items") if isinstance(parsed, dict) else parsed
+        if not isinstance(rows, list):
+            raise CatalogImportError('ожидается {"items": [...]} или список товаров')
+        for n, row in enumerate(rows, 1):
+            yield n, row if isinstance(row, dict) else {"__error__": "ожидается объект"}
+        return
+    raise CatalogImportError("поддерживаются .csv, .json, .jsonl (и .zip с фото)")
+
+def read_rows(data: IO[bytes], filename: str) -> List[Tuple[int, Dict[str, Any]]]:
+    """Все строки файла списком; битая кодировка или CSV — CatalogImportError с понятной причиной."""
+    try:
+        return list(iter_rows(data, filename))
+    except UnicodeDecodeError as e:
+        raise CatalogImportError(f"кодировка не UTF-8 и не cp1251 (байт {e.start})")
+    except csv.Error as e:
+        raise CatalogImportError(f"ошибка CSV: {e}")
+
+def detect_encoding(data: IO[bytes]) -> str:
+    # Excel в RU/KZ по умолчанию сохраняет CSV в cp1251
+    sample = data.read(ENCODING_SAMPLE_BYTES)
+    data.seek(0)
+    try:
+        codecs.getincrementaldecoder("utf-8-sig")().decode(sample, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "cp1251"
+
+# -----------------------------
+# ПРОВЕРКА СТРОК
+# -----------------------------
+def _as_list(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in str(value).split(",") if v.strip()]
+
+def validate_row(row: Mapping[str, Any]) -> Tuple[Optional[Dict[str, Any]], str]:
+    """
+    Строка -> (поля товара, ""), либо (None, причина отказа).
+    Пустые ячейки означают «не менять» — поля в результат не попадают.
+    """
+    if "__error__" in row:
+        return None, str(row["__error__"])
+    item_id = str(row.get("id") or "").strip()
+    if not item_id:
+        return None, "пустой id"
+    if "|" in item_id or any(ch.isspace() for ch in item_id):
+        return None, f"id «{item_id}»: без пробелов и |"
+    fields: Dict[str, Any] = {"id": item_id}
+    for key, value in row.items():
+        if key == "id" or value is None or value == "":
+            continue
+        if key == "price_kzt":
+            try:
+                price = int(str(value).replace(" ", "").replace("\u00a0", ""))
+            except ValueError:
+                return None, f"цена «{value}» — не число"
+            if price < 0:
+                return None, "цена меньше нуля"
+            fields[key] = price
+        elif key in LIST_FIELDS:
+            fields[key] = _as_list(value)
+        elif key in TEXT_FIELDS:
+            fields[key] = str(value).strip()
+        else:
+            fields[key] = value
+    return fields, ""
+
+class ImportPlan(NamedTuple):
+    rows: Dict[str, Dict[str, Any]]  # id -> поля (последняя строка с этим id)
+    added: List[str]
+    updated: List[str]
+    unchanged: int
+    rejected: List[Tuple[int, str]]
+
+def plan_import(existing: Sequence[Mapping[str, Any]], rows: Iterable[Tuple[int, Dict[str, Any]]]) -> ImportPlan:
+    """
+    Проверяет все строки и раскладывает их на новые / изменённые / без изменений / отклонённые.
+    existing — текущие товары: внутри CatalogStore.update() план строится по тем же
+    данным, в которые потом пишется, и параллельная правка не теряется.
+    """
+    by_id = {str(it.get("id", "")).strip(): it for it in existing}
+    valid: Dict[str, Dict[str, Any]] = {}
+    seen_at: Dict[str, int] = {}
+    rejected: List[Tuple[int, str]] = []
+    for line, row in rows:
+        if not any(str(v).strip() for v in row.values() if v is not None):
+            continue  # пустая строка в конце таблицы
+        fields, error = validate_row(row)
+        if fields is None:
+            rejected.append((line, error))
+            continue
+        item_id = fields["id"]
+        if item_id in seen_at:
+            rejected.append((line, f"id {item_id} уже был в строке {seen_at[item_id]}"))
+            continue
+        if item_id not in by_id and not fields.get("name"):
+            rejected.append((line, f"новый товар {item_id} без name"))
+            continue
+        if item_id not in by_id and "price_kzt" not in fields:
+            rejected.append((line, f"новый товар {item_id} без price_kzt"))
+            continue
+        seen_at[item_id] = line
+        valid[item_id] = fields
+
+    added, updated, unchanged = [], [], 0
+    for item_id, fields in valid.items():
+        old = by_id.get(item_id)
+        if old is None:
+            added.append(item_id)
+        elif any(_plain(old.get(k)) != _plain(v) for k, v in fields.items()):
+            updated.append(item_id)
+        else:
+            unchanged += 1
+    return ImportPlan(valid, added, updated, unchanged, rejected)
+
+def _plain(value: Any) -> Any:
+    # снимок каталога хранит списки кортежами
+    return list(value) if isinstance(value, tuple) else value
+
+def apply_plan(raw: Dict[str, Any], plan: ImportPlan) -> None:
+    """Upsert в «сырые» данные каталога (внутри CatalogStore.update — одна запись)."""
+    items = raw.setdefault("items", [])
+    positions = {str(it.get("id", "")).strip(): i for i, it in enumerate(items)}
+    for item_id in plan.updated:
+        items[positions[item_id]].update(plan.rows[item_id])
+    for item_id in plan.added:
+        item = {"id": item_id, "name": "", "price_kzt": 0, "colors": [], "description": "", "keywords": [], "photo_file_ids": []}
+        item.update(plan.rows[item_id])
+        items.append(item)
+
+def format_plan(plan: ImportPlan, dry_run: bool = False) -> str:
+    lines = [
+        ("🔎 Проверка (без записи):" if dry_run else "✅ Импорт каталога:"),
+        f"• добавлено: {len(plan.added)}",
+        f"• обновлено: {len(plan.updated)}",
+        f"• без изменений: {plan.unchanged}",
+        f"• отклонено: {len(plan.rejected)}",
+    ]
+    for label, ids in (("новые", plan.added), ("изменены", plan.updated)):
+        if ids:
+            shown = ", ".join(ids[:15]) + (f" … (+{len(ids) - 15})" if len(ids) > 15 else "")
+            lines.append(f"{label}: {shown}")
+    if plan.rejected:
+        lines.append("\nОтклонённые строки:")
+        for line, reason in plan.rejected[:MAX_ERRORS_SHOWN]:
+            lines.append(f"  строка {line}: {reason}")
+        if len(plan.rejected) > MAX_ERRORS_SHOWN:
+            lines.append(f"  … и ещё {len(plan.rejected) - MAX_ERRORS_SHOWN}")
+    return "\n".join(lines)
+
+# -----------------------------
+# ФОТО ИЗ ZIP: имя файла -> id товара
+# -----------------------------
+def photo_item_id(name: str, ids: Mapping[str, str]) -> Optional[str]:
+    """
+    ArianaClassic.jpg, ArianaClassic_2.jpg, ArianaClassic (3).png или ArianaClassic/любое.jpg -> ArianaClassic.
+    ids — нормализованный (lower) id -> id из каталога.
+    """
+    parts = [p for p in name.replace("\\", "/").split("/") if p]
+    if len(parts) > 1 and parts[-2].lower() in ids:
+        return ids[parts[-2].lower()]
+    stem = os.path.splitext(parts[-1])[0].strip().lower() if parts else ""
+    for candidate in (stem, stem.rsplit("_", 1)[0], stem.rsplit(" (", 1)[0], stem.rsplit("-", 1)[0]):
+        if candidate in ids:
+            return ids[candidate]
+    return None
+
+def open_zip(data: IO[bytes]) -> zipfile.ZipFile:
+    """Открывает архив и проверяет число файлов и размер по заголовкам zip — до распаковки."""
+    try:
+        archive = zipfile.ZipFile(data)
+    except zipfile.BadZipFile as e:
+        raise CatalogImportError(f"не zip: {e}")
+    entries = zip_entries(archive)
+    if len(entries) > ZIP_MAX_FILES:
+        archive.close()
+        raise CatalogImportError(f"в архиве {len(entries)} файлов, максимум {ZIP_MAX_FILES}")
+    if sum(e.file_size for e in entries) > ZIP_MAX_TOTAL_BYTES:
+        archive.close()
+        raise CatalogImportError("архив слишком большой в распакованном виде")
+    return archive
+
+def zip_entries(archive: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    # без папок и служебных файлов (.DS_Store, __MACOSX/._photo.jpg)
+    return [
+        e for e in archive.infolist()
+        if not e.is_dir() and not os.path.basename(e.filename).startswith(".") and not e.filename.startswith("__MACOSX/")
+    ]
+
+def zip_table(archive: zipfile.ZipFile) -> Optional[zipfile.ZipInfo]:
+    """Таблица товаров в архиве вместе с фото (ровно один .csv/.json/.jsonl), иначе None."""
+    tables = [e for e in zip_entries(archive) if e.filename.lower().endswith(TABLE_EXTENSIONS)]
+    return tables[0] if len(tables) == 1 else None
+
+def iter_zip_photos(
+    archive: zipfile.ZipFile, item_ids: Sequence[str], max_photo_bytes: int
+) -> Iterator[Tuple[str, Optional[str], Optional[bytes], str]]:
+    """(имя файла, id товара, байты, причина отказа) для каждой картинки архива."""
+    ids = {i.lower(): i for i in item_ids}
+    for entry in zip_entries(archive):
+        name = entry.filename
+        if name.lower().endswith(TABLE_EXTENSIONS):
+            continue
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            yield name, None, None, "не картинка"
+            continue
+        item_id = photo_item_id(name, ids)
+        if item_id is None:
+            yield name, None, None, "нет товара с таким id"
+            continue
+        if entry.file_size > max_photo_bytes:
+            yield name, item_id, None, "файл слишком большой"
+            continue
+        yield name, item_id, archive.read(entry), ""
@@ -0,0 +1,205 @@
+import re
+import math
+import heapq
+from collections import Counter, deque
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+def normalize_text(s: str) -> str:
+    return (s or "").strip().lower()
+
+# -----------------------------
+# ТОКЕНИЗАЦИЯ ДЛЯ ПОИСКА (грубый стемминг ru/kz)
+# -----------------------------
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_ENDINGS = sorted(
+    [
+        "ами", "ями", "ого", "его", "ому", "ему", "ыми", "ими",
+        "ая", "яя", "ое", "ее", "ые", "ие", "ый", "ий", "ой", "ую", "юю",
+        "ом", "ем", "ах", "ях", "ов", "ев", "ей", "ам", "ям",
+        "а", "я", "о", "е", "ы", "и", "у", "ю", "ь",
+    ],
+    key=len,
+    reverse=True,
+)
+
+def stem(word: str) -> str:
+    for end in _ENDINGS:
+        if word.endswith(end) and len(word) - len(end) >= 3:
+            word = word[: -len(end)]
+            break
+    return word[:6]
+
+def tokenize(text: str) -> List[str]:
+    return [stem(w) for w in _WORD_RE.findall(normalize_text(text).replace("ё", "е"))]
+
+# -----------------------------
+# Aho–Corasick: все подстроки-паттерны за один проход по тексту
+# -----------------------------
+class AhoCorasick:
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self.patterns: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+
+        for p in patterns:
+            if not p:
+                continue
+            node = 0
+            for ch in p:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                node = nxt
+            self._out[node] = self._out[node] + (len(self.patterns),)
+            self.patterns.append(p)
+
+        # BFS: fail-ссылки и объединённые выходы
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                fail = self._goto[f].get(ch, 0)
+                self._fail[nxt] = fail if fail != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+                queue.append(nxt)
+
+    def find(self, text: str) -> set:
+        """Индексы паттернов, встречающихся в text как подстрока."""
+        found = set()
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+# -----------------------------
+# Индексы по снимку каталога
+# -----------------------------
+class CatalogIndex:
+    """
+    Строится один раз на снимок каталога.
+    Порядок приоритетов тот же, что у линейного поиска:
+    точное id/имя -> ключевое слово -> имя как подстрока; при равенстве — первый товар.
+    """
+
+    def __init__(self, items: Sequence[Mapping[str, Any]]) -> None:
+        self.items = items
+        self.by_id: Dict[str, Mapping[str, Any]] = {}
+        self.by_file_id: Dict[str, Mapping[str, Any]] = {}
+        self._exact: Dict[str, int] = {}  # нормализованный id/имя -> позиция товара
+
+        # паттерн -> (мин. позиция по ключевым словам, мин. позиция по имени)
+        first_kw: Dict[str, int] = {}
+        first_name: Dict[str, int] = {}
+
+        for pos, it in enumerate(items):
+            self.by_id.setdefault(str(it.get("id", "")).strip(), it)
+            for fid in it.get("photo_file_ids", []) or []:
+                self.by_file_id.setdefault(fid, it)
+
+            norm_id = normalize_text(str(it.get("id", "")))
+            name = normalize_text(str(it.get("name", "")))
+            self._exact.setdefault(norm_id, pos)
+            self._exact.setdefault(name, pos)
+
+            for kw in it.get("keywords", []) or []:
+                k = normalize_text(kw)
+                if k:
+                    first_kw.setdefault(k, pos)
+            if name:
+                first_name.setdefault(name, pos)
+
+        patterns = list(dict.fromkeys(list(first_kw) + list(first_name)))
+        self._automaton = AhoCorasick(patterns)
+        self._kw_pos = [first_kw.get(p) for p in self._automaton.patterns]
+        self._name_pos = [first_name.get(p) for p in self._automaton.patterns]
+        self._bm25: Optional["Bm25Index"] = None
+
+    @property
+    def bm25(self) -> "Bm25Index":
+        # строится лениво: нужен только консультанту на большом каталоге
+        if self._bm25 is None:
+            self._bm25 = Bm25Index(self.items)
+        return self._bm25
+
+    def find_by_text(self, text: str) -> Optional[Mapping[str, Any]]:
+        t = normalize_text(text)
+        if not t:
+            return None
+
+        pos = self._exact.get(t)
+        if pos is not None:
+            return self.items[pos]
+
+        best_kw = None
+        best_name = None
+        for i in self._automaton.find(t):
+            kp = self._kw_pos[i]
+            if kp is not None and (best_kw is None or kp < best_kw):
+                best_kw = kp
+            np_ = self._name_pos[i]
+            if np_ is not None and (best_name is None or np_ < best_name):
+                best_name = np_
+
+        if best_kw is not None:
+            return self.items[best_kw]
+        if best_name is not None:
+            return self.items[best_name]
+        return None
+
+# -----------------------------
+# BM25 по названию, ключевым словам, описанию и цветам
+# -----------------------------
+class Bm25Index:
+    # вес поля = сколько раз его токены входят в документ
+    FIELD_WEIGHTS = (("name", 3), ("keywords", 2), ("id", 1), ("colors", 1), ("description", 1))
+
+    def __init__(self, items: Sequence[Mapping[str, Any]], k1: float = 1.5, b: float = 0.75) -> None:
+        self.items = items
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._doc_len: List[int] = []
+
+        for pos, it in enumerate(items):
+            tokens: List[str] = []
+            for field, weight in self.FIELD_WEIGHTS:
+                value = it.get(field, "")
+                if isinstance(value, (list, tuple)):
+                    value = " ".join(str(v) for v in value)
+                tokens.extend(tokenize(str(value or "")) * weight)
+            self._doc_len.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self._postings.setdefault(term, []).append((pos, tf))
+
+        n = len(items)
+        self._avgdl = (sum(self._doc_len) / n) if n else 0.0
+        self._idf = {
+            term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self._postings.items()
+        }
+
+    def search(self, text: str, k: int) -> List[Mapping[str, Any]]:
+        """Топ-k товаров по BM25; при равных очках — в порядке каталога."""
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(text)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf[term]
+            for pos, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._doc_len[pos] / (self._avgdl or 1.0))
+                scores[pos] = scores.get(pos, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        top = heapq.nsmallest(k, scores.items(), key=lambda x: (-x[1], x[0]))
+        return [self.items[pos] for pos, _ in top]
@@ -0,0 +1,376 @@
+import os
+import sys
+import json
+import time
+import logging
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from catalog_store import CatalogSnapshot, freeze, thaw
+from catalog_index import tokenize
+from storage import save_json
+
+logger = logging.getLogger("magazin_sumok_bot")
+
+# Поля товара, разложенные по колонкам и таблицам; остальное — JSON в items.extra
+_COLUMNS = ("id", "name", "price_kzt", "description")
+_LISTS = (("colors", "item_colors", "color"), ("keywords", "item_keywords", "keyword"), ("photo_file_ids", "item_photos", "file_id"))
+_NORMALIZED = set(_COLUMNS) | {key for key, _, _ in _LISTS}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    pos INTEGER NOT NULL,
+    name TEXT,
+    price_kzt,
+    description TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS items_pos ON items(pos);
+CREATE TABLE IF NOT EXISTS item_colors (item INTEGER NOT NULL, ord INTEGER NOT NULL, color TEXT NOT NULL, PRIMARY KEY (item, ord));
+CREATE INDEX IF NOT EXISTS item_colors_color ON item_colors(color);
+CREATE TABLE IF NOT EXISTS item_keywords (item INTEGER NOT NULL, ord INTEGER NOT NULL, keyword TEXT NOT NULL, PRIMARY KEY (item, ord));
+CREATE INDEX IF NOT EXISTS item_keywords_keyword ON item_keywords(keyword);
+CREATE TABLE IF NOT EXISTS item_photos (item INTEGER NOT NULL, ord INTEGER NOT NULL, file_id TEXT NOT NULL, PRIMARY KEY (item, ord));
+CREATE INDEX IF NOT EXISTS item_photos_file_id ON item_photos(file_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+    name, description, keywords, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4 5 6'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS items_fts_vocab USING fts5vocab(items_fts, row);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+def check_ids(ids: List[str]) -> None:
+    """
+    В базе id уникален (items.id UNIQUE): товары без id или с повтором
+    слились бы в одну строку — такой каталог не пишем, а сообщаем об ошибке.
+    """
+    empty = sum(1 for i in ids if not i)
+    seen, dups = set(), []
+    for i in ids:
+        if i and i in seen and i not in dups:
+            dups.append(i)
+        seen.add(i)
+    problems = []
+    if empty:
+        problems.append(f"товаров без id: {empty}")
+    if dups:
+        problems.append("повторяются id: " + ", ".join(dups[:10]) + (" …" if len(dups) > 10 else ""))
+    if problems:
+        raise ValueError("каталог не сохранён — " + "; ".join(problems))
+
+# Основа, которая есть больше чем в COMMON_SHARE товаров, почти не влияет на ранжирование
+# (как idf≈0 в BM25), а стоит полного прохода по индексу — её в запрос не берём
+COMMON_SHARE = 0.3
+COMMON_MIN = 50
+
+# -----------------------------
+# КАТАЛОГ В SQLITE
+# -----------------------------
+class SqliteCatalogStore:
+    """
+    Тот же интерфейс, что у CatalogStore (snapshot / update / replace),
+    но каталог лежит в SQLite: товар — строка items, цвета, ключевые слова
+    и file_id фото — отдельные таблицы с индексами, FTS5 по названию,
+    описанию и ключевым словам. Правка одного товара пишет только его строки.
+
+    Снимок в памяти остаётся: хендлеры и индексы работают с ним, как раньше.
+    Правки из других процессов (воркеры cluster.py) видны по meta.version,
+    проверка не чаще чем раз в check_interval секунд.
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self.writer = None  # совместимость с CatalogStore: запись всегда сразу
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._top: Dict[str, Any] = {}
+        self._items: List[Any] = []           # замороженные товары в порядке каталога
+        self._positions: Dict[str, int] = {}  # id -> индекс в _items
+        self._pos: List[int] = []             # items.pos для каждого товара _items
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._version: Optional[str] = None
+        self._checked_at = 0.0
+
+    # ---- чтение ----
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _load(self) -> None:
+        lists: Dict[str, Dict[int, List[str]]] = {}
+        for key, table, column in _LISTS:
+            grouped: Dict[int, List[str]] = {}
+            for rowid, value in self._conn.execute(f"SELECT item, {column} FROM {table} ORDER BY item, ord"):
+                grouped.setdefault(rowid, []).append(value)
+            lists[key] = grouped
+        items, pos = [], []
+        for rowid, item_id, p, name, price, description, extra in self._conn.execute(
+            "SELECT rowid, id, pos, name, price_kzt, description, extra FROM items ORDER BY pos"
+        ):
+            item: Dict[str, Any] = json.loads(extra) if extra else {}
+            item["id"] = item_id
+            for key, value in (("name", name), ("price_kzt", price), ("description", description)):
+                if value is not None:
+                    item[key] = value
+            for key, _, _ in _LISTS:
+                item[key] = lists[key].get(rowid, [])
+            items.append(freeze(item))
+            pos.append(p)
+        self._top = json.loads(self._meta("top") or "{}")
+        self._version = self._meta("version")
+        self._set_items(items, pos)
+        logger.info("Каталог загружен из %s: %s товаров", self.path, len(items))
+
+    def _set_items(self, items: List[Any], pos: List[int]) -> None:
+        self._items = items
+        self._pos = pos
+        self._positions = {str(it.get("id", "")).strip(): i for i, it in enumerate(items)}
+        # товары уже заморожены — снимок собирается без копирования
+        self._snapshot = CatalogSnapshot({**self._top, "items": tuple(items)})
+
+    def snapshot(self) -> CatalogSnapshot:
+        now = time.monotonic()
+        snap = self._snapshot
+        if snap is not None and now - self._checked_at < self.check_interval:
+            return snap
+        with self._lock:
+            self._checked_at = now
+            if self._snapshot is None or self._meta("version") != self._version:
+                self._load()
+            return self._snapshot
+
+    def __len__(self) -> int:
+        return int(self._conn.execute("SELECT COUNT(*) FROM items").fetchone()[0])
+
+    def _doc_freq(self, prefix: str) -> int:
+        # сколько товаров содержат слово с этой основой (оценка сверху)
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        row = self._conn.execute(
+            "SELECT coalesce(sum(doc), 0) FROM items_fts_vocab WHERE term >= ? AND term < ?", (prefix, upper)
+        ).fetchone()
+        return int(row[0])
+
+    def search(self, text: str, k: int) -> List[str]:
+        """
+        id товаров по FTS5 (bm25: название важнее ключевых слов, те — описания).
+        Основы слов — те же, что у BM25 в памяти, как префиксы: «сумку» -> "сумк"*.
+        Пусто — ни одного редкого слова (вызывающий берёт начало каталога).
+        """
+        terms = list(dict.fromkeys(t for t in tokenize(text) if t))
+        if not terms:
+            return []
+        with self._lock:
+            limit = max(COMMON_MIN, len(self._items) * COMMON_SHARE)
+            useful = [t for t in terms if 0 < self._doc_freq(t) <= limit]
+            if not useful:
+                return []
+            query = " OR ".join(f'"{t}"*' for t in useful)
+            rows = self._conn.execute(
+                "SELECT items.id FROM items_fts JOIN items ON items.rowid = items_fts.rowid"
+                " WHERE items_fts MATCH ? ORDER BY bm25(items_fts, 3.0, 1.0, 2.0), items.pos LIMIT ?",
+                (query, k),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    # ---- запись ----
+    def _write_item(self, item: Dict[str, Any], pos: int) -> None:
+        item_id = str(item.get("id", "")).strip()
+        extra = {k: v for k, v in item.items() if k not in _NORMALIZED}
+        row = self._conn.execute("SELECT rowid FROM items WHERE id = ?", (item_id,)).fetchone()
+        values = (pos, item.get("name"), item.get("price_kzt"), item.get("description"), json.dumps(extra, ensure_ascii=False) if extra else None)
+        if row is None:
+            rowid = self._conn.execute(
+                "INSERT INTO items (id, pos, name, price_kzt, description, extra) VALUES (?, ?, ?, ?, ?, ?)",
+                (item_id, *values),
+            ).lastrowid
+        else:
+            rowid = row[0]
+            self._conn.execute(
+                "UPDATE items SET pos = ?, name = ?, price_kzt = ?, description = ?, extra = ? WHERE rowid = ?",
+                (*values, rowid),
+            )
+        for key, table, column in _LISTS:
+            self._conn.execute(f"DELETE FROM {table} WHERE item = ?", (rowid,))
+            self._conn.executemany(
+                f"INSERT INTO {table} (item, ord, {column}) VALUES (?, ?, ?)",
+                [(rowid, n, str(v)) for n, v in enumerate(item.get(key) or [])],
+            )
+        self._conn.execute("DELETE FROM items_fts WHERE rowid = ?", (rowid,))
+        self._conn.execute(
+            "INSERT INTO items_fts (rowid, name, description, keywords) VALUES (?, ?, ?, ?)",
+            (rowid, item.get("name") or "", item.get("description") or "", " ".join(map(str, item.get("keywords") or []))),
+        )
+
+    def _delete_item(self, item_id: str) -> None:
+        row = self._conn.execute("SELECT rowid FROM items WHERE id = ?", (item_id,)).fetchone()
+        if row is None:
+            return
+        for _, table, _ in _LISTS:
+            self._conn.execute(f"DELETE FROM {table} WHERE item = ?", (row[0],))
+        self._conn.execute("DELETE FROM items_fts WHERE rowid = ?", (row[0],))
+        self._conn.execute("DELETE FROM items WHERE rowid = ?", (row[0],))
+
+    def _commit(self, write: Callable[[], None]) -> None:
+        """write() в одной транзакции + новая meta.version (по ней снимок обновят другие процессы)."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            write()
+            version = str(int(self._meta("version") or 0) + 1)
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (version,))
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._version = version
+
+    def update_item(self, item_id: str, mutate: Callable[[Dict[str, Any]], Any]) -> Optional[Dict[str, Any]]:
+        """
+        Правка одного товара: mutate меняет копию на месте.
+        Пишутся только строки этого товара. None — товара нет.
+        """
+        self.snapshot()
+        with self._lock:
+            i = self._positions.get(str(item_id).strip())
+            if i is None:
+                return None
+            item = thaw(self._items[i])
+            mutate(item)
+            self._commit(lambda: self._write_item(item, self._pos[i]))
+            items = list(self._items)
+            items[i] = freeze(item)
+            self._set_items(items, self._pos)
+            return item
+
+    def add_item(self, item: Dict[str, Any]) -> bool:
+        """Новый товар в конец каталога; False — такой id уже есть."""
+        self.snapshot()
+        with self._lock:
+            item_id = str(item.get("id", "")).strip()
+            check_ids([item_id])
+            if item_id in self._positions:
+                return False
+            pos = (self._pos[-1] + 1) if self._pos else 0
+            self._commit(lambda: self._write_item(item, pos))
+            self._set_items(self._items + [freeze(item)], self._pos + [pos])
+            return True
+
+    def update(self, mutate: Callable[[Dict[str, Any]], Any]) -> Any:
+        """
+        Совместимость с CatalogStore.update: mutate получает весь каталог
+        как dict. В базу пишутся только изменённые, новые и удалённые товары.
+        """
+        self.snapshot()
+        with self._lock:
+            old = {str(it.get("id", "")).strip(): it for it in self._items}
+            raw = {**self._top, "items": [thaw(it) for it in self._items]}
+            result = mutate(raw)
+            new_items = raw.pop("items", []) or []
+            new_ids = [str(it.get("id", "")).strip() for it in new_items]
+            check_ids(new_ids)
+            # порядок сохранившихся товаров не изменился — их pos не трогаем
+            kept = [self._pos[self._positions[i]] for i in new_ids if i in old]
+            # новый товар раньше последнего сохранившегося — между соседями нет свободного pos
+            last_kept = max((n for n, i in enumerate(new_ids) if i in old), default=-1)
+            inserted = any(i not in old for i in new_ids[:last_kept])
+            renumber = inserted or kept != sorted(kept)
+            pos: List[int] = []
+            last = -1
+            for n, (item_id, item) in enumerate(zip(new_ids, new_items)):
+                if renumber:
+                    p = n
+                elif item_id in old:
+                    p = self._pos[self._positions[item_id]]
+                else:
+                    p = max(last + 1, (self._pos[-1] + 1) if self._pos else 0)
+                last = max(last, p)
+                pos.append(p)
+            frozen = [freeze(it) for it in new_items]
+
+            def write() -> None:
+                for item_id in set(old) - set(new_ids):
+                    self._delete_item(item_id)
+                for n, (item_id, item) in enumerate(zip(new_ids, new_items)):
+                    prev = old.get(item_id)
+                    if renumber or prev is None or prev != frozen[n]:
+                        self._write_item(item, pos[n])
+                if raw != self._top:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES ('top', ?)", (json.dumps(raw, ensure_ascii=False),)
+                    )
+
+            self._commit(write)
+            self._top = raw
+            self._set_items(frozen, pos)
+            return result
+
+    def replace(self, data: Dict[str, Any]) -> None:
+        def _replace(raw: Dict[str, Any]) -> None:
+            raw.clear()
+            raw.update(json.loads(json.dumps(data, ensure_ascii=False)))
+
+        self.update(_replace)
+
+    # ---- миграция ----
+    def import_json(self, json_path: str) -> int:
+        """Разовый перенос catalog.json; возвращает число товаров."""
+        # без load_json: битый файл должен остановить перенос, а не очистить каталог
+        with open(json_path, encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError(f"{json_path}: ожидается объект с ключом items")
+        self.replace(data)
+        return len(self._items)
+
+    def export_json(self, json_path: str) -> int:
+        """Выгрузка обратно в формат catalog.json (атомарная запись)."""
+        snap = self.snapshot()
+        data = {**self._top, "items": [thaw(it) for it in snap.items]}
+        save_json(json_path, data)
+        return len(data["items"])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+def open_catalog(json_path: str, sqlite_path: str, check_interval: float = 1.0) -> SqliteCatalogStore:
+    """
+    SQLite-каталог; пока в базу ни разу ничего не записали (нет meta.version),
+    переносит catalog.json. Перенос, упавший на битом JSON, оставляет базу
+    пустой и без версии — следующий запуск попробует снова.
+    """
+    store = SqliteCatalogStore(sqlite_path, check_interval=check_interval)
+    fresh = store._meta("version") is None and not len(store)
+    if fresh and os.path.exists(json_path):
+        n = store.import_json(json_path)
+        logger.info("Каталог перенесён из %s в %s: %s товаров", json_path, sqlite_path, n)
+    return store
+
+# -----------------------------
+# CLI: python catalog_sqlite.py import|export catalog.json catalog.sqlite3
+# -----------------------------
+def main(argv: Iterable[str]) -> int:
+    args = list(argv)
+    if len(args) != 3 or args[0] not in ("import", "export"):
+        print("usage: python catalog_sqlite.py import|export CATALOG_JSON CATALOG_SQLITE", file=sys.stderr)
+        return 2
+    command, json_path, sqlite_path = args
+    store = SqliteCatalogStore(sqlite_path, check_interval=0)
+    try:
+        if command == "import":
+            print(f"imported {store.import_json(json_path)} items into {sqlite_path}")
+        else:
+            print(f"exported {store.export_json(json_path)} items to {json_path}")
+    finally:
+        store.close()
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main(sys.argv[1:]))
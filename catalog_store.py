@@ -0,0 +1,219 @@
+import os
+import copy
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from storage import save_json, JsonWriter
+from catalog_index import CatalogIndex
+
+logger = logging.getLogger("magazin_sumok_bot")
+
+# -----------------------------
+# КАТАЛОГ: неизменяемые снимки
+# -----------------------------
+def freeze(value: Any) -> Any:
+    # dict -> MappingProxyType, list -> tuple (рекурсивно)
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+def thaw(value: Any) -> Any:
+    # обратно к изменяемым dict/list (рекурсивно): копия для правки
+    if isinstance(value, (dict, MappingProxyType)):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(v) for v in value]
+    return value
+
+def _thaw(value: Any) -> Any:
+    if isinstance(value, MappingProxyType):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def catalog_version(data: Dict[str, Any]) -> str:
+    raw = json.dumps(data, ensure_ascii=False, sort_keys=True, default=_thaw).encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()[:12]
+
+class CatalogSnapshot:
+    """
+    Неизменяемый снимок каталога. Отдаётся хендлерам как есть:
+    менять его нельзя, изменения идут только через CatalogStore.update().
+    """
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self.data = freeze(data)
+        self.items: Tuple[Any, ...] = self.data.get("items", ())
+        self._version: Optional[str] = None
+        self._index: Optional[CatalogIndex] = None
+        self._rendered: Dict[Hashable, Any] = {}
+
+    @property
+    def version(self) -> str:
+        # хэш содержимого: одинаков для одинакового каталога и между перезапусками
+        if self._version is None:
+            self._version = catalog_version(self.data)
+        return self._version
+
+    @property
+    def index(self) -> CatalogIndex:
+        # индексы строятся один раз на снимок, т.е. только при изменении каталога
+        if self._index is None:
+            self._index = CatalogIndex(self.items)
+        return self._index
+
+    def rendered(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        # готовые ответы по снимку (страницы каталога): новый каталог — новый снимок и пустой кэш
+        value = self._rendered.get(key)
+        if value is None:
+            value = self._rendered[key] = build()
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        # совместимость со старым кодом: cat.get("items", [])
+        return self.data.get(key, default)
+
+def find_raw_item(raw: Dict[str, Any], item_id: str) -> Optional[Dict[str, Any]]:
+    # линейный поиск по изменяемым данным внутри CatalogStore.update()
+    for it in raw.get("items", []):
+        if str(it.get("id", "")).strip() == str(item_id).strip():
+            return it
+    return None
+
+# -----------------------------
+# КАТАЛОГ: хранилище процесса с hot reload
+# -----------------------------
+class CatalogStore:
+    """
+    Парсит catalog.json один раз и держит снимок в памяти.
+    Файл перечитывается, только если изменились его mtime или размер
+    (проверка не чаще чем раз в check_interval секунд).
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0, writer: Optional[JsonWriter] = None) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self.writer = writer
+        self._lock = threading.Lock()
+        self._raw: Dict[str, Any] = {"items": []}
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._stat: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+
+    def _file_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _read(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {"items": []}
+        except Exception as e:
+            logger.exception("Ошибка чтения каталога %s: %s", self.path, e)
+            return None
+        if not isinstance(data, dict):
+            logger.error("Каталог %s имеет неверный формат", self.path)
+            return None
+        data.setdefault("items", [])
+        return data
+
+    def _reload(self, stat: Optional[Tuple[int, int]]) -> None:
+        data = self._read()
+        self._stat = stat
+        if data is None:
+            # битый файл: оставляем прошлый снимок, а не пустой каталог
+            if self._snapshot is None:
+                self._snapshot = CatalogSnapshot(self._raw)
+            return
+        self._raw = data
+        self._snapshot = CatalogSnapshot(data)
+        logger.info("Каталог загружен: %s товаров", len(self._snapshot.items))
+
+    def snapshot(self) -> CatalogSnapshot:
+        now = time.monotonic()
+        snap = self._snapshot
+        if snap is not None and now - self._checked_at < self.check_interval:
+            return snap
+        with self._lock:
+            self._checked_at = now
+            if self._snapshot is not None and self.writer is not None and self.writer.has_pending(self.path):
+                # наши изменения ещё не на диске — файл сейчас старее памяти
+                return self._snapshot
+            stat = self._file_stat()
+            if self._snapshot is None or stat != self._stat:
+                self._reload(stat)
+            return self._snapshot
+
+    def update(self, mutate: Callable[[Dict[str, Any]], Any]) -> Any:
+        """
+        Применяет mutate к копии «сырых» данных, сохраняет файл и сразу
+        публикует новый снимок (без повторного чтения файла).
+        С writer запись на диск откладывается и склеивается с соседними правками.
+        Возвращает результат mutate.
+        """
+        self.snapshot()
+        with self._lock:
+            raw = copy.deepcopy(self._raw)
+            result = mutate(raw)
+            raw.setdefault("items", [])
+            self._raw = raw
+            self._snapshot = CatalogSnapshot(raw)
+            if self._writer_active():
+                self.writer.schedule(self.path, raw, on_written=self._on_written)
+            elif save_json(self.path, raw):
+                self._stat = self._file_stat()
+            return result
+
+    def _writer_active(self) -> bool:
+        if self.writer is None:
+            return False
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        return True
+
+    def _on_written(self) -> None:
+        with self._lock:
+            self._stat = self._file_stat()
+
+    def update_item(self, item_id: str, mutate: Callable[[Dict[str, Any]], Any]) -> Optional[Dict[str, Any]]:
+        """Правка одного товара (mutate меняет его на месте); None — товара нет."""
+
+        def _update(raw: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+            item = find_raw_item(raw, item_id)
+            if item is not None:
+                mutate(item)
+            return item
+
+        return self.update(_update)
+
+    def add_item(self, item: Dict[str, Any]) -> bool:
+        """Новый товар в конец каталога; False — такой id уже есть."""
+
+        def _add(raw: Dict[str, Any]) -> bool:
+            if find_raw_item(raw, str(item.get("id", ""))):
+                return False
+            raw.setdefault("items", []).append(copy.deepcopy(item))
+            return True
+
+        return self.update(_add)
+
+    def replace(self, data: Dict[str, Any]) -> None:
+        def _replace(raw: Dict[str, Any]) -> None:
+            raw.clear()
+            raw.update(copy.deepcopy(data))
+
+        self.update(_replace)
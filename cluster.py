@@ -0,0 +1,258 @@
+"""
+Несколько процессов-воркеров бота за одним webhook-приёмником.
+
+Главный процесс принимает webhook от Telegram и раскладывает апдейты по
+воркерам по хэшу chat_id: все апдейты чата попадают в один процесс, поэтому
+user_data, шаги оформления заказа и порядок сообщений остаются как в одном
+процессе. Апдейты админов (ADMIN_IDS) всегда идут в воркер 0 — только он
+меняет каталог и индекс фото; остальные воркеры подхватывают заменённые
+файлы (catalog.json, photo_index.npz) через обычный hot reload.
+
+Каждый воркер — обычный bot.build_application() без Updater, хендлеры те же.
+
+Запуск:
+    BOT_MODE=webhook BOT_WORKERS=4 WEBHOOK_URL=https://host python bot.py
+    (или python cluster.py)
+"""
+import os
+import sys
+import json
+import zlib
+import signal
+import asyncio
+import logging
+import importlib
+import threading
+import multiprocessing as mp
+from typing import Any, Callable, Dict, List, Optional
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+from telegram import Bot, Update
+from telegram.ext import ApplicationBuilder
+
+logger = logging.getLogger("magazin_sumok_bot")
+
+# -----------------------------
+# МАРШРУТИЗАЦИЯ
+# -----------------------------
+def route_update(data: Dict[str, Any], workers: int, admin_ids=frozenset()) -> int:
+    """Номер воркера для апдейта (сырой JSON от Telegram)."""
+    update = Update.de_json(data, None)
+    user = update.effective_user
+    if user is not None and user.id in admin_ids:
+        return 0
+    if update.effective_chat is not None:
+        key = update.effective_chat.id
+    elif user is not None:
+        key = user.id
+    else:
+        return 0
+    # crc32, а не key % workers: id чатов идут не случайно
+    return zlib.crc32(str(key).encode()) % workers
+
+# -----------------------------
+# ВОРКЕР
+# -----------------------------
+def _bot_module() -> Any:
+    """
+    Уже загруженный модуль бота. При «python bot.py» это __main__, а в воркере
+    (spawn заново выполняет главный скрипт) — __mp_main__; import bot рядом с ним
+    создал бы вторую копию со своими хранилищами, метриками и таймерами.
+    """
+    for name in ("__main__", "__mp_main__"):
+        module = sys.modules.get(name)
+        if module is not None and hasattr(module, "build_application"):
+            return module
+    import bot
+
+    return bot
+
+def _load_factory(path: str) -> Callable[[], ApplicationBuilder]:
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+def worker_main(worker_id: int, queue: Any, builder_factory: Optional[str] = None) -> None:
+    """
+    Точка входа процесса-воркера. builder_factory — "модуль:функция",
+    возвращающая ApplicationBuilder (бенчмарки подставляют фейковый Telegram).
+    """
+    os.environ["BOT_WORKER_ID"] = str(worker_id)
+    # Ctrl+C получает вся группа процессов; останавливает воркеров главный процесс
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    bot = _bot_module()
+
+    if builder_factory:
+        builder = _load_factory(builder_factory)()
+    else:
+        builder = ApplicationBuilder().token(bot.BOT_TOKEN)
+    app = bot.build_application(builder.updater(None))
+    asyncio.run(_serve_worker(app, queue))
+
+async def _serve_worker(app, queue: Any) -> None:
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+
+    def feed(raw: bytes) -> None:
+        app.update_queue.put_nowait(Update.de_json(json.loads(raw), app.bot))
+
+    def pump() -> None:
+        # multiprocessing.Queue блокирующая — читаем её в отдельном потоке
+        while True:
+            raw = queue.get()
+            if raw is None:
+                loop.call_soon_threadsafe(stopped.set)
+                return
+            loop.call_soon_threadsafe(feed, raw)
+
+    # без Updater post_init/post_shutdown сами не вызываются (это делает run_webhook)
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    threading.Thread(target=pump, name="update-pump", daemon=True).start()
+    await stopped.wait()
+    await app.stop()
+    if app.post_stop:
+        await app.post_stop(app)
+    await app.shutdown()
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+
+# -----------------------------
+# ПРИЁМНИК WEBHOOK
+# -----------------------------
+class WebhookReceiver(tornado.web.RequestHandler):
+    def initialize(self, cluster: "Cluster") -> None:
+        self.cluster = cluster
+
+    def post(self) -> None:
+        secret = self.cluster.secret_token
+        if secret and self.request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            raise tornado.web.HTTPError(403)
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            raise tornado.web.HTTPError(400)
+        self.cluster.dispatch(data, self.request.body)
+
+class Cluster:
+    """Процессы-воркеры и их очереди; dispatch() отдаёт апдейт нужному воркеру."""
+
+    def __init__(
+        self,
+        workers: int,
+        admin_ids=frozenset(),
+        secret_token: str = "",
+        builder_factory: Optional[str] = None,
+    ) -> None:
+        self.workers = workers
+        self.admin_ids = frozenset(admin_ids)
+        self.secret_token = secret_token
+        self.builder_factory = builder_factory
+        # spawn: воркер импортирует bot с нуля, без копий семафоров и потоков родителя
+        self._ctx = mp.get_context("spawn")
+        self.queues = [self._ctx.Queue() for _ in range(workers)]
+        self.processes: List[Optional[mp.Process]] = [None] * workers
+        self.routed = [0] * workers
+        self._stopping = False
+
+    def _spawn(self, worker_id: int) -> None:
+        p = self._ctx.Process(
+            target=worker_main,
+            args=(worker_id, self.queues[worker_id], self.builder_factory),
+            name=f"bot-worker-{worker_id}",
+        )
+        # BOT_WORKER_ID — уже в окружении процесса: при «python bot.py» spawn выполняет
+        # bot.py (конфиг воркера) ещё до worker_main
+        previous = os.environ.get("BOT_WORKER_ID")
+        os.environ["BOT_WORKER_ID"] = str(worker_id)
+        try:
+            p.start()
+        finally:
+            if previous is None:
+                os.environ.pop("BOT_WORKER_ID", None)
+            else:
+                os.environ["BOT_WORKER_ID"] = previous
+        self.processes[worker_id] = p
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            self._spawn(i)
+        logger.info("Запущено воркеров: %s", self.workers)
+
+    def dispatch(self, data: Dict[str, Any], raw: bytes) -> int:
+        worker_id = route_update(data, self.workers, self.admin_ids)
+        self.queues[worker_id].put(raw)
+        self.routed[worker_id] += 1
+        return worker_id
+
+    async def watch(self, interval: float = 1.0) -> None:
+        # упавший воркер перезапускаем; апдейты, ждущие в его очереди, не теряются
+        while not self._stopping:
+            await asyncio.sleep(interval)
+            for i, p in enumerate(self.processes):
+                if not self._stopping and p is not None and not p.is_alive():
+                    logger.error("Воркер %s завершился (код %s) — перезапускаю", i, p.exitcode)
+                    self._spawn(i)
+
+    def stop(self, timeout: float = 30.0) -> None:
+        self._stopping = True
+        for q in self.queues:
+            q.put(None)
+        for i, p in enumerate(self.processes):
+            if p is None:
+                continue
+            p.join(timeout)
+            if p.is_alive():
+                logger.warning("Воркер %s не остановился за %s с — завершаю принудительно", i, timeout)
+                p.terminate()
+                p.join()
+
+    def make_app(self, url_path: str) -> tornado.web.Application:
+        return tornado.web.Application([(rf"/{url_path}/?", WebhookReceiver, {"cluster": self})])
+
+async def serve(cluster: Cluster, listen: str, port: int, url_path: str) -> None:
+    """Принимает webhook, пока не придёт SIGINT/SIGTERM, затем останавливает воркеров."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    cluster.start()
+    server = HTTPServer(cluster.make_app(url_path), xheaders=True)
+    server.listen(port, address=listen)
+    watcher = asyncio.create_task(cluster.watch())
+    try:
+        await stop.wait()
+    finally:
+        server.stop()
+        watcher.cancel()
+        await asyncio.to_thread(cluster.stop)
+
+def run(workers: int, bot: Any = None) -> None:
+    """bot — уже загруженный модуль бота (из bot.main() — он сам, без повторного импорта)."""
+    if bot is None:
+        bot = _bot_module()
+
+    async def _main() -> None:
+        webhook_url = bot.WEBHOOK_URL.rstrip("/") + "/" + bot.WEBHOOK_PATH
+        # webhook регистрирует только главный процесс, воркеры к Telegram за апдейтами не ходят
+        async with Bot(bot.BOT_TOKEN) as tg:
+            await tg.set_webhook(
+                webhook_url,
+                secret_token=bot.WEBHOOK_SECRET_TOKEN or None,
+                max_connections=bot.WEBHOOK_MAX_CONNECTIONS,
+                drop_pending_updates=bot.DROP_PENDING_UPDATES,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        logger.info("Bot started (webhook %s, port %s, workers %s).", bot.WEBHOOK_URL, bot.WEBHOOK_PORT, workers)
+        cluster = Cluster(workers, admin_ids=bot.ADMIN_IDS, secret_token=bot.WEBHOOK_SECRET_TOKEN)
+        await serve(cluster, bot.WEBHOOK_LISTEN, bot.WEBHOOK_PORT, bot.WEBHOOK_PATH)
+
+    asyncio.run(_main())
+
+if __name__ == "__main__":
+    import bot
+
+    run(bot.BOT_WORKERS, bot)
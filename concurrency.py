@@ -0,0 +1,75 @@
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Базовый семафор BaseUpdateProcessor берётся ДО нашей блокировки чата;
+# чтобы апдейты, ждущие своей очереди в чате, не занимали слоты, он не ограничивает
+_NO_LIMIT = 2 ** 31 - 1
+
+def update_chat_key(update: object) -> Optional[int]:
+    # Порядок гарантируем в пределах чата (для апдейтов без чата — в пределах пользователя)
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return None
+
+# -----------------------------
+# ПАРАЛЛЕЛЬНАЯ ОБРАБОТКА С ПОРЯДКОМ ВНУТРИ ЧАТА
+# -----------------------------
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Разные чаты обрабатываются параллельно (не больше max_concurrent_updates),
+    апдейты одного чата — строго по очереди в порядке поступления.
+    Так шаги оформления заказа (ORDER_NAME … ORDER_COMMENT) не обгоняют друг друга.
+    """
+
+    def __init__(self, max_concurrent_updates: int) -> None:
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        self._limit = max_concurrent_updates
+        super().__init__(_NO_LIMIT)
+        self._workers = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._chat_waiting: Dict[int, int] = {}
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        return self._limit
+
+    @property
+    def active_chats(self) -> int:
+        return len(self._chat_locks)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = update_chat_key(update)
+        if key is None:
+            async with self._workers:
+                await coroutine
+            return
+
+        # asyncio.Lock будит ожидающих по FIFO, а задачи на апдейты создаются
+        # в порядке поступления — значит, и выполняются в этом порядке
+        lock = self._chat_locks.get(key)
+        if lock is None:
+            lock = self._chat_locks[key] = asyncio.Lock()
+        self._chat_waiting[key] = self._chat_waiting.get(key, 0) + 1
+        try:
+            async with lock:
+                async with self._workers:
+                    await coroutine
+        finally:
+            self._chat_waiting[key] -= 1
+            if not self._chat_waiting[key]:
+                del self._chat_waiting[key]
+                del self._chat_locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,58 @@
+import io
+import base64
+import logging
+from typing import Optional, Sequence
+
+try:
+    from PIL import Image
+except ImportError:  # без Pillow фото уходит как есть, без уменьшения
+    Image = None
+
+logger = logging.getLogger("magazin_sumok_bot")
+
+# -----------------------------
+# ВЫБОР РАЗМЕРА ФОТО
+# -----------------------------
+def pick_photo_size(sizes: Sequence, min_side: int, max_bytes: int = 0):
+    """
+    Самый маленький PhotoSize, у которого меньшая сторона >= min_side.
+    Если таких нет — самый большой из подходящих по max_bytes.
+    """
+    if not sizes:
+        return None
+    ordered = sorted(sizes, key=lambda p: p.width * p.height)
+    if max_bytes:
+        fitting = [p for p in ordered if not p.file_size or p.file_size <= max_bytes]
+        ordered = fitting or ordered[:1]
+    for p in ordered:
+        if min(p.width, p.height) >= min_side:
+            return p
+    return ordered[-1]
+
+# -----------------------------
+# УМЕНЬШЕНИЕ И JPEG
+# -----------------------------
+def downscale_jpeg(src: io.BytesIO, max_side: int, quality: int) -> Optional[bytes]:
+    """
+    Читает картинку прямо из буфера, уменьшает до max_side по большей стороне
+    и пережимает в JPEG. Без Pillow (или на битом файле) — исходные байты.
+    """
+    src.seek(0)
+    if Image is None:
+        return src.getvalue() or None
+    try:
+        with Image.open(src) as img:
+            # JPEG: декодер сразу отдаёт уменьшенную картинку (в разы быстрее и меньше памяти)
+            img.draft("RGB", (max_side, max_side))
+            img = img.convert("RGB")
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+            out = io.BytesIO()
+            img.save(out, "JPEG", quality=quality, optimize=True)
+            return out.getvalue()
+    except Exception as e:
+        logger.warning("Не удалось уменьшить фото: %s", e)
+        return src.getvalue() or None
+
+def jpeg_data_url(image_bytes: bytes) -> str:
+    # один проход base64 прямо в ASCII-строку data URL
+    return "data:image/jpeg;base64," + base64.b64encode(image_bytes).decode("ascii")
@@ -0,0 +1,151 @@
+import re
+import json
+import math
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+from catalog_index import normalize_text, tokenize
+
+# -----------------------------
+# ШАБЛОНЫ НАМЕРЕНИЙ (ru/kz)
+# -----------------------------
+# Порядок важен: первое сработавшее намерение выигрывает
+INTENT_PATTERNS: List[Tuple[str, List[str]]] = [
+    ("menu", [r"^меню$", r"^мәзір$"]),
+    # только если сообщение целиком — приветствие/благодарность
+    ("greeting", [r"^(здравствуйте|здрасте|привет|добрый (день|вечер)|сал[еа]м|сәлем|сәлеметсіз бе)\W*$"]),
+    ("thanks", [r"^(спасибо|благодарю|рахмет|спс)\W*$"]),
+    # только желание заказать сейчас; прошедшее («я заказала вчера, где посылка?») — консультанту
+    ("order", [
+        r"\bхочу (за|о)?(каз|форм|куп)", r"\bоформ(ить|лю|им|ите)\b.*\bзаказ", r"\b(заказываю|закажу|куплю)\b",
+        r"\b(можно|могу|как|давайте|хотел[аи]? бы) (ли )?(я )?(за|о)?(каза?ть|казывать|формить|купить)\b",
+        r"\bтапсырыс бер(емін|ем|гім|ейін|у)\b", r"\bсатып ал(ам|ғым|айын)",
+    ]),
+    # доставка раньше цены: «сколько стоит доставка?» — вопрос о доставке
+    ("delivery", [
+        r"\bдоставк", r"\bдоставля", r"\bдоставит", r"\bкурьер", r"\bсамовывоз", r"\bотправ(ка|ите|ляете|ите ли)\b",
+        r"\bпочт(ой|а|у)\b", r"казпочт", r"\bсдэк\b", r"\bcdek\b", r"\bжеткіз", r"\bпошта",
+    ]),
+    ("price", [
+        r"\bцен[аыуе]\b", r"сколько стоит", r"скока стоит", r"\bпоч[её]м\b", r"\bстоимость\b",
+        r"\bбаға", r"қанша тұрады", r"қанша тенге",
+    ]),
+    ("catalog", [
+        r"\bкаталог", r"\bассортимент", r"\bчто (у вас )?есть\b", r"\bкакие (у вас )?(есть )?(сумки|модели)",
+        r"\bпокажи(те)? (все|сумки|модели)", r"\bтізім", r"\bқандай (сөмке|модель)", r"\bне бар\b",
+    ]),
+]
+
+# Названия модели без лишних слов («Ariana Classic», «есть bella mini?») — сразу карточка
+ITEM_MAX_WORDS = 4
+
+class Intent(NamedTuple):
+    name: str                 # menu / greeting / thanks / order / price / delivery / catalog / item / "" (к модели)
+    via: str                  # pattern / catalog / model / none
+    item: Optional[Mapping[str, Any]] = None
+
+# -----------------------------
+# КРОШЕЧНЫЙ КЛАССИФИКАТОР (необязательный)
+# -----------------------------
+class NaiveBayesIntents:
+    """
+    Мультиномиальный наивный Байес по токенам tokenize().
+    Учится на JSONL {"text": ..., "intent": ...}; срабатывает только при
+    уверенности >= min_prob — сомнительное уходит модели, а не в неверный ответ.
+    """
+
+    def __init__(self, examples: Iterable[Tuple[str, str]], min_prob: float = 0.9) -> None:
+        self.min_prob = min_prob
+        self._docs: Counter = Counter()
+        self._words: Dict[str, Counter] = {}
+        self._totals: Counter = Counter()
+        vocab = set()
+        for text, intent in examples:
+            tokens = tokenize(text)
+            if not tokens:
+                continue
+            self._docs[intent] += 1
+            self._words.setdefault(intent, Counter()).update(tokens)
+            self._totals[intent] += len(tokens)
+            vocab.update(tokens)
+        self._vocab = len(vocab) or 1
+        self._n = sum(self._docs.values())
+
+    def __len__(self) -> int:
+        return self._n
+
+    @classmethod
+    def from_jsonl(cls, path: str, min_prob: float = 0.9) -> "NaiveBayesIntents":
+        examples = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                if row.get("text") and row.get("intent"):
+                    examples.append((row["text"], row["intent"]))
+        return cls(examples, min_prob=min_prob)
+
+    def predict(self, text: str) -> Optional[Tuple[str, float]]:
+        tokens = tokenize(text)
+        if not tokens or not self._n:
+            return None
+        scores = {}
+        for intent, docs in self._docs.items():
+            words, total = self._words[intent], self._totals[intent]
+            score = math.log(docs / self._n)
+            for t in tokens:
+                score += math.log((words[t] + 1) / (total + self._vocab))
+            scores[intent] = score
+        top = max(scores.values())
+        norm = sum(math.exp(s - top) for s in scores.values())
+        intent = max(scores, key=scores.get)
+        prob = 1.0 / norm
+        return (intent, prob) if prob >= self.min_prob else None
+
+# -----------------------------
+# РОУТЕР
+# -----------------------------
+class IntentRouter:
+    """
+    Быстрая классификация текста до вызова LLM:
+    шаблоны -> название модели из каталога -> (опц.) классификатор.
+    Пустое имя намерения — отдать консультанту.
+    """
+
+    def __init__(
+        self,
+        patterns: List[Tuple[str, List[str]]] = INTENT_PATTERNS,
+        model: Optional[NaiveBayesIntents] = None,
+    ) -> None:
+        self._patterns = [(name, re.compile("|".join(f"(?:{p})" for p in ps))) for name, ps in patterns]
+        self.model = model
+
+    def match_patterns(self, text: str) -> str:
+        t = normalize_text(text).replace("ё", "е")
+        for name, rx in self._patterns:
+            if rx.search(t):
+                return name
+        return ""
+
+    def classify(
+        self, text: str, find_item: Optional[Callable[[str], Optional[Mapping[str, Any]]]] = None
+    ) -> Intent:
+        name = self.match_patterns(text)
+        if name in ("menu", "greeting", "thanks", "order"):
+            return Intent(name, "pattern")
+
+        item = find_item(text) if find_item is not None else None
+        # «сколько стоит Ariana?» или просто название модели — карточка товара;
+        # длинный вопрос с названием («что надеть с Ariana на свадьбу») — консультанту
+        if item is not None and (name == "price" or len(text.split()) <= ITEM_MAX_WORDS):
+            return Intent("item", "catalog", item)
+        if name:
+            return Intent(name, "pattern")
+
+        if self.model is not None:
+            predicted = self.model.predict(text)
+            if predicted is not None and predicted[0] in ("price", "delivery", "catalog"):
+                return Intent(predicted[0], "model")
+        return Intent("", "none")
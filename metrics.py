@@ -0,0 +1,211 @@
+import time
+import asyncio
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger("magazin_sumok_bot")
+
+# Границы корзин гистограмм, сек: от быстрых lookup'ов до долгих вызовов модели
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# -----------------------------
+# МЕТРИКИ (текстовый формат Prometheus, без внешних зависимостей)
+# -----------------------------
+class Counter:
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(str(labels.get(n, "")) for n in self.label_names), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {_fmt(value)}")
+        return lines
+
+class Gauge(Counter):
+    """Последнее выставленное значение (например, длительность фаз старта)."""
+
+    def set(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._lock = threading.Lock()
+        # по набору меток: [счётчики корзин..., сумма, количество]
+        self._values: Dict[LabelValues, List[float]] = {}
+        self._listeners: List[Callable[[float, Dict[str, str]], None]] = []
+
+    def subscribe(self, listener: Callable[[float, Dict[str, str]], None]) -> None:
+        """listener(value, labels) на каждое наблюдение — бенчмарки собирают сырые значения для перцентилей."""
+        self._listeners.append(listener)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+        for listener in self._listeners:
+            listener(value, labels)
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for key, row in sorted(self._values.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                le = 'le="' + _fmt(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {_fmt(cumulative)}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_fmt(row[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {_fmt(row[-1])}")
+        return lines
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[Any] = []
+
+    def register(self, metric: Any) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, doc: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, doc, labels))
+
+    def gauge(self, name: str, doc: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, doc, labels))
+
+    def histogram(self, name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, doc, labels, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram("bot_handler_seconds", "Время обработки апдейта хендлером", ["handler"])
+HANDLER_ERRORS = REGISTRY.counter("bot_handler_errors_total", "Исключения, вылетевшие из хендлера", ["handler"])
+PHOTO_STAGE_SECONDS = REGISTRY.histogram("bot_photo_stage_seconds", "Время этапов распознавания фото", ["stage"])
+CACHE_REQUESTS = REGISTRY.counter("bot_cache_requests_total", "Обращения к кэшам и локальным индексам", ["cache", "result"])
+OPENAI_SECONDS = REGISTRY.histogram("openai_request_seconds", "Время запроса к OpenAI (до полного ответа)", ["kind"])
+OPENAI_FIRST_CHUNK_SECONDS = REGISTRY.histogram("openai_first_chunk_seconds", "Время до первого куска потокового ответа", ["kind"])
+OPENAI_ERRORS = REGISTRY.counter("openai_errors_total", "Ошибки запросов к OpenAI", ["kind", "error"])
+OPENAI_TOKENS = REGISTRY.counter("openai_tokens_total", "Токены OpenAI (prompt / cached / completion)", ["kind", "type"])
+ERRORS = REGISTRY.counter("bot_errors_total", "Ошибки, дошедшие до on_error", ["error"])
+AI_RATE_LIMITED = REGISTRY.counter("bot_ai_rate_limited_total", "Запросы к ИИ, отклонённые лимитом", ["kind"])
+AI_COALESCED = REGISTRY.counter("bot_ai_coalesced_total", "Запросы к ИИ, слитые с уже идущими", ["kind"])
+INTENTS = REGISTRY.counter("bot_intent_total", "Тексты по намерению и способу распознавания (none — к LLM)", ["intent", "via"])
+STARTUP_SECONDS = REGISTRY.gauge("bot_startup_seconds", "Длительность фаз старта процесса, сек", ["phase"])
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+def timed_handler(func: F) -> F:
+    """Меряет время хендлера и считает исключения (имя метки — имя функции)."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        t0 = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - t0, handler=name)
+
+    return wrapper  # type: ignore[return-value]
+
+def stage(name: str):
+    """with stage("download"): ... — время одного этапа on_photo."""
+    return PHOTO_STAGE_SECONDS.time(stage=name)
+
+def cache_result(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+# -----------------------------
+# /metrics (минимальный HTTP на asyncio)
+# -----------------------------
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, registry: Registry) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # заголовки не нужны, но их надо дочитать
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        path = parts[1].split("?")[0] if len(parts) > 1 else ""
+        if path == "/metrics":
+            status, body, ctype = "200 OK", registry.render().encode(), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            status, body, ctype = "404 Not Found", b"not found\n", "text/plain"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def start_metrics_server(host: str, port: int, registry: Registry = REGISTRY) -> asyncio.AbstractServer:
+    server = await asyncio.start_server(lambda r, w: _handle(r, w, registry), host, port)
+    logger.info("Метрики: http://%s:%s/metrics", host, port)
+    return server
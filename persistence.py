@@ -0,0 +1,223 @@
+import json
+import asyncio
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger("magazin_sumok_bot")
+
+# Пространства ключей: user_data и состояния ConversationHandler (conv:<name>)
+USER_DATA = "user_data"
+
+# -----------------------------
+# БЭКЕНДЫ: namespace -> {key: json}
+# -----------------------------
+class SqliteBackend:
+    """Одна таблица kv в SQLite (WAL); вызовы идут в потоке, чтобы не блокировать event loop."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._conn.commit()
+
+    def _load(self, namespace: str, key: Optional[str]) -> Dict[str, str]:
+        with self._lock:
+            if key is None:
+                rows = self._conn.execute("SELECT key, value FROM kv WHERE namespace = ?", (namespace,))
+            else:
+                rows = self._conn.execute("SELECT key, value FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+            return dict(rows.fetchall())
+
+    def _write(self, batch: Dict[Tuple[str, str], Optional[str]]) -> None:
+        with self._lock, self._conn:
+            for (namespace, key), value in batch.items():
+                if value is None:
+                    self._conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+                else:
+                    self._conn.execute(
+                        "INSERT INTO kv (namespace, key, value) VALUES (?, ?, ?)"
+                        " ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value",
+                        (namespace, key, value),
+                    )
+
+    async def load(self, namespace: str, key: Optional[str] = None) -> Dict[str, str]:
+        return await asyncio.to_thread(self._load, namespace, key)
+
+    async def write(self, batch: Dict[Tuple[str, str], Optional[str]]) -> None:
+        await asyncio.to_thread(self._write, batch)
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class RedisBackend:
+    """Хэш на namespace: HSET <prefix>:<namespace> key value; пачка — один pipeline (MULTI)."""
+
+    def __init__(self, url: str = "", prefix: str = "magazin_sumok", client: Any = None) -> None:
+        if client is None:
+            # импорт только для PERSISTENCE_BACKEND=redis: redis.asyncio — заметная доля холодного старта
+            try:
+                import redis.asyncio as aioredis
+            except ImportError:
+                raise RuntimeError("Для PERSISTENCE_BACKEND=redis установите пакет redis (pip install redis).")
+            client = aioredis.from_url(url, decode_responses=True)
+        self.redis = client
+        self.prefix = prefix
+
+    def _name(self, namespace: str) -> str:
+        return f"{self.prefix}:{namespace}"
+
+    async def load(self, namespace: str, key: Optional[str] = None) -> Dict[str, str]:
+        if key is None:
+            return dict(await self.redis.hgetall(self._name(namespace)))
+        value = await self.redis.hget(self._name(namespace), key)
+        return {} if value is None else {key: value}
+
+    async def write(self, batch: Dict[Tuple[str, str], Optional[str]]) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for (namespace, key), value in batch.items():
+                if value is None:
+                    pipe.hdel(self._name(namespace), key)
+                else:
+                    pipe.hset(self._name(namespace), key, value)
+            await pipe.execute()
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+# -----------------------------
+# PERSISTENCE для python-telegram-bot
+# -----------------------------
+class KVPersistence(BasePersistence):
+    """
+    Хранит user_data (mode, order, bind_item_id) и состояния ConversationHandler
+    во внешнем хранилище, чтобы переживать рестарт и запускать несколько воркеров.
+
+    Запись отложенная: update_* только кладут изменения в буфер, а через
+    flush_delay секунд весь буфер уходит одной транзакцией/pipeline.
+    refresh=True — перечитывать user_data перед каждым апдейтом
+    (нужно, только если один чат могут обслуживать разные воркеры).
+    """
+
+    def __init__(self, backend: Any, update_interval: float = 1.0, flush_delay: float = 0.5, refresh: bool = False) -> None:
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.backend = backend
+        self.flush_delay = flush_delay
+        self.refresh = refresh
+        self._pending: Dict[Tuple[str, str], Optional[str]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._writing = False
+        self.batches = 0
+
+    # --- буфер записи ---
+    def _put(self, namespace: str, key: str, value: Any) -> None:
+        self._pending[(namespace, key)] = None if value is None else json.dumps(value, ensure_ascii=False)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_delay)
+        self._writing = True
+        try:
+            await self._write_pending()
+        finally:
+            self._writing = False
+
+    def _requeue(self, batch: Dict[Tuple[str, str], Optional[str]]) -> None:
+        # не теряем: вернём в буфер, новые значения важнее старых
+        batch.update(self._pending)
+        self._pending = batch
+
+    async def _write_pending(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            await self.backend.write(batch)
+            self.batches += 1
+        except asyncio.CancelledError:
+            self._requeue(batch)
+            raise
+        except Exception as e:
+            logger.exception("Ошибка записи persistence (%s ключей): %s", len(batch), e)
+            self._requeue(batch)
+
+    async def flush(self) -> None:
+        task = self._flush_task
+        if task is not None and not task.done():
+            if self._writing:
+                # пачка уже ушла в backend — дождаться, отмена оборвала бы запись
+                await asyncio.gather(task, return_exceptions=True)
+            else:
+                task.cancel()
+        await self._write_pending()
+        await self.backend.close()
+
+    # --- user_data ---
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        raw = await self.backend.load(USER_DATA)
+        return {int(k): json.loads(v) for k, v in raw.items()}
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        self._put(USER_DATA, str(user_id), data)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._put(USER_DATA, str(user_id), None)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        if not self.refresh or (USER_DATA, str(user_id)) in self._pending:
+            return
+        raw = await self.backend.load(USER_DATA, str(user_id))
+        if str(user_id) in raw:
+            user_data.clear()
+            user_data.update(json.loads(raw[str(user_id)]))
+
+    # --- разговоры (оформление заказа) ---
+    async def get_conversations(self, name: str) -> Dict[Tuple[Any, ...], object]:
+        raw = await self.backend.load(f"conv:{name}")
+        return {tuple(json.loads(k)): json.loads(v) for k, v in raw.items()}
+
+    async def update_conversation(self, name: str, key: Tuple[Any, ...], new_state: Optional[object]) -> None:
+        self._put(f"conv:{name}", json.dumps(list(key)), new_state)
+
+    # --- не используются (store_data выключен) ---
+    async def get_chat_data(self) -> Dict[int, Any]:
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Any) -> None:
+        pass
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def update_bot_data(self, data: Any) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Any) -> None:
+        pass
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
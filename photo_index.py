@@ -0,0 +1,242 @@
+import io
+import os
+import logging
+import tempfile
+import time
+import threading
+from typing import List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:  # без numpy/Pillow локальный индекс отключён, работает только vision-модель
+    np = None
+    Image = None
+
+logger = logging.getLogger("magazin_sumok_bot")
+
+# Меняется при изменении извлечения признаков: старый индекс пересобирается
+# (2 — признаки считаются по уменьшенному JPEG, см. download_file_jpeg)
+FEATURES_VERSION = 2
+
+# -----------------------------
+# ПРИЗНАКИ КАРТИНКИ (CPU, numpy)
+# -----------------------------
+def image_features(image_bytes: bytes) -> Optional["np.ndarray"]:
+    """
+    Компактный вектор (256 float32, норма 1): гистограмма цвета в HSV
+    + гистограммы направлений градиентов по сетке 4x4 (форма, фурнитура).
+    """
+    if np is None or not image_bytes:
+        return None
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img.draft("RGB", (256, 256))
+            rgb = img.convert("RGB").resize((64, 64), Image.BILINEAR)
+    except Exception as e:
+        logger.warning("Не удалось прочитать фото для индекса: %s", e)
+        return None
+
+    hsv = np.asarray(rgb.convert("HSV"), dtype=np.float32).reshape(-1, 3)
+    color, _ = np.histogramdd(hsv, bins=(8, 4, 4), range=((0, 256), (0, 256), (0, 256)))
+    color = np.sqrt(color.ravel() / hsv.shape[0])
+
+    gray = np.asarray(rgb.convert("L"), dtype=np.float32) / 255.0
+    gx = np.zeros_like(gray)
+    gy = np.zeros_like(gray)
+    gx[:, 1:-1] = gray[:, 2:] - gray[:, :-2]
+    gy[1:-1, :] = gray[2:, :] - gray[:-2, :]
+    mag = np.hypot(gx, gy)
+    ori = ((np.arctan2(gy, gx) % np.pi) / np.pi * 8).astype(np.int64).clip(0, 7)
+    cells = np.zeros((4, 4, 8), dtype=np.float32)
+    cy = (np.arange(64) // 16)[:, None].repeat(64, axis=1)
+    cx = (np.arange(64) // 16)[None, :].repeat(64, axis=0)
+    np.add.at(cells, (cy, cx, ori), mag)
+    shape = np.sqrt(cells.ravel() / (cells.sum() + 1e-6))
+
+    vec = np.concatenate([color, shape]).astype(np.float32)
+    vec -= vec.mean()  # центрирование: иначе косинус у любых фото близок к 1
+    norm = float(np.linalg.norm(vec))
+    if norm == 0.0:
+        return None
+    return vec / norm
+
+# -----------------------------
+# ИНДЕКС ПРИВЯЗАННЫХ ФОТО (ближайший сосед по косинусу)
+# -----------------------------
+class PhotoIndex:
+    """
+    Матрица признаков всех фото, привязанных через /bind.
+    Поиск — одно умножение матрицы на вектор; хранится в .npz рядом с каталогом.
+    Строки дописываются в заранее выделенный буфер (ёмкость удваивается), а файл
+    пишется в фоне не чаще раза в save_delay секунд — серия привязок даёт одну запись.
+    refresh() подхватывает файл, заменённый другим процессом (см. cluster.py).
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0, save_delay: float = 2.0) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self.save_delay = save_delay
+        self._lock = threading.Lock()
+        self._buf = None
+        self._size = 0
+        # (срез матрицы, item_ids) — одна ссылка: поиск читает её без блокировки
+        self._published: Tuple[Optional["np.ndarray"], List[str]] = (None, [])
+        self.item_ids: List[str] = []
+        self.file_ids: List[str] = []
+        self._file_set: Set[str] = set()
+        self._dirty = False
+        self._timer: Optional[threading.Timer] = None
+        self._stat: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return np is not None
+
+    @property
+    def vectors(self) -> Optional["np.ndarray"]:
+        return self._published[0]
+
+    def _publish_locked(self) -> None:
+        # срез буфера: строки дальше _size ещё не заполнены
+        view = None if self._buf is None else self._buf[: self._size]
+        self._published = (view, self.item_ids)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _file_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _load(self) -> None:
+        self._stat = self._file_stat()
+        if np is None or self._stat is None:
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if int(data["features_version"]) != FEATURES_VERSION:
+                    logger.info("Индекс фото устарел (версия признаков) — будет пересобран")
+                    return
+                vectors = data["vectors"].astype(np.float32)
+                item_ids = [str(x) for x in data["item_ids"]]
+                file_ids = [str(x) for x in data["file_ids"]]
+        except Exception as e:
+            logger.exception("Ошибка чтения индекса фото %s: %s", self.path, e)
+            return
+        self._buf = vectors if len(item_ids) else None
+        self._size = len(item_ids)
+        self.item_ids = item_ids
+        self.file_ids = file_ids
+        self._file_set = set(file_ids)
+        self._publish_locked()
+
+    def _save_locked(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".photo_index.", suffix=".npz", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    features_version=np.array(FEATURES_VERSION),
+                    vectors=self.vectors if self._size else np.zeros((0, 0), np.float32),
+                    item_ids=np.array(self.item_ids, dtype=str),
+                    file_ids=np.array(self.file_ids, dtype=str),
+                )
+            os.replace(tmp_path, self.path)
+            self._stat = self._file_stat()
+            self._dirty = False
+        except Exception as e:
+            logger.exception("Ошибка записи индекса фото %s: %s", self.path, e)
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _schedule_save_locked(self) -> None:
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(self.save_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> None:
+        """Записать несохранённые строки сейчас (таймер, остановка бота)."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._dirty:
+                self._save_locked()
+
+    def refresh(self) -> None:
+        now = time.monotonic()
+        if np is None or now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        if self._file_stat() != self._stat:
+            with self._lock:
+                # свои строки ещё не на диске — файл старее памяти
+                if not self._dirty:
+                    self._load()
+
+    def has_file(self, file_id: str) -> bool:
+        return file_id in self._file_set
+
+    def _append_locked(self, rows: "np.ndarray") -> None:
+        needed = self._size + len(rows)
+        if self._buf is None or needed > len(self._buf) or self._buf.shape[1] != rows.shape[1]:
+            capacity = max(64, needed, 2 * (len(self._buf) if self._buf is not None else 0))
+            grown = np.empty((capacity, rows.shape[1]), dtype=np.float32)
+            if self._size:
+                grown[: self._size] = self._buf[: self._size]
+            # поиск мог взять старый срез — он остаётся целым, буфер просто заменяется
+            self._buf = grown
+        self._buf[self._size : needed] = rows
+        self._size = needed
+
+    def add(self, item_id: str, file_id: str, vec: "np.ndarray") -> None:
+        self.add_many([(item_id, file_id, vec)])
+
+    def add_many(self, entries: List[Tuple[str, str, "np.ndarray"]]) -> int:
+        """Пачка (item_id, file_id, вектор); файл запишется в фоне одной записью."""
+        with self._lock:
+            fresh = []
+            for item_id, file_id, vec in entries:
+                if file_id not in self._file_set:
+                    self._file_set.add(file_id)
+                    fresh.append((item_id, file_id, vec))
+            if not fresh:
+                return 0
+            # сначала id, потом строки: у опубликованного среза строк не больше, чем id
+            self.item_ids.extend(i for i, _, _ in fresh)
+            self.file_ids.extend(f for _, f, _ in fresh)
+            self._append_locked(np.stack([v.reshape(-1).astype(np.float32) for _, _, v in fresh]))
+            self._publish_locked()
+            self._schedule_save_locked()
+            return len(fresh)
+
+    def search(self, vec: "np.ndarray", allowed_ids: Optional[Set[str]] = None) -> Tuple[Optional[str], float, float]:
+        """
+        Возвращает (item_id, лучший score, лучший score среди других товаров).
+        allowed_ids — только товары, которые сейчас есть в каталоге.
+        """
+        vectors, item_ids = self._published
+        if vectors is None or not item_ids:
+            return None, 0.0, 0.0
+        scores = vectors @ vec
+        best_id, best, second = None, -1.0, -1.0
+        for pos in np.argsort(-scores):
+            iid = item_ids[pos]
+            if allowed_ids is not None and iid not in allowed_ids:
+                continue
+            score = float(scores[pos])
+            if best_id is None:
+                best_id, best = iid, score
+            elif iid != best_id:
+                second = score
+                break
+        return best_id, best, second
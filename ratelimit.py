@@ -0,0 +1,166 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+logger = logging.getLogger("magazin_sumok_bot")
+
+# -----------------------------
+# TOKEN BUCKET
+# -----------------------------
+class RateLimitedError(Exception):
+    """Запрос не выполнен: лимит исчерпан, повторить через retry_after секунд."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"лимит запросов, повтор через {retry_after:.0f} с")
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """capacity токенов, пополняется со скоростью rate токенов/сек."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, n: float = 1.0) -> bool:
+        self._refill()
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+
+    def give_back(self, n: float = 1.0) -> None:
+        self.tokens = min(self.capacity, self.tokens + n)
+
+    def retry_after(self, n: float = 1.0) -> float:
+        self._refill()
+        if self.tokens >= n or self.rate <= 0:
+            return 0.0
+        return (n - self.tokens) / self.rate
+
+class RateLimiter:
+    """
+    Лимит на ключ (пользователя) и общий лимит процесса.
+    acquire() -> 0.0, если запрос можно выполнить, иначе через сколько секунд повторить.
+    rate <= 0 отключает соответствующий лимит.
+    """
+
+    def __init__(
+        self,
+        per_key_rate: float,
+        per_key_burst: float,
+        global_rate: float = 0.0,
+        global_burst: float = 0.0,
+        max_keys: int = 10000,
+    ) -> None:
+        self.per_key_rate = per_key_rate
+        self.per_key_burst = max(1.0, per_key_burst)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+        self.global_bucket = TokenBucket(global_rate, max(1.0, global_burst)) if global_rate > 0 else None
+        self.limited = 0
+
+    def _bucket(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.per_key_rate, self.per_key_burst)
+            # давно не писавшие пользователи вытесняются (их ведро всё равно полное)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def acquire(self, key: Hashable) -> float:
+        bucket = self._bucket(key) if self.per_key_rate > 0 else None
+        if bucket is not None and not bucket.try_take():
+            self.limited += 1
+            return bucket.retry_after()
+        if self.global_bucket is not None and not self.global_bucket.try_take():
+            # отказ по общему лимиту не должен съедать личную квоту
+            if bucket is not None:
+                bucket.give_back()
+            self.limited += 1
+            return self.global_bucket.retry_after()
+        return 0.0
+
+# -----------------------------
+# ОБЩИЙ РЕЗУЛЬТАТ ДЛЯ ОДИНАКОВЫХ ЗАПРОСОВ В ПОЛЁТЕ
+# -----------------------------
+class SingleFlight:
+    """
+    do(key, factory): пока по ключу выполняется запрос, повторные вызовы
+    ждут его результат, а не запускают свой. Запрос идёт отдельной задачей:
+    отмена одного ожидающего не отменяет его для остальных.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, "asyncio.Task[Any]"] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def _done(self, key: Hashable, task: "asyncio.Task[Any]") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # ошибку получили ожидающие; без них — не шуметь в логе
+
+# -----------------------------
+# СКЛЕЙКА СООБЩЕНИЙ ПОЛЬЗОВАТЕЛЯ
+# -----------------------------
+class Coalescer:
+    """
+    Пока по ключу идёт обработка, новые элементы копятся и уходят одной пачкой.
+    submit() -> True: вызывающий — ведущий и должен запустить drain();
+    False: элемент добавлен в следующую пачку уже работающего drain().
+    """
+
+    def __init__(self) -> None:
+        self._pending: Dict[Hashable, List[Any]] = {}
+        self._running: Set[Hashable] = set()
+        self.merged = 0
+
+    def submit(self, key: Hashable, item: Any) -> bool:
+        self._pending.setdefault(key, []).append(item)
+        if key in self._running:
+            self.merged += 1
+            return False
+        self._running.add(key)
+        return True
+
+    async def drain(self, key: Hashable, run_batch: Callable[[List[Any]], Awaitable[None]]) -> None:
+        try:
+            while True:
+                batch = self._pending.pop(key, None)
+                if not batch:
+                    break
+                try:
+                    await run_batch(batch)
+                except Exception as e:
+                    logger.exception("Ошибка обработки пачки сообщений (%s): %s", len(batch), e)
+        finally:
+            self._running.discard(key)
+            self._pending.pop(key, None)
+
+    def pending(self, key: Hashable) -> Optional[List[Any]]:
+        return self._pending.get(key)
@@ -0,0 +1,330 @@
+import os
+import json
+import asyncio
+import logging
+import tempfile
+import threading
+import queue
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("magazin_sumok_bot")
+
+# -----------------------------
+# УТИЛИТЫ: JSON (каталог/заказы)
+# -----------------------------
+def load_json(path: str, default: Any) -> Any:
+    try:
+        if not os.path.exists(path):
+            return default
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.exception("Ошибка чтения JSON %s: %s", path, e)
+        return default
+
+# mkstemp создаёт файл с правами 0600 — после os.replace они достались бы каталогу/заказам
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def _target_mode(path: str) -> int:
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except OSError:
+        return 0o644 & ~_UMASK
+
+def save_json(path: str, data: Any) -> bool:
+    # Атомарно: пишем во временный файл рядом, fsync, затем os.replace.
+    # При падении на диске остаётся либо старая, либо новая версия целиком.
+    # False — запись не удалась (ошибка уже в логе), на диске прежняя версия.
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, _target_mode(path))
+        os.replace(tmp_path, path)
+        tmp_path = None
+        return True
+    except Exception as e:
+        logger.exception("Ошибка записи JSON %s: %s", path, e)
+        return False
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+# -----------------------------
+# ОТЛОЖЕННАЯ ЗАПИСЬ JSON (склейка серий изменений)
+# -----------------------------
+class JsonWriter:
+    """
+    Асинхронный писатель с отдельной очередью на каждый путь.
+    Серия schedule() в пределах delay секунд превращается в одну запись
+    последней версии данных; сама запись идёт в потоке (save_json).
+    """
+
+    def __init__(self, delay: float = 0.5) -> None:
+        self.delay = delay
+        self._pending: Dict[str, Tuple[Any, Optional[Callable[[], None]]]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._flush_now: Optional[asyncio.Event] = None
+        self.writes = 0
+
+    def schedule(self, path: str, data: Any, on_written: Optional[Callable[[], None]] = None) -> None:
+        # data после передачи менять нельзя: пишется как есть, позже
+        self._pending[path] = (data, on_written)
+        task = self._tasks.get(path)
+        if task is None or task.done():
+            self._tasks[path] = asyncio.get_running_loop().create_task(self._flush_later(path))
+
+    async def _flush_later(self, path: str) -> None:
+        if self._flush_now is None:
+            self._flush_now = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._flush_now.wait(), timeout=self.delay)
+        except asyncio.TimeoutError:
+            pass
+        written = await self._write(path)
+        if not written and self._flush_now.is_set():
+            # flush() при остановке не должен крутиться на сломанном диске
+            logger.error("JSON %s не записан: изменения остались только в памяти", path)
+            return
+        # пока писали, могли прийти новые изменения (или не удалась запись)
+        if path in self._pending:
+            self._tasks[path] = asyncio.get_running_loop().create_task(self._flush_later(path))
+
+    async def _write(self, path: str) -> bool:
+        item = self._pending.pop(path, None)
+        if item is None:
+            return True
+        data, on_written = item
+        if not await asyncio.to_thread(save_json, path, data):
+            # не записалось: повторим через delay, если к тому времени нет более свежей версии
+            self._pending.setdefault(path, item)
+            return False
+        self.writes += 1
+        if on_written is not None:
+            on_written()
+        return True
+
+    def has_pending(self, path: str) -> bool:
+        task = self._tasks.get(path)
+        return path in self._pending or (task is not None and not task.done())
+
+    async def flush(self) -> None:
+        """Дописать всё немедленно (например, при остановке бота)."""
+        if self._flush_now is None:
+            self._flush_now = asyncio.Event()
+        self._flush_now.set()
+        try:
+            while any(not t.done() for t in self._tasks.values()):
+                await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        finally:
+            self._flush_now.clear()
+
+# -----------------------------
+# ЖУРНАЛ ЗАКАЗОВ (append-only JSONL)
+# -----------------------------
+class OrderJournal:
+    """
+    Заказы дописываются в конец файла по одной JSON-строке (O(1) на заказ).
+    fsync делается пачками: каждые fsync_every записей или не позже
+    fsync_interval секунд после первой несинхронизированной записи.
+    """
+
+    def __init__(self, path: str, fsync_every: int = 16, fsync_interval: float = 1.0) -> None:
+        self.path = path
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._pending = 0
+        self._timer: Optional[threading.Timer] = None
+
+    def _ensure_open(self) -> int:
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+            # после падения посреди записи последняя строка может быть недописана:
+            # начинаем с новой строки, чтобы не склеить её со следующим заказом
+            size = os.fstat(self._fd).st_size
+            if size and os.pread(self._fd, 1, size - 1) != b"\n":
+                os.write(self._fd, b"\n")
+        return self._fd
+
+    def append(self, order: Dict[str, Any]) -> None:
+        line = (json.dumps(order, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            fd = self._ensure_open()
+            # O_APPEND + одна запись на строку: параллельные заказы не перетирают друг друга
+            view = memoryview(line)
+            while view:
+                n = os.write(fd, view)
+                view = view[n:]
+            self._pending += 1
+            if self._pending >= self.fsync_every:
+                self._sync_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.fsync_interval, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _sync_locked(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._fd is not None and self._pending:
+            os.fsync(self._fd)
+        self._pending = 0
+
+    def sync(self) -> None:
+        with self._lock:
+            self._sync_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            self._sync_locked()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def read_all(self) -> List[Dict[str, Any]]:
+        orders: List[Dict[str, Any]] = []
+        if not os.path.exists(self.path):
+            return orders
+        with open(self.path, "r", encoding="utf-8") as f:
+            for lineno, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    orders.append(json.loads(line))
+                except Exception:
+                    # недописанная строка после падения — пропускаем
+                    logger.warning("Пропущена битая строка %s в %s", lineno, self.path)
+        return orders
+
+    def import_legacy(self, json_path: str) -> int:
+        """Одноразовый перенос заказов из старого orders.json в пустой журнал."""
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            return 0
+        legacy = load_json(json_path, {"orders": []}).get("orders", [])
+        for order in legacy:
+            self.append(order)
+        self.sync()
+        if legacy:
+            logger.info("Перенесено %s заказов из %s в %s", len(legacy), json_path, self.path)
+        return len(legacy)
+
+    def export(self, json_path: str) -> int:
+        """Компактный экспорт в прежний формат {"orders": [...]}."""
+        self.sync()
+        orders = self.read_all()
+        save_json(json_path, {"orders": orders})
+        return len(orders)
+
+# -----------------------------
+# ЛОГ ОБРАЩЕНИЙ (JSONL, фоновая запись пачками, ротация)
+# -----------------------------
+class InteractionLog:
+    """
+    Одна JSON-строка на обращение клиента. write() только кладёт запись
+    в очередь; фоновый поток пишет пачками (до batch_size строк или раз в
+    flush_interval секунд) и ротирует файл по размеру: path -> path.1 -> … -> path.N.
+    Если диск не успевает и очередь переполнена, записи отбрасываются (dropped).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 50 * 1024 * 1024,
+        backups: int = 5,
+        flush_interval: float = 1.0,
+        batch_size: int = 500,
+        max_queue: int = 10000,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="interaction-log", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            if first is None:
+                stop = True
+            else:
+                batch.append(first)
+            # всё, что уже накопилось, — одной записью
+            while len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            if batch:
+                self._write_batch(batch)
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        data = "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in batch).encode("utf-8")
+        try:
+            self._rotate_if_needed(len(data))
+            with open(self.path, "ab") as f:
+                f.write(data)
+            self.written += len(batch)
+        except Exception as e:
+            logger.exception("Ошибка записи лога обращений %s: %s", self.path, e)
+
+    def _rotate_if_needed(self, incoming: int) -> None:
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if not self.max_bytes or size + incoming <= self.max_bytes or not size:
+            return
+        for i in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.unlink(self.path)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Дописать очередь и остановить поток (при остановке бота)."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+        self._thread = None
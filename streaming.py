@@ -0,0 +1,99 @@
+import time
+import asyncio
+import logging
+from typing import Optional
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger("magazin_sumok_bot")
+
+TELEGRAM_TEXT_LIMIT = 4096
+
+# -----------------------------
+# ПОТОКОВЫЙ ОТВЕТ: одно сообщение, которое дописывается правками
+# -----------------------------
+class StreamingReply:
+    """
+    Первый кусок текста отправляется сразу (reply_text или правка placeholder),
+    дальше сообщение редактируется не чаще, чем раз в min_interval секунд —
+    чтобы уложиться в лимиты Telegram на editMessageText.
+    Промежуточные правки при RetryAfter пропускаются, финальная — повторяется
+    (до final_attempts раз), а если так и не прошла — ответ уходит новым сообщением.
+    """
+
+    def __init__(
+        self,
+        source: Message,
+        min_interval: float = 1.0,
+        placeholder: Optional[Message] = None,
+        final_attempts: int = 3,
+    ) -> None:
+        self.source = source
+        self.min_interval = min_interval
+        self.final_attempts = max(1, final_attempts)
+        self.message = placeholder
+        self.text = ""
+        self._shown = ""
+        self._last_edit = 0.0
+        self.first_chunk_at: Optional[float] = None
+        self._started = time.perf_counter()
+
+    @property
+    def time_to_first_chunk(self) -> Optional[float]:
+        if self.first_chunk_at is None:
+            return None
+        return self.first_chunk_at - self._started
+
+    async def append(self, chunk: str) -> None:
+        if not chunk:
+            return
+        self.text += chunk
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.perf_counter()
+            await self._show()
+            return
+        if time.monotonic() - self._last_edit >= self.min_interval:
+            await self._show()
+
+    async def finish(self, fallback: str = "") -> str:
+        """Финальная правка; если модель ничего не вернула — показываем fallback."""
+        if not self.text.strip():
+            self.text = fallback
+        text = self.text.strip()[:TELEGRAM_TEXT_LIMIT]
+        for attempt in range(self.final_attempts):
+            try:
+                await self._show(final=True)
+                break
+            except RetryAfter as e:
+                logger.warning(
+                    "Telegram просит подождать %s с перед финальной правкой (попытка %s)", e.retry_after, attempt + 1
+                )
+                await asyncio.sleep(float(e.retry_after))
+        if text and self._shown != text:
+            # правка так и не прошла — клиент не должен остаться с обрезанным ответом
+            await self.source.reply_text(text)
+            self._shown = text
+        return self.text
+
+    async def _show(self, final: bool = False) -> None:
+        text = self.text.strip()[:TELEGRAM_TEXT_LIMIT]
+        if not text or text == self._shown:
+            return
+        self._last_edit = time.monotonic()
+        try:
+            if self.message is None:
+                self.message = await self.source.reply_text(text)
+            else:
+                await self.message.edit_text(text)
+            self._shown = text
+        except RetryAfter as e:
+            if final:
+                raise
+            # упёрлись в лимит — пропускаем промежуточную правку, финальная догонит
+            logger.warning("Telegram просит подождать %s с перед правкой", e.retry_after)
+            self._last_edit = time.monotonic() + float(e.retry_after)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+            self._shown = text
@@ -0,0 +1,203 @@
+import io
+import time
+import logging
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from storage import load_json, save_json, JsonWriter
+
+try:
+    from PIL import Image
+except ImportError:  # без Pillow кэш работает только по file_unique_id
+    Image = None
+
+logger = logging.getLogger("magazin_sumok_bot")
+
+VisionResult = Tuple[Optional[str], float, str]
+
+# -----------------------------
+# ПЕРЦЕПТИВНЫЙ ХЭШ (dHash, 64 бита)
+# -----------------------------
+def dhash(image_bytes: bytes, size: int = 8) -> Optional[int]:
+    """
+    dHash: сравнение соседних пикселей уменьшенной ч/б картинки.
+    Устойчив к пережатию, ресайзу и мелким правкам (скриншоты, пересылки).
+    """
+    if Image is None or not image_bytes:
+        return None
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img.draft("L", (size * 4, size * 4))  # JPEG: декодируем сразу в малом размере
+            small = img.convert("L").resize((size + 1, size), Image.BILINEAR)
+            px = small.tobytes()
+    except Exception as e:
+        logger.warning("Не удалось посчитать dHash: %s", e)
+        return None
+    h = 0
+    for row in range(size):
+        base = row * (size + 1)
+        for col in range(size):
+            h = (h << 1) | (px[base + col] > px[base + col + 1])
+    return h
+
+# -----------------------------
+# КЭШ РЕЗУЛЬТАТОВ РАСПОЗНАВАНИЯ
+# -----------------------------
+class VisionCache:
+    """
+    Кэш ответов match_bag_with_openai: (match_id, confidence, reason).
+    Ключи — Telegram file_unique_id и dHash картинки (с допуском max_distance бит).
+    LRU на max_entries записей + TTL; при смене версии каталога кэш сбрасывается.
+    Близкие хэши ищутся по корзинам: 64 бита режутся на max_distance + 1 кусков,
+    и у хэшей на расстоянии <= max_distance хотя бы один кусок совпадает целиком.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 5000,
+        ttl: float = 7 * 24 * 3600,
+        max_distance: int = 4,
+        writer: Optional[JsonWriter] = None,
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.writer = writer
+        self.catalog_version: Optional[str] = None
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        parts = min(64, max_distance + 1) if max_distance > 0 else 0
+        bounds = [64 * i // parts for i in range(parts + 1)] if parts else []
+        self._spans = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(bounds, bounds[1:])]
+        self._buckets: List[Dict[int, Set[int]]] = [{} for _ in self._spans]
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self) -> None:
+        data = load_json(self.path, {})
+        self.catalog_version = data.get("catalog_version")
+        now = time.time()
+        for key, entry in data.get("entries", []):
+            if now - entry.get("ts", 0) < self.ttl:
+                self._set(key, entry)
+
+    # ---- ключи и корзины хэшей ----
+    def _index(self, h: int, add: bool) -> None:
+        for bucket, (shift, mask) in zip(self._buckets, self._spans):
+            part = (h >> shift) & mask
+            if add:
+                bucket.setdefault(part, set()).add(h)
+            else:
+                hashes = bucket.get(part)
+                if hashes is not None:
+                    hashes.discard(h)
+                    if not hashes:
+                        del bucket[part]
+
+    def _set(self, key: str, entry: Dict[str, Any]) -> None:
+        if key not in self._entries and key.startswith("h:"):
+            self._index(int(key[2:], 16), add=True)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+
+    def _forget(self, key: str) -> None:
+        if key.startswith("h:"):
+            self._index(int(key[2:], 16), add=False)
+
+    def _nearest(self, image_hash: int) -> Optional[str]:
+        best, best_dist = None, self.max_distance + 1
+        for bucket, (shift, mask) in zip(self._buckets, self._spans):
+            for h in bucket.get((image_hash >> shift) & mask, ()):
+                dist = (h ^ image_hash).bit_count()
+                if dist < best_dist:
+                    best, best_dist = h, dist
+        return None if best is None else f"h:{best:016x}"
+
+    def _persist(self) -> None:
+        data = {"catalog_version": self.catalog_version, "entries": list(self._entries.items())}
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            save_json(self.path, data)
+            return
+        if self.writer is not None:
+            self.writer.schedule(self.path, data)
+        else:
+            save_json(self.path, data)
+
+    def _check_version(self, version: str) -> None:
+        if self.catalog_version != version:
+            if self._entries:
+                logger.info("Каталог изменился — кэш распознавания сброшен (%s записей)", len(self._entries))
+            self.clear()
+            self.catalog_version = version
+
+    def clear(self) -> None:
+        self._entries.clear()
+        for bucket in self._buckets:
+            bucket.clear()
+
+    def _get(self, key: str) -> Optional[VisionResult]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.get("ts", 0) >= self.ttl:
+            del self._entries[key]
+            self._forget(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry.get("match_id"), float(entry.get("confidence", 0.0)), entry.get("reason", "")
+
+    def get(
+        self,
+        version: str,
+        file_unique_id: Optional[str] = None,
+        image_hash: Optional[int] = None,
+        count_miss: bool = True,
+    ) -> Optional[VisionResult]:
+        """
+        count_miss=False — промах не считать: фото ещё проверят по другому ключу
+        (hits/misses — по одному на фото, а не на каждый вызов).
+        """
+        self._check_version(version)
+        result = None
+        if file_unique_id:
+            result = self._get(f"u:{file_unique_id}")
+        if result is None and image_hash is not None:
+            result = self._get(f"h:{image_hash:016x}")
+            if result is None and self._spans:
+                # ближайший по Хэммингу среди хэшей с совпадающим куском
+                key = self._nearest(image_hash)
+                if key is not None:
+                    result = self._get(key)
+        if result is not None:
+            self.hits += 1
+        elif count_miss:
+            self.misses += 1
+        return result
+
+    def put(
+        self,
+        version: str,
+        result: VisionResult,
+        file_unique_id: Optional[str] = None,
+        image_hash: Optional[int] = None,
+    ) -> None:
+        self._check_version(version)
+        match_id, confidence, reason = result
+        entry = {"match_id": match_id, "confidence": confidence, "reason": reason, "ts": time.time()}
+        keys = []
+        if file_unique_id:
+            keys.append(f"u:{file_unique_id}")
+        if image_hash is not None:
+            keys.append(f"h:{image_hash:016x}")
+        for key in keys:
+            self._set(key, entry)
+        while len(self._entries) > self.max_entries:
+            key, _ = self._entries.popitem(last=False)
+            self._forget(key)
+        if keys:
+            self._persist()